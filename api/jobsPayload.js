@@ -0,0 +1,106 @@
+// Compact job payloads negotiated by the client: field selection, truncated descriptions
+// (the full text is kept here and served on demand) and rows instead of repeated keys.
+
+// Fields of a scraped job, in the order used by the rows format.
+const JOB_FIELDS = ['postingTimestamp', 'jobTitle', 'jobHref', 'description', 'skills'];
+
+// Number of full descriptions kept for GET /jobs/description after their jobs were truncated.
+const DESCRIPTION_CACHE_SIZE = parseInt(process.env.DESCRIPTION_CACHE_SIZE || '10000');
+
+// jobHref -> full description, in least recently used order (a Map keeps insertion order).
+const descriptions = new Map();
+
+// msgpack encoding is used only when the optional "@msgpack/msgpack" package is installed.
+let msgpack = null;
+try {
+    msgpack = await import('@msgpack/msgpack');
+} catch {
+    console.log('Package "@msgpack/msgpack" is not installed, answering in JSON only');
+}
+
+const rememberDescription = (href, description) => {
+    descriptions.delete(href);
+    descriptions.set(href, description);
+    if (descriptions.size > DESCRIPTION_CACHE_SIZE) {
+        descriptions.delete(descriptions.keys().next().value);
+    }
+};
+
+// Full description of a job whose description was truncated, or undefined if it is not kept anymore.
+const getFullDescription = (href) => {
+    const description = descriptions.get(href);
+    if (description !== undefined) {
+        // Mark it as recently used.
+        rememberDescription(href, description);
+    }
+    return description;
+};
+
+// Reads the payload options from the query string:
+//   fields=a,b,c - only these job fields (unknown names are ignored; default: all)
+//   desc=<n>     - descriptions cut to about n characters, with a "truncated" flag
+//   format=rows  - {"fields": [...], "jobs": [[...], ...]} instead of an array of objects
+const parsePayloadOptions = (query) => {
+    const requested = query.fields ? String(query.fields).split(',') : JOB_FIELDS;
+    const fields = JOB_FIELDS.filter((field) => requested.includes(field));
+    const descLimit = parseInt(query.desc || '0');
+    if (descLimit > 0 && fields.includes('description')) {
+        fields.push('truncated');
+    }
+    return { fields, descLimit: descLimit > 0 ? descLimit : 0, rows: query.format === 'rows' };
+};
+
+// Cuts a description to about `limit` characters, preferably at a space, and marks the cut.
+const truncate = (description, limit) => {
+    if (typeof description !== 'string' || description.length <= limit) {
+        return description;
+    }
+    const space = description.lastIndexOf(' ', limit);
+    return description.slice(0, space > limit / 2 ? space : limit).trimEnd() + '…';
+};
+
+// Shapes one job for the client: a row (array of values) or an object with the selected fields.
+const shapeJob = (job, options) => {
+    const { fields, descLimit, rows } = options;
+    let truncated = false;
+    const values = fields.map((field) => {
+        if (field === 'truncated') {
+            return truncated;
+        }
+        if (field === 'description' && descLimit) {
+            const description = truncate(job.description, descLimit);
+            if (description !== job.description) {
+                truncated = true;
+                rememberDescription(job.jobHref, job.description);
+            }
+            return description;
+        }
+        return job[field];
+    });
+    if (rows) {
+        return values;
+    }
+    const shaped = {};
+    fields.forEach((field, i) => {
+        shaped[field] = values[i];
+    });
+    return shaped;
+};
+
+// Sends a whole page of jobs shaped by the options; msgpack if the client accepts it.
+const sendJobs = (req, res, jobs, options) => {
+    const shaped = jobs.map((job) => shapeJob(job, options));
+    const body = options.rows ? { fields: options.fields, jobs: shaped } : shaped;
+    if (msgpack && req.accepts(['application/json', 'application/msgpack']) === 'application/msgpack') {
+        return res
+            .status(200)
+            .type('application/msgpack')
+            .send(Buffer.from(msgpack.encode(body)));
+    }
+    return res.status(200).json(body);
+};
+
+// First NDJSON line of a streamed page in the rows format: the field names of the rows that follow.
+const streamHeader = (options) => (options.rows ? JSON.stringify({ fields: options.fields }) + '\n' : '');
+
+export { parsePayloadOptions, shapeJob, sendJobs, streamHeader, getFullDescription };
@@ -1,8 +1,39 @@
-import { main } from '../jobsScraper/upworkScraper.js';
+import {
+    main,
+    isReady,
+    getPoolMetrics,
+    getPrometheusMetrics,
+} from '../jobsScraper/upworkScraper.js';
 
-const upworkScraperController = (keywords, page) => {
-    // RUN UPWORK SCRAPER
-    return main(keywords, page);
+const upworkScraperController = (keywords, page, timings) => {
+    // RUN UPWORK SCRAPER, RECORDING THE DURATION OF EVERY STAGE IN timings
+    return main(keywords, page, undefined, timings);
 };
 
-export { upworkScraperController };
+const upworkScraperStreamController = (keywords, page, onJob) => {
+    // RUN UPWORK SCRAPER, HANDING OVER EVERY JOB AS SOON AS IT IS EXTRACTED
+    return main(keywords, page, onJob);
+};
+
+const upworkReadyController = () => {
+    // WHETHER SCRAPES CAN RUN (THE BROWSER IS UP OR LAUNCHED ON DEMAND)
+    return isReady();
+};
+
+const upworkMetricsController = () => {
+    // STATE OF THE SCRAPER PAGE POOL
+    return getPoolMetrics();
+};
+
+const upworkPrometheusController = () => {
+    // STAGE TIMINGS AND POOL GAUGES IN THE PROMETHEUS TEXT FORMAT
+    return getPrometheusMetrics();
+};
+
+export {
+    upworkScraperController,
+    upworkScraperStreamController,
+    upworkReadyController,
+    upworkMetricsController,
+    upworkPrometheusController,
+};
@@ -1,14 +1,89 @@
 import express from 'express';
 const router = express.Router();
-import { upworkScraperController } from './upWorkController.js';
+import {
+    upworkScraperController,
+    upworkScraperStreamController,
+    upworkReadyController,
+    upworkMetricsController,
+    upworkPrometheusController,
+} from './upWorkController.js';
+import { QueueFullError } from '../jobsScraper/pagePool.js';
+import { serverTiming } from '../jobsScraper/metrics.js';
+import {
+    parsePayloadOptions,
+    shapeJob,
+    sendJobs,
+    streamHeader,
+    getFullDescription,
+} from './jobsPayload.js';
 
-router.get('/jobs', async (req, res) => {
+// Streams jobs as NDJSON (one JSON object per line) while the page is being scraped.
+// If scraping fails after the response has started, a final {"error": ...} line is sent.
+// In the rows format the first line holds the field names and every job is an array.
+const streamJobs = async (req, res, keywords, page, options) => {
+    res.status(200).type('application/x-ndjson');
+    res.flushHeaders();
+    res.write(streamHeader(options));
     try {
-        const { q: keywords, page } = req.query;
+        await upworkScraperStreamController(keywords, page, (job) => {
+            res.write(JSON.stringify(shapeJob(job, options)) + '\n');
+        });
+    } catch (err) {
+        console.log('Error streaming jobs:', err);
+        res.write(JSON.stringify({ error: 'Error getting jobs' }) + '\n');
+    }
+    res.end();
+};
+
+// Liveness: the API answers. Readiness: scrapes can run (503 while the browser starts).
+router.get('/live', (req, res) => {
+    res.status(200).json({ status: 'ok' });
+});
+
+router.get('/ready', (req, res) => {
+    if (!upworkReadyController()) {
+        return res.status(503).json({ status: 'starting' });
+    }
+    res.status(200).json({ status: 'ready' });
+});
+
+router.get('/metrics', (req, res) => {
+    res.status(200).json(upworkMetricsController());
+});
 
-        const allJobs = await upworkScraperController(keywords, page);
-        res.status(200).json(allJobs);
+router.get('/metrics/prometheus', (req, res) => {
+    res.status(200).type('text/plain; version=0.0.4').send(upworkPrometheusController());
+});
+
+// Full description of a job sent truncated (see the desc option), kept for DESCRIPTION_CACHE_SIZE jobs.
+router.get('/jobs/description', (req, res) => {
+    const description = getFullDescription(String(req.query.href || ''));
+    if (description === undefined) {
+        return res.status(404).json({ msg: 'Description not available' });
+    }
+    res.status(200).json({ description });
+});
+
+router.get('/jobs', async (req, res) => {
+    const { q: keywords, page, stream } = req.query;
+    // Fields, description length and format asked for by the client.
+    const options = parsePayloadOptions(req.query);
+
+    if (stream === '1') {
+        return streamJobs(req, res, keywords, page, options);
+    }
+
+    try {
+        const timings = {};
+        const allJobs = await upworkScraperController(keywords, page, timings);
+        // Where the time went (queue wait, page load, extraction), read by the bot.
+        res.set('Server-Timing', serverTiming(timings));
+        sendJobs(req, res, allJobs, options);
     } catch (err) {
+        if (err instanceof QueueFullError) {
+            // Too many scrapes waiting: ask the client to come back later.
+            return res.status(503).json({ msg: err.message });
+        }
         console.log('Error getting jobs:', err);
         res.status(500).json({ msg: 'Error getting jobs' });
     }
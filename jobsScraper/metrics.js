@@ -0,0 +1,74 @@
+// Prometheus-style timing histograms of the scraper stages.
+
+// Histogram buckets in seconds, from a queue hit to a slow page load.
+const BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60];
+
+// stage -> { buckets: [...counts], sum, count }
+const stages = new Map();
+
+// Records one duration (ms) of a stage.
+const observe = (stage, ms) => {
+    let series = stages.get(stage);
+    if (!series) {
+        series = { buckets: BUCKETS.map(() => 0), sum: 0, count: 0 };
+        stages.set(stage, series);
+    }
+    const seconds = ms / 1000;
+    BUCKETS.forEach((bound, i) => {
+        if (seconds <= bound) {
+            series.buckets[i]++;
+        }
+    });
+    series.sum += seconds;
+    series.count++;
+};
+
+// Times fn() as one observation of the stage; also stores the duration (ms)
+// in timings[stage] when a per-request timings object is given.
+const timed = async (stage, timings, fn) => {
+    const started = performance.now();
+    try {
+        return await fn();
+    } finally {
+        const ms = performance.now() - started;
+        observe(stage, ms);
+        if (timings) {
+            timings[stage] = ms;
+        }
+    }
+};
+
+// Formats per-request timings as a Server-Timing header value.
+const serverTiming = (timings) =>
+    Object.entries(timings)
+        .map(([stage, ms]) => `${stage};dur=${ms.toFixed(1)}`)
+        .join(', ');
+
+// Renders the histograms, plus the given gauges and counters ({ name: value }),
+// in the Prometheus text format.
+const renderPrometheus = (gauges = {}, counters = {}) => {
+    const name = 'scraper_stage_seconds';
+    const lines = [
+        `# HELP ${name} Time spent in each stage of a scrape`,
+        `# TYPE ${name} histogram`,
+    ];
+    for (const [stage, series] of stages) {
+        BUCKETS.forEach((bound, i) => {
+            lines.push(`${name}_bucket{stage="${stage}",le="${bound}"} ${series.buckets[i]}`);
+        });
+        lines.push(`${name}_bucket{stage="${stage}",le="+Inf"} ${series.count}`);
+        lines.push(`${name}_sum{stage="${stage}"} ${series.sum.toFixed(6)}`);
+        lines.push(`${name}_count{stage="${stage}"} ${series.count}`);
+    }
+    for (const [gauge, value] of Object.entries(gauges)) {
+        lines.push(`# TYPE ${gauge} gauge`);
+        lines.push(`${gauge} ${value}`);
+    }
+    for (const [counter, value] of Object.entries(counters)) {
+        lines.push(`# TYPE ${counter} counter`);
+        lines.push(`${counter} ${value}`);
+    }
+    return lines.join('\n') + '\n';
+};
+
+export { observe, timed, serverTiming, renderPrometheus };
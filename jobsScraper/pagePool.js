@@ -0,0 +1,206 @@
+// Bounded pool of browser contexts and pages shared by all scrape requests.
+// Every slot owns its own browser context (separate cookies and cache) and one page,
+// so concurrent scrapes never navigate the same page.
+
+class QueueFullError extends Error {
+    constructor(maxQueue) {
+        super(`Scraper queue is full (${maxQueue} requests waiting)`);
+        this.name = 'QueueFullError';
+    }
+}
+
+class PagePool {
+    /**
+     * @param {object} options
+     * @param {number} options.size - maximum number of pages scraping at the same time
+     * @param {number} options.maxUses - a page is recycled after this many scrapes
+     * @param {number} options.maxQueue - maximum number of requests waiting for a page
+     * @param {(page) => Promise<void>} options.setupPage - prepares every new page
+     */
+    constructor({ size, maxUses, maxQueue, setupPage }) {
+        this.size = size;
+        this.maxUses = maxUses;
+        this.maxQueue = maxQueue;
+        this.setupPage = setupPage;
+
+        this.browser = null;
+        this.generation = 0; // bumped on every (re)start, old slots are dropped
+        this.idle = []; // slots ready to be used
+        this.waiting = []; // resolvers of requests waiting for a slot
+        this.total = 0; // slots created or being created
+
+        this.stats = {
+            served: 0,
+            created: 0,
+            recycled: 0,
+            crashed: 0,
+            rejected: 0,
+        };
+    }
+
+    // Uses the given browser from now on. Also called with a new browser after a crash:
+    // slots of the old browser are dropped and waiting requests get fresh ones.
+    start(browser) {
+        this.browser = browser;
+        this.dropSlots();
+        while (this.waiting.length > 0 && this.total < this.size) {
+            this.createSlotFor(this.waiting.shift());
+        }
+    }
+
+    // Drops the browser (e.g. it disconnected): requests wait in the queue until start()
+    // is called with a new one.
+    stop() {
+        this.browser = null;
+        this.dropSlots();
+    }
+
+    // Forgets the slots of the current browser: idle ones are closed now, busy ones when
+    // they are released.
+    dropSlots() {
+        this.generation++;
+        for (const slot of this.idle.splice(0)) {
+            this.destroySlot(slot);
+        }
+        this.total = 0;
+    }
+
+    // Rejects the requests waiting for a browser that could not be launched.
+    fail(err) {
+        if (this.browser !== null) {
+            return;
+        }
+        for (const waiter of this.waiting.splice(0)) {
+            waiter.reject(err);
+        }
+    }
+
+    // Creates a new slot for a waiting request.
+    createSlotFor(waiter) {
+        this.total++;
+        this.createSlot().then(waiter.resolve, (err) => {
+            this.total--;
+            waiter.reject(err);
+        });
+    }
+
+    async createSlot() {
+        const context = await this.browser.createBrowserContext();
+        try {
+            const page = await context.newPage();
+            await this.setupPage(page);
+            const slot = {
+                context,
+                page,
+                uses: 0,
+                crashed: false,
+                generation: this.generation,
+            };
+            // A crashed renderer makes the page unusable; recycle it on release.
+            page.on('error', () => {
+                slot.crashed = true;
+            });
+            this.stats.created++;
+            return slot;
+        } catch (err) {
+            await context.close().catch(() => {});
+            throw err;
+        }
+    }
+
+    async destroySlot(slot) {
+        try {
+            await slot.context.close();
+        } catch (err) {
+            console.log('Error closing browser context:', err.message);
+        }
+    }
+
+    // Returns a slot, creating one if the pool is not full, otherwise waits in the queue
+    // (also while there is no browser).
+    async acquire() {
+        if (this.idle.length > 0) {
+            return this.idle.pop();
+        }
+        if (this.browser !== null && this.total < this.size) {
+            this.total++;
+            try {
+                return await this.createSlot();
+            } catch (err) {
+                this.total--;
+                throw err;
+            }
+        }
+        if (this.waiting.length >= this.maxQueue) {
+            this.stats.rejected++;
+            throw new QueueFullError(this.maxQueue);
+        }
+        return new Promise((resolve, reject) => {
+            this.waiting.push({ resolve, reject });
+        });
+    }
+
+    // Gives the slot back; broken or worn out slots are replaced by a fresh one.
+    async release(slot, broken = false) {
+        slot.uses++;
+        this.stats.served++;
+
+        // The slot belongs to a browser that is gone (or was replaced): close its context,
+        // which would otherwise stay open as long as that browser runs.
+        if (slot.generation !== this.generation) {
+            await this.destroySlot(slot);
+            return;
+        }
+
+        if (broken || slot.crashed || slot.page.isClosed() || slot.uses >= this.maxUses) {
+            if (broken || slot.crashed) {
+                this.stats.crashed++;
+            } else {
+                this.stats.recycled++;
+            }
+            this.total--;
+            await this.destroySlot(slot);
+            // Someone is waiting: create the replacement for them right away.
+            const waiter = this.waiting.shift();
+            if (waiter) {
+                this.createSlotFor(waiter);
+            }
+            return;
+        }
+
+        const waiter = this.waiting.shift();
+        if (waiter) {
+            waiter.resolve(slot);
+        } else {
+            this.idle.push(slot);
+        }
+    }
+
+    // Runs fn(page) on a pooled page and releases it afterwards.
+    async use(fn) {
+        const slot = await this.acquire();
+        let broken = false;
+        try {
+            return await fn(slot.page);
+        } catch (err) {
+            // After a failed scrape the page state is unknown, so it is not reused.
+            broken = true;
+            throw err;
+        } finally {
+            await this.release(slot, broken);
+        }
+    }
+
+    metrics() {
+        return {
+            size: this.size,
+            pages: this.total,
+            busy: this.total - this.idle.length,
+            idle: this.idle.length,
+            queueDepth: this.waiting.length,
+            ...this.stats,
+        };
+    }
+}
+
+export { PagePool, QueueFullError };
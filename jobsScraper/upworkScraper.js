@@ -8,131 +8,349 @@
  * or consequences arising from the use of this code.
  */
 
-import puppeteer from 'puppeteer-extra';
-import StealthPlugin from 'puppeteer-extra-plugin-stealth';
+import { PagePool } from './pagePool.js';
+import { observe, timed, renderPrometheus } from './metrics.js';
 // import { rl, askQuestion } from './inputHelper.js';
 
-puppeteer.use(StealthPlugin());
+// When the browser is launched: 'eager' starts it in the background as soon as the API starts
+// (scrapes arriving before it is up wait for it), 'lazy' waits for the first scrape.
+// Either way the API listens at once instead of after the browser launch.
+const SCRAPER_LAUNCH = process.env.SCRAPER_LAUNCH || 'eager';
+// Fast-scrape mode: block heavy resources, stop waiting as soon as the job tiles are in the DOM,
+// and read jobs from the embedded page state when it is available.
+const FAST_MODE = (process.env.SCRAPER_FAST_MODE || '1') === '1';
+// Maximum time (ms) to wait for the job tiles in fast mode.
+const TILES_TIMEOUT = parseInt(process.env.SCRAPER_TILES_TIMEOUT || '15000');
 
-const browser = await puppeteer.launch(); // { headless: false }
-const page = await browser.newPage();
+// Resource types that are not needed to read the job tiles.
+const BLOCKED_RESOURCE_TYPES = new Set([
+    'image',
+    'media',
+    'font',
+    'stylesheet',
+    'texttrack',
+    'eventsource',
+    'websocket',
+    'manifest',
+]);
+// Analytics and ad hosts that only slow the page down.
+const BLOCKED_URL_PATTERN =
+    /google-analytics|googletagmanager|doubleclick|facebook\.net|hotjar|segment\.(io|com)|optimizely|bing\.com|linkedin\.com\/px|px\.ads|sentry/i;
 
-// Set a custom user agent so the site loads full content.
-await page.setUserAgent(
-    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) ' +
-        'AppleWebKit/537.36 (KHTML, like Gecko) ' +
-        'Chrome/91.0.4472.124 Safari/537.36'
-);
+const blockHeavyResources = async (page) => {
+    await page.setRequestInterception(true);
+    page.on('request', (request) => {
+        // Another handler (e.g. a plugin) may have handled the request already.
+        if (request.isInterceptResolutionHandled()) {
+            return;
+        }
+        if (
+            BLOCKED_RESOURCE_TYPES.has(request.resourceType()) ||
+            BLOCKED_URL_PATTERN.test(request.url())
+        ) {
+            request.abort();
+        } else {
+            request.continue();
+        }
+    });
+};
+
+// Pool of pages: how many scrapes run at once, how many scrapes a page serves
+// before it is recycled, and how many requests may wait for a free page.
+const pool = new PagePool({
+    size: parseInt(process.env.SCRAPER_POOL_SIZE || '3'),
+    maxUses: parseInt(process.env.SCRAPER_PAGE_MAX_USES || '50'),
+    maxQueue: parseInt(process.env.SCRAPER_MAX_QUEUE || '100'),
+    setupPage: async (page) => {
+        // Set a custom user agent so the site loads full content.
+        await page.setUserAgent(
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) ' +
+                'AppleWebKit/537.36 (KHTML, like Gecko) ' +
+                'Chrome/91.0.4472.124 Safari/537.36'
+        );
+        if (FAST_MODE) {
+            await blockHeavyResources(page);
+        }
+    },
+});
+
+// puppeteer and its stealth plugin are loaded with the first launch, they are slow to import.
+let puppeteerModule = null;
+const loadPuppeteer = async () => {
+    if (!puppeteerModule) {
+        const { default: puppeteer } = await import('puppeteer-extra');
+        const { default: StealthPlugin } = await import('puppeteer-extra-plugin-stealth');
+        puppeteer.use(StealthPlugin());
+        puppeteerModule = puppeteer;
+    }
+    return puppeteerModule;
+};
+
+// Delays (ms) between retries of a failed launch: doubled after every failure, up to the max.
+const LAUNCH_RETRY_MIN = 1000;
+const LAUNCH_RETRY_MAX = 60000;
+
+const launchBrowser = async () => {
+    const puppeteer = await loadPuppeteer();
+    const browser = await puppeteer.launch(); // { headless: false }
+    // Relaunch the browser if it crashes; the pool then recreates its pages.
+    browser.on('disconnected', () => {
+        if (pool.browser !== browser) {
+            return;
+        }
+        console.log('Browser disconnected, relaunching');
+        // Not ready until the new browser is up; scrapes wait for it in the pool queue.
+        pool.stop();
+        launching = null;
+        keepBrowserUp();
+    });
+    pool.start(browser);
+};
+
+// The current launch, shared by the scrapes waiting for it. A failed launch rejects the
+// scrapes waiting in the pool queue and is retried by the next call.
+let launching = null;
+let retryDelay = LAUNCH_RETRY_MIN;
+const ensureBrowser = () => {
+    if (!launching) {
+        launching = launchBrowser().then(
+            () => {
+                retryDelay = LAUNCH_RETRY_MIN;
+            },
+            (err) => {
+                launching = null;
+                pool.fail(err);
+                throw err;
+            }
+        );
+    }
+    return launching;
+};
+
+// Launches the browser, retrying with backoff until it is up. A scrape cannot be relied on
+// to retry: /ready keeps scrapes away while there is no browser.
+const keepBrowserUp = () => {
+    ensureBrowser().catch((err) => {
+        console.log(`Error launching browser, retrying in ${retryDelay} ms:`, err);
+        setTimeout(keepBrowserUp, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, LAUNCH_RETRY_MAX);
+    });
+};
+
+if (SCRAPER_LAUNCH === 'eager') {
+    keepBrowserUp();
+}
+
+// True once scrapes can run: the browser is up, or it is launched on demand.
+const isReady = () => pool.browser !== null || SCRAPER_LAUNCH === 'lazy';
 
 const baseUrl = 'https://www.upwork.com';
 
-const scrapeJobsPerPage = async (keywords, page, currentPage) => {
+// Extracts one job from an article[data-test="JobTile"] element.
+// Runs inside the browser, so it must be self-contained.
+function extractJobTile(job, baseUrl) {
+    // Inline helper to convert relative time to Unix timestamp (milliseconds)
+    function parseRelativeTime(relativeStr) {
+        const now = new Date().getTime();
+        const lowerStr = relativeStr.toLowerCase();
+        let diff = 0;
+        if (lowerStr.includes('minute')) {
+            const match = lowerStr.match(/(\d+)\s*minute/);
+            if (match) {
+                diff = parseInt(match[1]) * 60 * 1000;
+            }
+        } else if (lowerStr.includes('hour')) {
+            const match = lowerStr.match(/(\d+)\s*hour/);
+            if (match) {
+                diff = parseInt(match[1]) * 60 * 60 * 1000;
+            }
+        } else if (lowerStr.includes('day')) {
+            const match = lowerStr.match(/(\d+)\s*day/);
+            if (match) {
+                diff = parseInt(match[1]) * 24 * 60 * 60 * 1000;
+            } else if (lowerStr.includes('yesterday')) {
+                diff = 24 * 60 * 60 * 1000;
+            }
+        } else if (lowerStr.includes('week')) {
+            const match = lowerStr.match(/(\d+)\s*week/);
+            if (match) {
+                diff = parseInt(match[1]) * 7 * 24 * 60 * 60 * 1000;
+            }
+        } else if (lowerStr.includes('month')) {
+            const match = lowerStr.match(/(\d+)\s*month/);
+            if (match) {
+                diff = parseInt(match[1]) * 30 * 24 * 60 * 60 * 1000;
+            }
+        }
+        return now - diff;
+    }
+
+    // JOB HEADER
+    const jobHeader = job.querySelector('div.job-tile-header');
+    const postingSpans = jobHeader.querySelectorAll(
+        'small[data-test="job-pubilshed-date"] span'
+    );
+    const postingTime =
+        postingSpans.length >= 2 ? postingSpans[1].textContent.trim() : 'N/A';
+    const postingTimestamp =
+        postingTime !== 'N/A' ? parseRelativeTime(postingTime) : 'N/A';
+
+    const titleLinkElement = jobHeader.querySelector('h2.job-tile-title a');
+    const jobTitle = titleLinkElement
+        ? titleLinkElement.textContent.trim()
+        : 'No job title';
+    const jobHrefRelative = titleLinkElement
+        ? titleLinkElement.getAttribute('href')
+        : 'No relative link';
+
+    // JOB DETAILS
+    const jobDetails = job.querySelector('div[data-test="JobTileDetails"]');
+    const descriptionElement = jobDetails.querySelector('div.air3-line-clamp p');
+    const description = descriptionElement
+        ? descriptionElement.textContent.trim()
+        : 'No description';
+
+    const skillElements = jobDetails.querySelectorAll(
+        'div[data-test="TokenClamp JobAttrs"] button[data-test="token"] span'
+    );
+    const skills = Array.from(skillElements).map((el) => el.textContent.trim());
+
+    return {
+        postingTimestamp,
+        jobTitle,
+        jobHref:
+            jobHrefRelative !== 'No relative link'
+                ? baseUrl + jobHrefRelative
+                : jobHrefRelative,
+        description,
+        skills,
+    };
+}
+
+// Reads the jobs from the state the search page embeds for client-side hydration.
+// Runs inside the browser. Returns null when the state is missing or has an unexpected shape,
+// so the caller falls back to reading the DOM.
+function extractEmbeddedJobs(baseUrl) {
+    const state = window.__NUXT__ && window.__NUXT__.state;
+    const jobs =
+        state &&
+        ((state.jobsSearch && state.jobsSearch.jobs) ||
+            (state.feedSearch && state.feedSearch.jobs));
+    if (!Array.isArray(jobs) || jobs.length === 0) {
+        return null;
+    }
+
+    const result = [];
+    for (const job of jobs) {
+        if (!job || typeof job.title !== 'string' || !job.ciphertext) {
+            return null;
+        }
+        const published = Date.parse(job.publishedOn || job.createdOn || '');
+        result.push({
+            postingTimestamp: Number.isNaN(published) ? 'N/A' : published,
+            jobTitle: job.title.trim() || 'No job title',
+            jobHref: `${baseUrl}/jobs/${job.ciphertext}`,
+            description: (job.description || 'No description').trim(),
+            skills: (job.attrs || job.skills || [])
+                .map((skill) => (skill.prettyName || skill.name || '').trim())
+                .filter(Boolean),
+        });
+    }
+    return result;
+}
+
+// Markers of the search page Upwork shows when a query/page has no results.
+const EMPTY_RESULTS_SELECTOR =
+    '[data-test="empty-state"], [data-test="jobs-empty-state"], [data-test="UpCEmptyState"]';
+const EMPTY_RESULTS_TEXT = /there are no results that match your search|no jobs found/i;
+
+// Tells, inside the browser, whether the search page shows job tiles ('tiles'),
+// the "no results" state ('empty'), or neither yet (null).
+function searchPageState(emptySelector, emptyText) {
+    if (document.querySelector('article[data-test="JobTile"]')) {
+        return 'tiles';
+    }
+    if (
+        document.querySelector(emptySelector) ||
+        (document.body && new RegExp(emptyText, 'i').test(document.body.innerText))
+    ) {
+        return 'empty';
+    }
+    return null;
+}
+
+// Opens the search page. In fast mode only the document is awaited, then the job tiles
+// or the "no results" state. Returns false if the page has no results; throws if neither
+// shows up in time (slow, captcha or blocked page), so the failure is not taken for
+// an empty result and cached.
+const openSearchPage = async (page, url) => {
+    if (!FAST_MODE) {
+        await page.goto(url);
+        return true;
+    }
+    await page.goto(url, { waitUntil: 'domcontentloaded' });
+    const state = await page.waitForFunction(
+        searchPageState,
+        { timeout: TILES_TIMEOUT, polling: 100 },
+        EMPTY_RESULTS_SELECTOR,
+        EMPTY_RESULTS_TEXT.source
+    );
+    return (await state.jsonValue()) === 'tiles';
+};
+
+// onJob (optional) is called with every job as soon as it is extracted,
+// so the API can stream jobs to the client before the whole page is processed.
+// timings (optional) receives the duration (ms) of the "goto" and "evaluate" stages.
+const scrapeJobsPerPage = async (keywords, page, currentPage, onJob, timings) => {
     console.log(
         `Starting scraper with keywords "${keywords}" for page ${currentPage}`
     );
 
     let url = `${baseUrl}/nx/search/jobs/?nbs=1&proposals=0-4,5-9,10-14,15-19&q=${keywords}&page=${currentPage}`;
     console.log(url);
-    await page.goto(url);
-
-    const jobsPerPage = await page.evaluate((baseUrl) => {
-        // Inline helper to convert relative time to Unix timestamp (milliseconds)
-        function parseRelativeTime(relativeStr) {
-            const now = new Date().getTime();
-            const lowerStr = relativeStr.toLowerCase();
-            let diff = 0;
-            if (lowerStr.includes('minute')) {
-                const match = lowerStr.match(/(\d+)\s*minute/);
-                if (match) {
-                    diff = parseInt(match[1]) * 60 * 1000;
-                }
-            } else if (lowerStr.includes('hour')) {
-                const match = lowerStr.match(/(\d+)\s*hour/);
-                if (match) {
-                    diff = parseInt(match[1]) * 60 * 60 * 1000;
-                }
-            } else if (lowerStr.includes('day')) {
-                const match = lowerStr.match(/(\d+)\s*day/);
-                if (match) {
-                    diff = parseInt(match[1]) * 24 * 60 * 60 * 1000;
-                } else if (lowerStr.includes('yesterday')) {
-                    diff = 24 * 60 * 60 * 1000;
-                }
-            } else if (lowerStr.includes('week')) {
-                const match = lowerStr.match(/(\d+)\s*week/);
-                if (match) {
-                    diff = parseInt(match[1]) * 7 * 24 * 60 * 60 * 1000;
-                }
-            } else if (lowerStr.includes('month')) {
-                const match = lowerStr.match(/(\d+)\s*month/);
-                if (match) {
-                    diff = parseInt(match[1]) * 30 * 24 * 60 * 60 * 1000;
-                }
+    if (!(await timed('goto', timings, () => openSearchPage(page, url)))) {
+        return [];
+    }
+
+    return timed('evaluate', timings, () => extractJobs(page, onJob));
+};
+
+// Reads the jobs of the loaded search page.
+const extractJobs = async (page, onJob) => {
+    if (FAST_MODE) {
+        // Cheapest path: one evaluate returning the embedded state, no DOM walking.
+        const embeddedJobs = await page.evaluate(extractEmbeddedJobs, baseUrl);
+        if (embeddedJobs) {
+            if (onJob) {
+                embeddedJobs.forEach(onJob);
             }
-            return now - diff;
+            return embeddedJobs;
         }
+    }
 
-        const jobElements = document.querySelectorAll(
-            'article[data-test="JobTile"]'
+    const jobElements = await page.$$('article[data-test="JobTile"]');
+
+    if (!onJob) {
+        // Extract all job tiles at once.
+        return Promise.all(
+            jobElements.map((element) => element.evaluate(extractJobTile, baseUrl))
         );
-        return Array.from(jobElements).map((job) => {
-            // JOB HEADER
-            const jobHeader = job.querySelector('div.job-tile-header');
-            const postingSpans = jobHeader.querySelectorAll(
-                'small[data-test="job-pubilshed-date"] span'
-            );
-            const postingTime =
-                postingSpans.length >= 2
-                    ? postingSpans[1].textContent.trim()
-                    : 'N/A';
-            const postingTimestamp =
-                postingTime !== 'N/A' ? parseRelativeTime(postingTime) : 'N/A';
-
-            const titleLinkElement = jobHeader.querySelector(
-                'h2.job-tile-title a'
-            );
-            const jobTitle = titleLinkElement
-                ? titleLinkElement.textContent.trim()
-                : 'No job title';
-            const jobHrefRelative = titleLinkElement
-                ? titleLinkElement.getAttribute('href')
-                : 'No relative link';
-
-            // JOB DETAILS
-            const jobDetails = job.querySelector(
-                'div[data-test="JobTileDetails"]'
-            );
-            const descriptionElement = jobDetails.querySelector(
-                'div.air3-line-clamp p'
-            );
-            const description = descriptionElement
-                ? descriptionElement.textContent.trim()
-                : 'No description';
-
-            const skillElements = jobDetails.querySelectorAll(
-                'div[data-test="TokenClamp JobAttrs"] button[data-test="token"] span'
-            );
-            const skills = Array.from(skillElements).map((el) =>
-                el.textContent.trim()
-            );
-
-            return {
-                postingTimestamp,
-                jobTitle,
-                jobHref:
-                    jobHrefRelative !== 'No relative link'
-                        ? baseUrl + jobHrefRelative
-                        : jobHrefRelative,
-                description,
-                skills,
-            };
-        });
-    }, baseUrl);
+    }
+
+    // Extract job tiles one by one, in page order, handing each over as soon as it is ready.
+    const jobsPerPage = [];
+    for (const element of jobElements) {
+        const job = await element.evaluate(extractJobTile, baseUrl);
+        jobsPerPage.push(job);
+        onJob(job);
+    }
 
     return jobsPerPage;
 };
 
-const main = async (keywords, currentPage) => {
+// timings (optional) receives the duration (ms) of every stage of this scrape,
+// sent back to the client in the Server-Timing header.
+const main = async (keywords, currentPage, onJob, timings = {}) => {
     // const keywords = await askQuestion('Enter job keyword to search for: ');
 
     // commented when implemented API
@@ -142,7 +360,15 @@ const main = async (keywords, currentPage) => {
     // let currentPage = 1;
     let jobsOnPage = [];
     // do {
-    jobsOnPage = await scrapeJobsPerPage(keywords, page, currentPage);
+    const queuedAt = performance.now();
+    // The wait for the browser launch counts as queue time.
+    await ensureBrowser();
+    jobsOnPage = await pool.use((page) => {
+        // Time spent waiting for a free page of the pool.
+        timings.queue = performance.now() - queuedAt;
+        observe('queue', timings.queue);
+        return scrapeJobsPerPage(keywords, page, currentPage, onJob, timings);
+    });
     // console.log(`Jobs on page ${currentPage}:`, jobsOnPage);
     // if (jobsOnPage.length === 0)
     // break;
@@ -158,4 +384,28 @@ const main = async (keywords, currentPage) => {
     return allJobs;
 };
 
-export { main };
+// Current state of the page pool (pages, busy pages, queue depth, counters).
+const getPoolMetrics = () => pool.metrics();
+
+// Stage histograms, pool gauges and pool counters in the Prometheus text format.
+const getPrometheusMetrics = () => {
+    const metrics = pool.metrics();
+    const gauges = {
+        scraper_pool_size: metrics.size,
+        scraper_pool_pages: metrics.pages,
+        scraper_pool_busy: metrics.busy,
+        scraper_pool_idle: metrics.idle,
+        scraper_queue_depth: metrics.queueDepth,
+    };
+    // Cumulative since the scraper started.
+    const counters = {
+        scraper_pages_served_total: metrics.served,
+        scraper_pages_created_total: metrics.created,
+        scraper_pages_recycled_total: metrics.recycled,
+        scraper_pages_crashed_total: metrics.crashed,
+        scraper_requests_rejected_total: metrics.rejected,
+    };
+    return renderPrometheus(gauges, counters);
+};
+
+export { main, isReady, getPoolMetrics, getPrometheusMetrics };
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import html
+import os
+import time
+
+from telegram import Update  # type: ignore
+from telegram.ext import ContextTypes  # type: ignore
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from query_cache import normalize_query  # Same query normalization as the cache
+from scraper_service import fetch_jobs  # Entry point to the scrapers (with single-flight)
+from jobs_requests import (
+    render_job_chunks,  # Cached rendering of a job into HTML chunks
+    rank_jobs_for_profiles,  # Rank a batch of jobs for many skill profiles in one pass
+)
+from job_store import Job  # Compact job record
+from send_queue import outbound, BROADCAST  # Rate-limited queue for outbound Telegram requests
+from profiles import profile_store  # Skill profiles of the chats
+from job_matcher import Profile  # Skill profile (skills and excluded keywords)
+from sqlite_db import LazyConnection  # Lock-guarded SQLite connection opened on first use
+
+# SQLite file holding saved searches and the jobs already seen for each of them.
+ALERTS_DB_PATH = os.getenv("ALERTS_DB_PATH", "alerts.db")
+# How often (in seconds) saved searches are re-run.
+ALERTS_INTERVAL = float(os.getenv("ALERTS_INTERVAL", "600"))
+# Number of saved searches scraped at the same time during one run.
+ALERTS_CONCURRENCY = int(os.getenv("ALERTS_CONCURRENCY", "4"))
+# Maximum number of new jobs pushed per saved search and run.
+ALERTS_MAX_PER_RUN = int(os.getenv("ALERTS_MAX_PER_RUN", "5"))
+# Seen jobs are forgotten after this many seconds.
+ALERTS_SEEN_TTL = float(os.getenv("ALERTS_SEEN_TTL", str(30 * 24 * 3600)))
+# Maximum number of saved searches per chat.
+ALERTS_MAX_PER_CHAT = int(os.getenv("ALERTS_MAX_PER_CHAT", "10"))
+
+
+# Saved searches, and the links (hashed) already seen for each saved search group.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER NOT NULL,
+    site TEXT NOT NULL,
+    query TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, site, query)
+);
+CREATE INDEX IF NOT EXISTS subscriptions_group ON subscriptions(site, query);
+CREATE TABLE IF NOT EXISTS seen (
+    site TEXT NOT NULL,
+    query TEXT NOT NULL,
+    href_hash INTEGER NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (site, query, href_hash)
+) WITHOUT ROWID;
+"""
+
+
+def href_hash(href: str) -> int:
+    """64-bit signed hash of a job link, small enough for a SQLite INTEGER and a Python set."""
+    digest = hashlib.blake2b(href.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class AlertStore:
+    """
+    Saved searches and per-search seen-sets persisted in SQLite.
+
+    Identical searches of different chats share one group (site, normalized query),
+    so one scrape and one seen-set serve every subscriber of the group.
+    The seen-sets are loaded into memory (sets of 64-bit link hashes) on first use.
+    """
+
+    def __init__(self, path: str = ALERTS_DB_PATH) -> None:
+        self._sql = LazyConnection(path, _SCHEMA)
+        self._seen: dict[tuple[str, str], set[int]] = {}
+        self._pruned_at = 0.0
+
+    def subscribe(self, chat_id: int, site: str, query: str) -> bool:
+        """Save a search for the chat. Returns False if the chat reached ALERTS_MAX_PER_CHAT."""
+        with self._sql as db:
+            count = db.execute(
+                "SELECT COUNT(*) FROM subscriptions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()[0]
+            if count >= ALERTS_MAX_PER_CHAT:
+                return False
+            db.execute(
+                "INSERT OR IGNORE INTO subscriptions (chat_id, site, query, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (chat_id, site, normalize_query(query), time.time()),
+            )
+            db.commit()
+        return True
+
+    def unsubscribe(self, chat_id: int, site: str, query: str) -> None:
+        """Remove a saved search of the chat."""
+        with self._sql as db:
+            db.execute(
+                "DELETE FROM subscriptions WHERE chat_id = ? AND site = ? AND query = ?",
+                (chat_id, site, query),
+            )
+            db.commit()
+
+    def list_for_chat(self, chat_id: int) -> list[tuple[str, str]]:
+        """Return the (site, query) saved searches of the chat, oldest first."""
+        with self._sql as db:
+            return db.execute(
+                "SELECT site, query FROM subscriptions WHERE chat_id = ? ORDER BY created_at",
+                (chat_id,),
+            ).fetchall()
+
+    def groups(self) -> dict[tuple[str, str], list[int]]:
+        """Return every saved search group (site, query) with the chats subscribed to it."""
+        groups: dict[tuple[str, str], list[int]] = {}
+        with self._sql as db:
+            for site, query, chat_id in db.execute(
+                "SELECT site, query, chat_id FROM subscriptions"
+            ):
+                groups.setdefault((site, query), []).append(chat_id)
+        return groups
+
+    def new_jobs(
+        self, site: str, query: str, jobs: list[Job], limit: int = ALERTS_MAX_PER_RUN
+    ) -> list[Job]:
+        """
+        Return at most `limit` jobs not seen before for the group and remember them as seen.
+        Further new jobs stay unseen and are returned by the next runs while the site still
+        lists them. The first run of a group only records the current jobs, so subscribers
+        are not flooded with everything that was already posted.
+        Every seen job still listed has its seen time refreshed, so it is not forgotten
+        (and alerted again) after ALERTS_SEEN_TTL.
+        """
+        group = (site, query)
+        with self._sql as db:
+            seen = self._seen.get(group)
+            first_run = False
+            if seen is None:
+                seen = self._seen[group] = {
+                    row[0]
+                    for row in db.execute(
+                        "SELECT href_hash FROM seen WHERE site = ? AND query = ?", group
+                    )
+                }
+                first_run = not seen
+
+            fresh = []
+            listed = []
+            for job in jobs:
+                job_hash = href_hash(job.href)
+                if job_hash not in seen:
+                    if not first_run and len(fresh) >= limit:
+                        # Left unseen: returned by the next run.
+                        continue
+                    seen.add(job_hash)
+                    fresh.append(job)
+                listed.append(job_hash)
+
+            now = time.time()
+            db.executemany(
+                "INSERT OR REPLACE INTO seen (site, query, href_hash, seen_at) VALUES (?, ?, ?, ?)",
+                [(site, query, job_hash, now) for job_hash in listed],
+            )
+            db.commit()
+        return [] if first_run else fresh
+
+    def prune_seen(self, interval: float = 24 * 3600) -> None:
+        """
+        Forget seen jobs older than ALERTS_SEEN_TTL and groups nobody subscribes to.
+        Does nothing if the last prune happened less than `interval` seconds ago.
+        """
+        with self._sql as db:
+            if time.time() - self._pruned_at < interval:
+                return
+            self._pruned_at = time.time()
+            db.execute(
+                "DELETE FROM seen WHERE seen_at < ?", (time.time() - ALERTS_SEEN_TTL,)
+            )
+            db.execute(
+                "DELETE FROM seen WHERE NOT EXISTS (SELECT 1 FROM subscriptions"
+                " WHERE subscriptions.site = seen.site AND subscriptions.query = seen.query)"
+            )
+            db.commit()
+            # The in-memory seen-sets are reloaded from the pruned table on next use.
+            self._seen.clear()
+
+
+# The alert store shared by the commands and the scheduler.
+alert_store = AlertStore()
+
+
+async def _run_group(
+    context: ContextTypes.DEFAULT_TYPE,
+    site: str,
+    query: str,
+    chat_ids: list[int],
+    limit: asyncio.Semaphore,
+) -> None:
+    """Scrape one saved search group once and push its new jobs to every subscriber."""
+    async with limit:
+        try:
+            # Skip the cache: alerts need the current state of the site.
+            response = await fetch_jobs(site, query, 1, fresh=True)
+        except Exception as e:
+            logger.error("Alert scrape of %s '%s' failed: %s", site, query, e)
+            return
+    if not response:
+        return
+
+    fresh = await asyncio.to_thread(
+        alert_store.new_jobs, site, query, response["data"]
+    )
+    if not fresh:
+        return
+    logger.info(
+        "%s new jobs for %s '%s', notifying %s chats",
+        len(fresh),
+        site,
+        query,
+        len(chat_ids),
+    )
+
+    # Every subscriber gets the new jobs ranked by its own profile: the jobs are scanned
+    # once for the keywords of all of them, then each profile is scored with bitmasks.
+    profiles = await asyncio.to_thread(profile_store.get_many, chat_ids)
+    per_chat = rank_jobs_for_profiles(
+        fresh, {chat_id: profiles.get(chat_id, Profile()) for chat_id in chat_ids}
+    )
+
+    # Queue every message in the broadcast lane; the dispatcher keeps the per-chat order
+    # and the rate limits, while interactive replies go first. Jobs are queued by rank,
+    # so that the best job of every chat goes out before the second one of any chat.
+    sends = [
+        outbound.send_message(chat_id, chunk, BROADCAST, parse_mode="HTML")
+        for rank in range(ALERTS_MAX_PER_RUN)
+        for chat_id in chat_ids
+        if rank < len(per_chat[chat_id])
+        for chunk in render_job_chunks(per_chat[chat_id][rank], site)
+    ]
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    if failed:
+        logger.error("%s alert messages for %s '%s' failed", failed, site, query)
+
+
+async def run_alerts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Job queue callback re-running every saved search.
+    Registered with run_repeating in main.py; one scrape serves all subscribers of a group.
+    """
+    groups = await asyncio.to_thread(alert_store.groups)
+    limit = asyncio.Semaphore(ALERTS_CONCURRENCY)
+    await asyncio.gather(
+        *(
+            _run_group(context, site, query, chat_ids, limit)
+            for (site, query), chat_ids in groups.items()
+        )
+    )
+    await asyncio.to_thread(alert_store.prune_seen)
+
+
+async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handler for the /alert command.
+    Saves the last query on the selected site as an alert for this chat.
+    """
+    chat_id = update.effective_chat.id
+    query_text = context.user_data.get("query")
+    site = context.user_data.get("selected_site")
+    if not query_text or not site:
+        await outbound.call(
+            chat_id,
+            lambda: update.message.reply_text(
+                "Select a job site and search for something first, then type /alert to save it."
+            ),
+        )
+        return
+
+    if not await asyncio.to_thread(alert_store.subscribe, chat_id, site, query_text):
+        await outbound.call(
+            chat_id,
+            lambda: update.message.reply_text(
+                f"You can have at most {ALERTS_MAX_PER_CHAT} alerts. Remove one with /unalert."
+            ),
+        )
+        return
+    await outbound.call(
+        chat_id,
+        lambda: update.message.reply_html(
+            f"🔔 Alert saved: <b>{html.escape(normalize_query(query_text))}</b>"
+            f" on <i>{html.escape(site)}</i>.\n"
+            "You will get new jobs as soon as they are posted."
+        ),
+    )
+
+
+async def alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handler for the /alerts command.
+    Lists the saved alerts of this chat.
+    """
+    chat_id = update.effective_chat.id
+    saved = await asyncio.to_thread(alert_store.list_for_chat, chat_id)
+    if not saved:
+        text = "You have no alerts. Use /alert after a search."
+    else:
+        lines = [f"{i}. {query} ({site})" for i, (site, query) in enumerate(saved, start=1)]
+        text = "Your alerts:\n" + "\n".join(lines) + "\n\nRemove one with /unalert <number>."
+    await outbound.call(chat_id, lambda: update.message.reply_text(text))
+
+
+async def unalert_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handler for the /unalert command.
+    Removes the alert with the given number (as shown by /alerts).
+    """
+    chat_id = update.effective_chat.id
+    saved = await asyncio.to_thread(alert_store.list_for_chat, chat_id)
+    try:
+        number = int(context.args[0])
+        if number < 1:
+            raise ValueError
+        site, query = saved[number - 1]
+    except (IndexError, ValueError):
+        text = "Usage: /unalert <number> (see /alerts)."
+    else:
+        await asyncio.to_thread(alert_store.unsubscribe, chat_id, site, query)
+        text = f"Alert removed: {query} ({site})."
+    await outbound.call(chat_id, lambda: update.message.reply_text(text))
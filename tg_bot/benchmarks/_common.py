@@ -0,0 +1,77 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Importing this module first makes the bot modules (in the parent directory) importable
+when a script is run from any directory.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def make_parser(doc: str) -> argparse.ArgumentParser:
+    """Return the argument parser of a script, described by the first line of its docstring."""
+    return argparse.ArgumentParser(description=doc.splitlines()[1])
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return the pct-th percentile (0-100) of the values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def best_time(func, repeat: int) -> float:
+    """Return the best time of func() out of `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+# --- Minimal HTTP/1.1 server of the fake APIs --------------------------------------------
+
+
+async def serve_http(handler, port: int) -> asyncio.AbstractServer:
+    """
+    Start a keep-alive HTTP/1.1 server calling `await handler(method, target, body, writer)`,
+    which must write a complete response (see respond()).
+    """
+
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                body = await reader.readexactly(length) if length else b""
+                await handler(method, target, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(on_connection, "127.0.0.1", port)
+
+
+async def respond(writer, body: bytes, content_type: str = "application/json") -> None:
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: " + content_type.encode()
+        + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+    )
+    await writer.drain()
@@ -0,0 +1,100 @@
+"""
+Query latency benchmark of the persistent job index.
+
+Fills a temporary SQLite job index with synthetic jobs and measures the latency
+of full-text and skill searches, as served in local-first mode.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_job_index.py --jobs 100000
+"""
+
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from _common import make_parser, percentile  # Also makes the bot modules importable
+
+from job_index import JobIndex
+from job_store import Job
+
+SKILLS = [
+    "Python", "JavaScript", "TypeScript", "React", "Django", "Flask", "SQL", "AWS",
+    "Docker", "Kubernetes", "Scraping", "Node.js", "Go", "Rust", "Figma", "SEO",
+]
+WORDS = (
+    "build maintain api backend frontend dashboard scraper bot integration data pipeline "
+    "mobile app website store automation migration optimization testing design analytics"
+).split()
+
+
+def make_jobs(count: int, rng: random.Random) -> list[Job]:
+    """Return `count` synthetic job records."""
+    now = int(time.time() * 1000)
+    return [
+        Job.from_dict(0, {
+            "postingTimestamp": now - rng.randint(0, 30 * 24 * 3600 * 1000),
+            "jobTitle": f"{rng.choice(SKILLS)} developer to {rng.choice(WORDS)} {rng.choice(WORDS)}",
+            "jobHref": f"https://www.upwork.com/jobs/~{i:012d}",
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(40, 120))),
+            "skills": rng.sample(SKILLS, 4),
+        })
+        for i in range(count)
+    ]
+
+
+def report(name: str, latencies: list[float]) -> None:
+    ms = [latency * 1000 for latency in latencies]
+    print(
+        f"{name:<14} p50 {percentile(ms, 50):7.2f} ms   p95 {percentile(ms, 95):7.2f} ms"
+        f"   p99 {percentile(ms, 99):7.2f} ms   mean {statistics.mean(ms):7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = make_parser(__doc__)
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = JobIndex(os.path.join(tmp, "jobs.db"))
+
+        jobs = make_jobs(args.jobs, rng)
+        started = time.perf_counter()
+        for i in range(0, len(jobs), 1000):
+            index.add_jobs("upwork", jobs[i : i + 1000])
+        elapsed = time.perf_counter() - started
+        print(f"indexed {len(index)} jobs in {elapsed:.1f}s ({len(jobs) / elapsed:.0f} jobs/s)")
+
+        queries = [
+            " ".join(rng.sample([s.lower() for s in SKILLS] + WORDS, rng.randint(1, 3)))
+            for _ in range(args.queries)
+        ]
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, "upwork", limit=10)
+            latencies.append(time.perf_counter() - started)
+        report("full text", latencies)
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, "upwork", limit=10, offset=40)
+            latencies.append(time.perf_counter() - started)
+        report("full text p5", latencies)
+
+        latencies = []
+        for _ in range(args.queries):
+            skill = rng.choice(SKILLS)
+            started = time.perf_counter()
+            index.search_by_skill(skill, limit=10)
+            latencies.append(time.perf_counter() - started)
+        report("skill", latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Offline load test of the bot handlers.
+
+Runs the handlers of keyboard_handle.py in-process against two local fakes:
+- a fake Telegram Bot API server (the bot is pointed at it with base_url), which answers
+  every method and tells the simulated chats when their reply arrived;
+- a fake jobs API with configurable latency, page size and payload size
+  (plain JSON and NDJSON streaming, objects or the compact rows format, like the Node API).
+
+Thousands of simulated chats select a site, search, then press "Next" and "Previous"
+(crossing page boundaries). The report shows p50/p95/p99 latency per action
+(from the update being queued to the reply reaching the Bot API), throughput, calls
+made to both fakes, and the RSS of the process. No network access is needed.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_load.py --chats 2000 --api-latency 300
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs, urlsplit
+
+from _common import (  # Also makes the bot modules importable
+    make_parser,
+    percentile,
+    respond,
+    serve_http,
+)
+
+SKILLS = ["Python", "JavaScript", "React", "Django", "SQL", "AWS", "Docker", "Scraping"]
+WORDS = "python react django scraper bot api dashboard data shopify wordpress".split()
+
+
+# --- Fake jobs API -----------------------------------------------------------------------
+
+
+class FakeJobsApi:
+    """Serves /api/upwork/jobs like the Node API, after a configurable scrape latency."""
+
+    def __init__(self, args) -> None:
+        self.args = args
+        self.requests = Counter()
+
+    def make_jobs(self, query: str, page: int) -> list[dict]:
+        if page > self.args.pages:
+            return []
+        rng = random.Random(f"{query}|{page}")
+        return [
+            {
+                "postingTimestamp": 1_700_000_000_000 - page * 10_000 - i,
+                "jobTitle": f"{rng.choice(SKILLS)} developer for {query}",
+                "jobHref": f"https://www.upwork.com/jobs/~{abs(hash(query)) % 10**8:08d}{page:03d}{i:03d}",
+                "description": "x" * self.args.description_size,
+                "skills": rng.sample(SKILLS, 4),
+            }
+            for i in range(self.args.jobs_per_page)
+        ]
+
+    @staticmethod
+    def shape(jobs: list[dict], params: dict) -> tuple[list[str] | None, list]:
+        """Apply the payload options of the request (fields, desc, format=rows) like the API."""
+        fields = [f for f in params.get("fields", "").split(",") if f] or list(jobs[0] if jobs else [])
+        limit = int(params.get("desc", "0"))
+        if limit:
+            fields.append("truncated")
+        shaped = []
+        for job in jobs:
+            job = {field: job.get(field) for field in fields}
+            if limit:
+                job["truncated"] = len(job["description"]) > limit
+                job["description"] = job["description"][:limit]
+            shaped.append(list(job.values()) if params.get("format") == "rows" else job)
+        return (fields if params.get("format") == "rows" else None), shaped
+
+    async def handle(self, method, target, body, writer) -> None:
+        url = urlsplit(target)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.endswith("/description"):
+            self.requests["description"] += 1
+            await respond(writer, json.dumps({"description": "x" * self.args.description_size}).encode())
+            return
+        page = int(params.get("page", "1"))
+        fields, jobs = self.shape(self.make_jobs(params.get("q", ""), page), params)
+        latency = self.args.api_latency / 1000 * random.uniform(0.5, 1.5)
+
+        if params.get("stream") != "1":
+            self.requests["json"] += 1
+            await asyncio.sleep(latency)
+            payload = {"fields": fields, "jobs": jobs} if fields else jobs
+            body = json.dumps(payload).encode()
+            self.requests["bytes"] += len(body)
+            await respond(writer, body)
+            return
+
+        # NDJSON: chunked response, one job per line, spaced like tiles being extracted.
+        self.requests["stream"] += 1
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        await asyncio.sleep(latency)
+        lines = [{"fields": fields}] if fields else []
+        for job in lines + jobs:
+            line = json.dumps(job).encode() + b"\n"
+            self.requests["bytes"] += len(line)
+            writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(self.args.api_job_interval / 1000)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+# --- Fake Telegram Bot API ---------------------------------------------------------------
+
+
+class FakeBotApi:
+    """
+    Answers Bot API methods at /bot<token>/<method>, and hands every call to the
+    simulated chat it is addressed to.
+    """
+
+    def __init__(self) -> None:
+        self.calls = Counter()
+        self.inboxes: dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._message_ids = itertools.count(1)
+
+    async def handle(self, method, target, body, writer) -> None:
+        name = target.rsplit("/", 1)[-1]
+        self.calls[name] += 1
+        params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        chat_id = int(params.get("chat_id", 0))
+
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif name in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            message_id = int(params.get("message_id") or next(self._message_ids))
+            result = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+            self.inboxes[chat_id].put_nowait((name, params, message_id))
+        else:
+            result = True
+        await respond(writer, json.dumps({"ok": True, "result": result}).encode())
+
+
+# --- Simulated chats ---------------------------------------------------------------------
+
+
+class Chat:
+    """One simulated user in a private chat, driving the bot through updates."""
+
+    update_ids = itertools.count(1)
+
+    def __init__(self, chat_id: int, application, bot_api: FakeBotApi, args, stats) -> None:
+        self.chat_id = chat_id
+        self.application = application
+        self.inbox = bot_api.inboxes[chat_id]
+        self.args = args
+        self.stats = stats
+        self.keyboard_message_id = 0
+        self.buttons: dict[str, str] = {}
+
+    def _user(self) -> dict:
+        return {"id": self.chat_id, "is_bot": False, "first_name": "User"}
+
+    def _chat(self) -> dict:
+        return {"id": self.chat_id, "type": "private"}
+
+    def _message_update(self, text: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": 0,
+                "date": int(time.time()),
+                "chat": self._chat(),
+                "from": self._user(),
+                "text": text,
+            },
+        }
+
+    def _callback_update(self, data: str) -> dict:
+        return {
+            "update_id": next(self.update_ids),
+            "callback_query": {
+                "id": str(next(self.update_ids)),
+                "from": self._user(),
+                "chat_instance": str(self.chat_id),
+                "data": data,
+                "message": {
+                    "message_id": self.keyboard_message_id,
+                    "date": int(time.time()),
+                    "chat": self._chat(),
+                    "text": "",
+                },
+            },
+        }
+
+    async def _act(self, action: str, update: dict, done) -> bool:
+        """Queue the update and wait for the call matching done(method, params)."""
+        from telegram import Update  # type: ignore
+
+        started = time.perf_counter()
+        await self.application.update_queue.put(Update.de_json(update, self.application.bot))
+        deadline = started + self.args.timeout
+        try:
+            while True:
+                method, params, message_id = await asyncio.wait_for(
+                    self.inbox.get(), deadline - time.perf_counter()
+                )
+                if "reply_markup" in params:
+                    markup = json.loads(params["reply_markup"])
+                    self.buttons = {
+                        button["text"]: button["callback_data"]
+                        for row in markup.get("inline_keyboard", [])
+                        for button in row
+                    }
+                    self.keyboard_message_id = message_id
+                if done(method, params):
+                    break
+        except asyncio.TimeoutError:
+            self.stats["errors"][action] += 1
+            return False
+        self.stats["latency"][action].append(time.perf_counter() - started)
+        return True
+
+    async def run(self) -> None:
+        await asyncio.sleep(random.uniform(0, self.args.ramp))
+        if not await self._act(
+            "site",
+            self._callback_update("site: UpWork"),
+            lambda method, params: method == "sendMessage",
+        ):
+            return
+
+        for _ in range(self.args.searches):
+            query = random.choice(self.queries)
+            if not await self._act(
+                "query",
+                self._message_update(query),
+                lambda method, params: method == "sendMessage" and "reply_markup" in params,
+            ):
+                return
+            for button, presses in (("Next", self.args.next_presses), ("Previous", self.args.prev_presses)):
+                for _ in range(presses):
+                    if button not in self.buttons:
+                        break
+                    await asyncio.sleep(random.uniform(0, 2 * self.args.think) / 1000)
+                    if not await self._act(
+                        button.lower(),
+                        self._callback_update(self.buttons[button]),
+                        lambda method, params: method.startswith("editMessage"),
+                    ):
+                        return
+
+
+# --- Driver ------------------------------------------------------------------------------
+
+
+def rss_mb() -> tuple[float, float]:
+    """Current and peak resident set size in MB (Linux)."""
+    with open("/proc/self/statm") as f:
+        current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return current / 2**20, peak / 2**20
+
+
+async def run(args) -> None:
+    # Imported after the environment is set up: the bot modules read it at import time.
+    from telegram.ext import Application, CallbackQueryHandler, MessageHandler, filters  # type: ignore
+
+    import jobs_requests
+    from http_client import start_http_client, close_http_client
+    from keyboard_handle import (
+        handle_jobs_sites_keyboard_callback,
+        handle_jobs_positions_keyboard_callback,
+        message_query_handler,
+    )
+    from query_cache import query_cache
+    from send_queue import outbound
+    from update_processor import ChatOrderedUpdateProcessor
+
+    jobs_api = FakeJobsApi(args)
+    bot_api = FakeBotApi()
+    api_server = await serve_http(jobs_api.handle, args.api_port)
+    bot_server = await serve_http(bot_api.handle, args.bot_port)
+    jobs_requests.jobs_api_url["upwork"] = f"http://127.0.0.1:{args.api_port}/api/upwork/jobs"
+
+    # The same handlers as main.py, with the Bot API pointed at the fake server.
+    application = (
+        Application.builder()
+        .token("123456:BENCH")
+        .base_url(f"http://127.0.0.1:{args.bot_port}/bot")
+        .updater(None)
+        .concurrent_updates(ChatOrderedUpdateProcessor())
+        .connection_pool_size(args.bot_connections)
+        .pool_timeout(args.timeout)
+        .build()
+    )
+    application.add_handler(
+        CallbackQueryHandler(
+            handle_jobs_sites_keyboard_callback, pattern=r"^(site:|page:|page_info)"
+        )
+    )
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_query_handler))
+    application.add_handler(
+        CallbackQueryHandler(handle_jobs_positions_keyboard_callback, pattern=r"^\d+$")
+    )
+
+    stats = {"latency": defaultdict(list), "errors": Counter()}
+    Chat.queries = [
+        f"{random.choice(WORDS)} {random.choice(WORDS)} {i}" for i in range(args.distinct_queries)
+    ]
+    async with application:
+        await start_http_client()
+        outbound.start(application.bot)
+        await application.start()
+
+        chats = [
+            Chat(1_000_000 + i, application, bot_api, args, stats) for i in range(args.chats)
+        ]
+        started = time.perf_counter()
+        await asyncio.gather(*(chat.run() for chat in chats))
+        elapsed = time.perf_counter() - started
+
+        await application.stop()
+        await outbound.stop()
+        await close_http_client()
+    api_server.close()
+    bot_server.close()
+
+    actions = sum(len(latencies) for latencies in stats["latency"].values())
+    print(f"{args.chats} chats, {actions} actions in {elapsed:.1f}s ({actions / elapsed:.0f} actions/s)")
+    for action in ("site", "query", "next", "previous"):
+        latencies = [latency * 1000 for latency in stats["latency"][action]]
+        if not latencies:
+            continue
+        print(
+            f"{action:<9} n={len(latencies):<7} p50 {percentile(latencies, 50):8.1f} ms"
+            f"   p95 {percentile(latencies, 95):8.1f} ms   p99 {percentile(latencies, 99):8.1f} ms"
+            f"   mean {statistics.mean(latencies):8.1f} ms   errors {stats['errors'][action]}"
+        )
+    cache = query_cache.stats()
+    print(
+        f"jobs API requests: {dict(jobs_api.requests)}   query cache hit ratio: {cache['hit_ratio']:.2f}"
+    )
+    print(f"Bot API calls: {dict(bot_api.calls)}")
+    current, peak = rss_mb()
+    print(f"RSS {current:.0f} MB (peak {peak:.0f} MB)")
+
+
+def main() -> None:
+    parser = make_parser(__doc__)
+    parser.add_argument("--chats", type=int, default=1000, help="simulated concurrent chats")
+    parser.add_argument("--searches", type=int, default=2, help="searches per chat")
+    parser.add_argument("--next-presses", type=int, default=15, help='"Next" presses per search')
+    parser.add_argument("--prev-presses", type=int, default=8, help='"Previous" presses per search')
+    parser.add_argument("--think", type=float, default=200, help="mean pause between presses (ms)")
+    parser.add_argument("--ramp", type=float, default=5, help="chats start within this many seconds")
+    parser.add_argument("--distinct-queries", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=300, help="fake scrape latency (ms)")
+    parser.add_argument("--api-job-interval", type=float, default=5, help="ms between streamed jobs")
+    parser.add_argument("--jobs-per-page", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=5, help="pages with results per query")
+    parser.add_argument("--description-size", type=int, default=1500, help="characters")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for a reply")
+    parser.add_argument("--bot-connections", type=int, default=256)
+    parser.add_argument("--api-port", type=int, default=9761)
+    parser.add_argument("--bot-port", type=int, default=9762)
+    parser.add_argument(
+        "--telegram-limits",
+        action="store_true",
+        help="keep Telegram's send rate limits (by default they are lifted to measure the bot itself)",
+    )
+    args = parser.parse_args()
+
+    # Offline and self-contained: no job index, session store or metrics endpoint.
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        {"JOB_INDEX_PATH": "", "SESSION_DB_PATH": "", "METRICS_PORT": "0", "HTTP2_ENABLED": "0"}
+    )
+    os.environ.setdefault("ALERTS_DB_PATH", os.path.join(tmp, "alerts.db"))
+    os.environ.setdefault("PROFILES_DB_PATH", os.path.join(tmp, "profiles.db"))
+    if not args.telegram_limits:
+        os.environ.update(
+            {
+                "SEND_GLOBAL_RATE": "100000",
+                "SEND_GLOBAL_BURST": "100000",
+                "SEND_CHAT_RATE": "1000",
+                "SEND_CHAT_BURST": "1000",
+                "SEND_WORKERS": "64",
+            }
+        )
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
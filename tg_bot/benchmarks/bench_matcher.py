@@ -0,0 +1,124 @@
+"""
+Cost of ranking new jobs for the subscribers of a saved search.
+
+Compares, for a batch of jobs and many subscribers with their own skill profiles:
+- the naive way: one regular expression per keyword of every subscriber, searched in
+  the skills, title and description of every job;
+- the batch matcher (jobs_requests.rank_jobs_for_profiles): one word-level Aho-Corasick
+  automaton for the keywords of all subscribers, one scan per job, then bitmask scoring
+  per subscriber.
+Both rankings are checked to be the same.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_matcher.py --jobs 50 --subscribers 1000
+"""
+
+import random
+import re
+import sys
+
+from _common import best_time, make_parser  # Also makes the bot modules importable
+
+from job_store import Job
+from job_matcher import (
+    DESCRIPTION_WEIGHT,
+    SKILLS_WEIGHT,
+    TITLE_WEIGHT,
+    Profile,
+    get_matcher,
+)
+from jobs_requests import rank_jobs_for_profiles
+
+SKILLS = [
+    "python", "javascript", "react", "django", "sql", "aws", "docker", "scraping",
+    "node.js", "typescript", "flask", "fastapi", "postgresql", "selenium", "vue", "golang",
+    "machine learning", "data analysis", "web scraping", "rest api", "shopify", "wordpress",
+]
+WORDS = "build a bot with api dashboard data for our team the app needs fixes and new features".split()
+
+
+def make_jobs(count: int, description_words: int, rng: random.Random) -> list[Job]:
+    """Return a batch of fake jobs mentioning some of the skills."""
+    jobs = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=description_words)
+        for skill in rng.sample(SKILLS, 4):
+            words.insert(rng.randrange(len(words)), skill)
+        jobs.append(
+            Job.from_dict(
+                i + 1,
+                {
+                    "postingTimestamp": i,
+                    "jobTitle": f"{rng.choice(SKILLS).title()} developer needed",
+                    "jobHref": f"https://www.upwork.com/jobs/~{i:08d}",
+                    "description": " ".join(words),
+                    "skills": [skill.title() for skill in rng.sample(SKILLS, 4)],
+                },
+            )
+        )
+    return jobs
+
+
+def make_profiles(count: int, skills: int, rng: random.Random) -> dict[int, Profile]:
+    """Return a profile per subscriber: a few skills and sometimes an excluded keyword."""
+    profiles = {}
+    for chat_id in range(count):
+        keywords = rng.sample(SKILLS, skills + 1)
+        excluded = (keywords.pop(),) if rng.random() < 0.3 else ()
+        profiles[chat_id] = Profile(tuple(keywords), excluded)
+    return profiles
+
+
+def naive_rank(jobs: list[Job], profiles: dict[int, Profile]) -> dict[int, list[Job]]:
+    """Rank the jobs for every subscriber with one regular expression per keyword."""
+    result = {}
+    for chat_id, profile in profiles.items():
+        skills = [re.compile(rf"(?<!\w){re.escape(k)}(?![\w+#])") for k in profile.skills]
+        excluded = [re.compile(rf"(?<!\w){re.escape(k)}(?![\w+#])") for k in profile.excluded]
+        scored = []
+        for i, job in enumerate(jobs):
+            fields = (" , ".join(job.skills).lower(), job.title.lower(), job.description.lower())
+            if any(pattern.search(field) for pattern in excluded for field in fields):
+                continue
+            score = sum(
+                weight * bool(pattern.search(field))
+                for pattern in skills
+                for weight, field in zip((SKILLS_WEIGHT, TITLE_WEIGHT, DESCRIPTION_WEIGHT), fields)
+            )
+            scored.append((-score, i))
+        scored.sort()
+        result[chat_id] = [jobs[i] for _, i in scored]
+    return result
+
+
+def main() -> None:
+    parser = make_parser(__doc__)
+    parser.add_argument("--jobs", type=int, default=50, help="new jobs of the saved search")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--skills", type=int, default=5, help="skills per profile")
+    parser.add_argument("--description-words", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per variant, the best is kept")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    jobs = make_jobs(args.jobs, args.description_words, rng)
+    profiles = make_profiles(args.subscribers, args.skills, rng)
+
+    if naive_rank(jobs, profiles) != rank_jobs_for_profiles(jobs, profiles):
+        sys.exit("The rankings differ")
+
+    naive = best_time(lambda: naive_rank(jobs, profiles), args.repeat)
+    # Compiling the automaton is cached between runs, as in the bot; clear it to time it too.
+    batch = best_time(lambda: rank_jobs_for_profiles(jobs, profiles), args.repeat)
+    cold = best_time(
+        lambda: (get_matcher.cache_clear(), rank_jobs_for_profiles(jobs, profiles)), args.repeat
+    )
+
+    print(f"{args.jobs} jobs x {args.subscribers} subscribers ({args.skills} skills each)")
+    print(f"naive regex per keyword     {naive * 1e3:9.1f} ms")
+    print(f"batch matcher (compiled)    {batch * 1e3:9.1f} ms   x{naive / batch:.1f}")
+    print(f"batch matcher (with build)  {cold * 1e3:9.1f} ms   x{naive / cold:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Wire size and decode cost of the jobs API payloads.
+
+Compares, per results page, the bytes sent and the CPU time the bot spends decoding them
+into job records (see payload_codec.decode_jobs), for:
+- the array of full job objects the API sent before the compact format;
+- the compact rows format ({"fields": [...], "jobs": [[...], ...]}) with full descriptions;
+- the rows format with descriptions cut to --desc-limit characters;
+each decoded with json, and with orjson / msgpack when they are installed.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_payload.py --pages 200 --jobs-per-page 50
+"""
+
+import json
+import random
+
+from _common import best_time, make_parser  # Also makes the bot modules importable
+
+from job_store import JOB_FIELDS, JobStore
+from payload_codec import decode_jobs
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+SKILLS = ["Python", "JavaScript", "React", "Django", "SQL", "AWS", "Docker", "Scraping"]
+WORDS = "python react django scraper bot api dashboard data shopify wordpress".split()
+
+
+def make_page(page_no: int, jobs_per_page: int, description_words: int) -> list[dict]:
+    """Return one page of fake jobs as scraped by the API."""
+    rng = random.Random(page_no)
+    return [
+        {
+            "postingTimestamp": 1_700_000_000_000 + page_no * 1000 + i,
+            "jobTitle": f"Senior {rng.choice(SKILLS)} developer needed",
+            "jobHref": f"https://www.upwork.com/jobs/~{page_no:05d}{i:03d}",
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(description_words // 2, description_words))),
+            "skills": rng.sample(SKILLS, 4),
+        }
+        for i in range(jobs_per_page)
+    ]
+
+
+def truncate(description: str, limit: int) -> str:
+    # Same cut as api/jobsPayload.js: at a space when there is one in the second half.
+    if len(description) <= limit:
+        return description
+    space = description.rfind(" ", 0, limit + 1)
+    return description[: space if space > limit / 2 else limit].rstrip() + "…"
+
+
+def rows_payload(jobs: list[dict], desc_limit: int) -> dict:
+    """The compact payload the API sends for format=rows (and desc=desc_limit if > 0)."""
+    # The bot asks for every field but "truncated", which the API adds when it cuts descriptions.
+    fields = list(JOB_FIELDS[:-1]) + (["truncated"] if desc_limit else [])
+    rows = []
+    for job in jobs:
+        row = [job[field] for field in JOB_FIELDS[:-1]]
+        if desc_limit:
+            description = truncate(job["description"], desc_limit)
+            row[JOB_FIELDS.index("description")] = description
+            row.append(description != job["description"])
+        rows.append(row)
+    return {"fields": fields, "jobs": rows}
+
+
+def time_per_page(func, bodies: list[bytes], repeat: int) -> float:
+    """Return the best time per page of func(body) over all bodies, out of `repeat` runs."""
+
+    def run() -> None:
+        for body in bodies:
+            func(body)
+
+    return best_time(run, repeat) / len(bodies)
+
+
+def measure(name: str, bodies: list[bytes], loads, repeat: int) -> None:
+    """Print the bytes and decode times per page of one payload variant."""
+    decode = time_per_page(lambda body: decode_jobs(loads(body)), bodies, repeat)
+
+    # Decoding followed by adding the records to a job store, as a session does.
+    store = JobStore()
+    records = time_per_page(
+        lambda body: store.release(store.acquire(decode_jobs(loads(body)))), bodies, repeat
+    )
+
+    size = sum(len(body) for body in bodies) / len(bodies)
+    print(
+        f"{name:<28} {size / 1024:8.1f} KB/page   decode to records {decode * 1e6:6.0f} us/page"
+        f"   + job store {records * 1e6:6.0f} us/page"
+    )
+
+
+def main() -> None:
+    parser = make_parser(__doc__)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--jobs-per-page", type=int, default=50)
+    parser.add_argument("--description-words", type=int, default=400)
+    parser.add_argument("--desc-limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10, help="runs per variant, the best is kept")
+    args = parser.parse_args()
+
+    pages = [make_page(n, args.jobs_per_page, args.description_words) for n in range(args.pages)]
+    variants = {
+        "objects": pages,
+        "rows": [rows_payload(jobs, 0) for jobs in pages],
+        f"rows, desc={args.desc_limit}": [rows_payload(jobs, args.desc_limit) for jobs in pages],
+    }
+
+    for name, payloads in variants.items():
+        # The API answers with JSON.stringify, i.e. without spaces.
+        bodies = [json.dumps(p, separators=(",", ":"), ensure_ascii=False).encode() for p in payloads]
+        measure(f"{name} json", bodies, json.loads, args.repeat)
+        if orjson is not None:
+            measure(f"{name} orjson", bodies, orjson.loads, args.repeat)
+        if msgpack is not None and name != "objects":
+            packed = [msgpack.packb(p) for p in payloads]
+            measure(f"{name} msgpack", packed, msgpack.unpackb, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
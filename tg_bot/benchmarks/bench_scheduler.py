@@ -0,0 +1,153 @@
+"""
+Tail latency and outage behaviour of the scrape scheduler (scrape_scheduler.py).
+
+Drives scrape_scheduler.ScrapeScheduler with a simulated source, in two phases:
+- degraded: most scrapes take about --latency seconds, a fraction (--slow-ratio) take
+  --slow-factor times longer; compares the p50/p95/p99 latency of plain calls with
+  scheduled calls (hedged after the p95), and the extra requests the hedges cost;
+- outage: the source stops answering for --outage seconds; compares how long the
+  requests made during the outage wait with a fixed timeout and with the circuit breaker.
+Time runs --time-scale times faster than the simulated seconds, so the whole run takes
+a few seconds; reported latencies are in simulated seconds.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_scheduler.py --requests 2000 --slow-ratio 0.04
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from _common import make_parser, percentile  # Also makes the bot modules importable
+
+
+def percentiles(samples: list[float]) -> str:
+    return (
+        f"p50 {percentile(samples, 50):6.2f}s   p95 {percentile(samples, 95):6.2f}s"
+        f"   p99 {percentile(samples, 99):6.2f}s"
+    )
+
+
+async def degraded(args, scale: float) -> None:
+    from scrape_scheduler import ScrapeScheduler
+
+    rng = random.Random(0)
+    calls = 0
+
+    async def scrape():
+        nonlocal calls
+        calls += 1
+        latency = args.latency * rng.uniform(0.7, 1.3)
+        if rng.random() < args.slow_ratio:
+            latency *= args.slow_factor
+        await asyncio.sleep(latency * scale)
+        return latency
+
+    async def measure(run) -> tuple[list[float], int]:
+        # --concurrency requests at a time, like users searching at the same time.
+        latencies = []
+        timeouts = 0
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one():
+            nonlocal timeouts
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    await run()
+                except TimeoutError:
+                    timeouts += 1
+                latencies.append((time.perf_counter() - started) / scale)
+
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        return latencies, timeouts
+
+    plain, _ = await measure(scrape)
+    plain_calls, calls = calls, 0
+    scheduler = ScrapeScheduler()
+    hedged, timeouts = await measure(lambda: scheduler.run("source", scrape))
+    print(f"degraded source ({args.slow_ratio:.0%} of scrapes {args.slow_factor:g}x slower)")
+    print(f"  plain calls      {percentiles(plain)}   requests {plain_calls}")
+    print(
+        f"  scheduled        {percentiles(hedged)}   requests {calls}"
+        f" (+{calls / plain_calls - 1:.1%}, {scheduler.hedge_wins} hedges won, {timeouts} timed out)"
+    )
+
+
+async def outage(args, scale: float) -> None:
+    import scrape_scheduler
+    from scrape_scheduler import CircuitOpenError, ScrapeScheduler
+
+    down_until = 0.0
+
+    async def scrape():
+        if time.perf_counter() < down_until:
+            # The source hangs until the timeout.
+            await asyncio.sleep(3600)
+        await asyncio.sleep(args.latency * scale)
+
+    async def measure(scheduler) -> tuple[list[float], int]:
+        # One request every --interval simulated seconds during the outage.
+        nonlocal down_until
+        down_until = time.perf_counter() + args.outage * scale
+        waits = []
+        rejected = 0
+
+        async def one():
+            nonlocal rejected
+            started = time.perf_counter()
+            try:
+                await scheduler.run("source", scrape)
+            except CircuitOpenError:
+                rejected += 1
+            except TimeoutError:
+                pass
+            waits.append((time.perf_counter() - started) / scale)
+
+        tasks = []
+        while time.perf_counter() < down_until:
+            tasks.append(asyncio.create_task(one()))
+            await asyncio.sleep(args.interval * scale)
+        await asyncio.gather(*tasks)
+        return waits, rejected
+
+    # The fixed timeout of today: no circuit breaker and no adaptation.
+    saved = scrape_scheduler.CIRCUIT_FAILURES, scrape_scheduler.SCRAPE_LATENCY_MIN_SAMPLES
+    scrape_scheduler.CIRCUIT_FAILURES = scrape_scheduler.SCRAPE_LATENCY_MIN_SAMPLES = 10**9
+    fixed, _ = await measure(ScrapeScheduler())
+    scrape_scheduler.CIRCUIT_FAILURES, scrape_scheduler.SCRAPE_LATENCY_MIN_SAMPLES = saved
+    breaker, rejected = await measure(ScrapeScheduler())
+    print(f"outage of {args.outage:g}s, one request every {args.interval:g}s")
+    print(f"  fixed timeout    mean wait {statistics.mean(fixed):6.2f}s   {percentiles(fixed)}")
+    print(
+        f"  circuit breaker  mean wait {statistics.mean(breaker):6.2f}s   {percentiles(breaker)}"
+        f"   {rejected}/{len(breaker)} answered at once"
+    )
+
+
+def main() -> None:
+    parser = make_parser(__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0, help="usual scrape latency (s)")
+    parser.add_argument("--slow-ratio", type=float, default=0.04)
+    parser.add_argument("--slow-factor", type=float, default=5.0)
+    parser.add_argument("--outage", type=float, default=600.0, help="seconds the source is down")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between requests in the outage")
+    parser.add_argument("--time-scale", type=float, default=200.0)
+    args = parser.parse_args()
+
+    # The scheduler reads its settings at import time; its timeouts are in simulated seconds too.
+    scale = 1 / args.time_scale
+    for name, default in (("SCRAPE_TIMEOUT", 15), ("SCRAPE_TIMEOUT_MIN", 5), ("SCRAPE_TIMEOUT_MAX", 30)):
+        os.environ[name] = str(float(os.getenv(name, default)) * scale)
+    os.environ["CIRCUIT_OPEN_SECONDS"] = str(float(os.getenv("CIRCUIT_OPEN_SECONDS", 30)) * scale)
+
+    asyncio.run(degraded(args, scale))
+    asyncio.run(outage(args, scale))
+
+
+if __name__ == "__main__":
+    main()
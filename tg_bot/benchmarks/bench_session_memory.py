@@ -0,0 +1,87 @@
+"""
+Memory benchmark of per-session job storage.
+
+Compares the footprint of sessions holding their own decoded job dictionaries
+(as the bot did before the shared job store) with sessions holding arrays of ids
+into the shared, deduplicated job store.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_session_memory.py --sessions 10000
+"""
+
+import json
+import random
+import tracemalloc
+
+from _common import make_parser  # Also makes the bot modules importable
+
+from job_store import JobStore
+from payload_codec import decode_jobs
+
+SKILLS = ["Python", "JavaScript", "React", "Django", "SQL", "AWS", "Docker", "Scraping"]
+
+
+def make_page(page_no: int, jobs_per_page: int) -> str:
+    """Return one page of fake jobs as the JSON payload the API sends."""
+    rng = random.Random(page_no)
+    jobs = [
+        {
+            "postingTimestamp": 1_700_000_000_000 + page_no * 1000 + i,
+            "jobTitle": f"Senior {rng.choice(SKILLS)} developer needed",
+            "jobHref": f"https://www.upwork.com/jobs/~{page_no:05d}{i:03d}",
+            "description": "Long job description. " * rng.randint(20, 60),
+            "skills": rng.sample(SKILLS, 4),
+        }
+        for i in range(jobs_per_page)
+    ]
+    return json.dumps(jobs)
+
+
+def measure(build) -> int:
+    """Return the bytes allocated by build() that are still alive afterwards."""
+    tracemalloc.start()
+    kept = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current
+
+
+def main() -> None:
+    parser = make_parser(__doc__)
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--pages", type=int, default=200, help="distinct result pages")
+    parser.add_argument("--jobs-per-page", type=int, default=10)
+    args = parser.parse_args()
+
+    payloads = [make_page(n, args.jobs_per_page) for n in range(args.pages)]
+    rng = random.Random(0)
+    # Popular pages are requested much more often than the rest.
+    picks = [
+        min(int(rng.paretovariate(1.2)) - 1, args.pages - 1)
+        for _ in range(args.sessions)
+    ]
+
+    def dict_sessions():
+        # Before: every session decodes and keeps its own list of dictionaries.
+        return [{"jobs": json.loads(payloads[p]), "page": 1} for p in picks]
+
+    def store_sessions():
+        # After: sessions hold arrays of ids into the shared store.
+        store = JobStore()
+        sessions = [
+            {"jobs": store.acquire(decode_jobs(json.loads(payloads[p]))), "page": 1} for p in picks
+        ]
+        return store, sessions
+
+    before = measure(dict_sessions)
+    after = measure(store_sessions)
+
+    print(f"sessions: {args.sessions}, distinct pages: {len(set(picks))}")
+    print(f"dict lists:  {before / 1024 / 1024:8.2f} MiB  ({before / args.sessions:8.0f} B/session)")
+    print(f"job store:   {after / 1024 / 1024:8.2f} MiB  ({after / args.sessions:8.0f} B/session)")
+    print(f"reduction:   {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Cold start time of the bot process, with and without FAST_START.
+
+Starts the bot (main.py, polling mode) in a child process against a local fake Telegram
+Bot API, with SESSION_DB_PATH holding --sessions stored sessions, and measures from the
+spawn of the process:
+- import: the time to import main.py (reported by the child);
+- first reply: the fake Bot API hands the bot a /help message on its first getUpdates,
+  this is the time until the reply is sent;
+- ready: the time until the /ready probe of the metrics endpoint answers 200.
+Every Bot API call takes --api-latency ms. Medians over --repeat starts of each mode.
+
+Run from the tg_bot directory:
+    python benchmarks/bench_startup.py --sessions 50000 --api-latency 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from _common import make_parser, respond, serve_http  # Also makes the bot modules importable
+
+CHAT_ID = 42
+
+
+class ChildFailed(Exception):
+    """The bot process exited or did not get ready in time."""
+
+
+class FakeBotApi:
+    """Answers the Bot API methods used at startup; the first getUpdates returns a /help."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.delivered = False
+        self.replied = asyncio.Event()
+
+    async def handle(self, method, target, body, writer) -> None:
+        name = target.rsplit("/", 1)[-1]
+        await asyncio.sleep(self.latency)
+        if name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif name == "getUpdates":
+            result = []
+            if not self.delivered:
+                self.delivered = True
+                result = [self.help_update()]
+            else:
+                # Long polling with nothing new.
+                await asyncio.sleep(1)
+        elif name == "sendMessage":
+            self.replied.set()
+            result = {
+                "message_id": 2,
+                "date": int(time.time()),
+                "chat": {"id": CHAT_ID, "type": "private"},
+                "text": "",
+            }
+        else:
+            result = True
+        await respond(writer, json.dumps({"ok": True, "result": result}).encode())
+
+    @staticmethod
+    def help_update() -> dict:
+        return {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": CHAT_ID, "type": "private"},
+                "from": {"id": CHAT_ID, "is_bot": False, "first_name": "Bench"},
+                "text": "/help",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+            },
+        }
+
+
+def make_sessions(path: str, count: int) -> None:
+    """Store `count` sessions, shaped like the ones of users who searched."""
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE sessions (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+    )
+    data = json.dumps(
+        {
+            "site": "upwork",
+            "query": "python django developer",
+            "page": 2,
+            "page_sizes": [10, 10],
+            "window_page": 1,
+            "last_active": time.time(),
+        }
+    )
+    db.executemany(
+        "INSERT INTO sessions VALUES (?, ?, ?)",
+        ((user_id, data, time.time()) for user_id in range(1, count + 1)),
+    )
+    db.commit()
+    db.close()
+
+
+async def is_ready(port: int) -> bool:
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return False
+    writer.write(b"GET /ready HTTP/1.0\r\n\r\n")
+    status = await reader.readline()
+    writer.close()
+    return status.split(b" ")[1:2] == [b"200"]
+
+
+async def start_once(args, directory: str, fast_start: bool) -> dict:
+    bot_api = FakeBotApi(args.api_latency / 1000)
+    server = await serve_http(bot_api.handle, args.bot_port)
+    env = {
+        **os.environ,
+        "TG_BOT": "123456:BENCH",
+        "BOT_MODE": "polling",
+        "FAST_START": "1" if fast_start else "0",
+        "SESSION_DB_PATH": os.path.join(directory, "sessions.db"),
+        "ALERTS_DB_PATH": os.path.join(directory, "alerts.db"),
+        "JOB_INDEX_PATH": os.path.join(directory, "jobs.db"),
+        "PROFILES_DB_PATH": os.path.join(directory, "profiles.db"),
+        "METRICS_PORT": str(args.metrics_port),
+        "METRICS_LISTEN": "127.0.0.1",
+    }
+    started = time.perf_counter()
+    child = await asyncio.create_subprocess_exec(
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        f"--bot-port={args.bot_port}",
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # Read while the child runs, so a long traceback cannot fill the pipe and block it.
+    stderr = asyncio.ensure_future(child.stderr.read())
+    result = {}
+
+    async def first_reply():
+        await bot_api.replied.wait()
+        result["reply"] = time.perf_counter() - started
+
+    async def ready():
+        while not await is_ready(args.metrics_port):
+            await asyncio.sleep(0.005)
+        result["ready"] = time.perf_counter() - started
+
+    measured = asyncio.ensure_future(asyncio.gather(first_reply(), ready()))
+    exited = asyncio.ensure_future(child.wait())
+    failure = None
+    try:
+        done, _ = await asyncio.wait(
+            {measured, exited}, timeout=args.timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if measured in done:
+            result["import"] = json.loads(await child.stdout.readline())["import"]
+        elif exited in done:
+            failure = f"the bot process exited with status {child.returncode}"
+        else:
+            failure = f"the bot process was not ready after {args.timeout:g} s"
+    finally:
+        measured.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await measured
+        if child.returncode is None:
+            # It may still exit on its own in between.
+            with contextlib.suppress(ProcessLookupError):
+                child.send_signal(signal.SIGTERM)
+        await child.wait()
+        server.close()
+        await server.wait_closed()
+    if failure:
+        output = (await stderr).decode(errors="replace").strip()
+        raise ChildFailed(f"{failure}:\n{output}" if output else failure)
+    stderr.cancel()
+    return result
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        make_sessions(os.path.join(directory, "sessions.db"), args.sessions)
+        print(
+            f"{args.sessions} stored sessions, Bot API latency {args.api_latency:g} ms,"
+            f" median of {args.repeat} starts"
+        )
+        for fast_start in (False, True):
+            try:
+                runs = [await start_once(args, directory, fast_start) for _ in range(args.repeat)]
+            except ChildFailed as e:
+                sys.exit(f"FAST_START={int(fast_start)}: {e}")
+            median = lambda key: statistics.median(run[key] for run in runs) * 1000  # noqa: E731
+            print(
+                f"FAST_START={int(fast_start)}   import {median('import'):7.0f} ms"
+                f"   first reply {median('reply'):7.0f} ms   ready {median('ready'):7.0f} ms"
+            )
+
+
+def child(args) -> None:
+    # The bot process: import main.py, point the bot at the fake Bot API and run it.
+    started = time.perf_counter()
+    import main
+
+    print(json.dumps({"import": time.perf_counter() - started}), flush=True)
+    from telegram.ext import ApplicationBuilder  # type: ignore
+
+    token = ApplicationBuilder.token
+    ApplicationBuilder.token = lambda self, value: token(self, value).base_url(
+        f"http://127.0.0.1:{args.bot_port}/bot"
+    )
+    main.main()
+
+
+def parse_args():
+    parser = make_parser(__doc__)
+    parser.add_argument("--sessions", type=int, default=50000, help="stored sessions")
+    parser.add_argument("--api-latency", type=float, default=200, help="Bot API latency (ms)")
+    parser.add_argument("--repeat", type=int, default=5, help="starts per mode, the median is kept")
+    parser.add_argument("--bot-port", type=int, default=18081)
+    parser.add_argument("--metrics-port", type=int, default=18091)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per start")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args)
+    else:
+        asyncio.run(run(args))
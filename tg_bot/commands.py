@@ -11,12 +11,20 @@ from logger import logger  # Custom logging module for logging info/errors
 from keyboard_handle import (
     generate_jobs_sites_keyboard,
 )  # Function to generate keyboard for job site selection
+from prefetch import prefetcher  # Background prefetch of the next results page
+from job_store import clear_session  # Release the session jobs and clear its data
+from send_queue import outbound  # Rate-limited queue for outbound Telegram requests
 
 # Define the bot commands that will appear in the Telegram client when a user types "/"
 commands = [
     BotCommand("start", "Start the bot"),
     BotCommand("help", "Show help information"),
     BotCommand("jobs", "Search for jobs"),
+    BotCommand("alert", "Get alerts for new jobs of your last search"),
+    BotCommand("alerts", "List your job alerts"),
+    BotCommand("unalert", "Remove a job alert"),
+    BotCommand("skills", "Rank jobs by your skills"),
+    BotCommand("exclude", "Hide jobs containing keywords"),
     BotCommand("exit", "Stop interacting with the bot"),
 ]
 
@@ -35,11 +43,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     reply_markup = generate_jobs_sites_keyboard()
 
     # Send a welcome message with HTML formatting and the generated keyboard attached
-    await update.message.reply_html(
-        f"Hi {user.mention_html()}! Welcome to <b>Job Beacon</b> – your personal assistant to exciting career opportunities.\n"
-        "We bring you real-time alerts from the top job sites, ensuring you never miss a chance to shine.\n"
-        "Tap a button below to begin your journey towards your dream job!",
-        reply_markup=reply_markup,
+    await outbound.call(
+        update.effective_chat.id,
+        lambda: update.message.reply_html(
+            f"Hi {user.mention_html()}! Welcome to <b>Job Beacon</b> – your personal assistant to exciting career opportunities.\n"
+            "We bring you real-time alerts from the top job sites, ensuring you never miss a chance to shine.\n"
+            "Tap a button below to begin your journey towards your dream job!",
+            reply_markup=reply_markup,
+        ),
     )
 
 
@@ -48,9 +59,12 @@ async def jobs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     Handler for the /jobs command.
     Sends a message prompting the user to begin their job search.
     """
-    await update.message.reply_html(
-        "Tap a button below to begin your journey towards your dream job!",
-        reply_markup=generate_jobs_sites_keyboard(),  # Attach the job sites keyboard
+    await outbound.call(
+        update.effective_chat.id,
+        lambda: update.message.reply_html(
+            "Tap a button below to begin your journey towards your dream job!",
+            reply_markup=generate_jobs_sites_keyboard(),  # Attach the job sites keyboard
+        ),
     )
 
 
@@ -59,7 +73,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     Handler for the /help command.
     Sends a help message.
     """
-    await update.message.reply_text("Help! no help command for now :(")
+    await outbound.call(
+        update.effective_chat.id,
+        lambda: update.message.reply_text("Help! no help command for now :("),
+    )
 
 
 async def exit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -67,12 +84,17 @@ async def exit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     Handler for the /exit command.
     Clears all stored user data and sends a goodbye message.
     """
-    # Clear all stored data for the user in this session.
-    context.user_data.clear()
+    # Stop any background prefetch started for this user.
+    prefetcher.cancel(update.effective_user.id)
+    # Clear all stored data for the user in this session (and release its jobs from the store).
+    clear_session(context.user_data)
 
     # Send a goodbye message informing the user that their search history has been cleared.
-    await update.message.reply_text(
-        "🚪 You've exited the bot. "
-        "Your search history has been cleared.\n"
-        "Type /start to begin again."
+    await outbound.call(
+        update.effective_chat.id,
+        lambda: update.message.reply_text(
+            "🚪 You've exited the bot. "
+            "Your search history has been cleared.\n"
+            "Type /start to begin again."
+        ),
     )
@@ -0,0 +1,89 @@
+import os
+import httpx
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+
+# Pool limits for the shared client (all values can be overridden from the .env file).
+# - max_connections: upper bound of simultaneously open connections.
+# - max_keepalive_connections: how many idle connections are kept for reuse.
+# - keepalive_expiry: seconds an idle connection stays in the pool before it is closed.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Per-phase timeouts in seconds.
+# - connect: establishing the TCP connection to the API.
+# - read: waiting for the scraper response (a full Puppeteer scrape can be slow); the whole
+#   scrape is bounded by the adaptive timeout of scrape_scheduler, up to SCRAPE_TIMEOUT_MAX.
+# - write: sending the request.
+# - pool: waiting for a free connection from the pool.
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "5"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+
+# HTTP/2 is used only when requested and the optional "h2" package is installed.
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+
+# The single long-lived client shared by every scraper call.
+_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    """Return True if HTTP/2 is enabled and the "h2" package can be imported."""
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401  # type: ignore
+    except ImportError:
+        logger.info("Package 'h2' is not installed, falling back to HTTP/1.1")
+        return False
+    return True
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """
+    Create the shared pooled HTTP client.
+    Called once from the Application post_init hook in main.py.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=HTTP_CONNECT_TIMEOUT,
+                read=HTTP_READ_TIMEOUT,
+                write=HTTP_WRITE_TIMEOUT,
+                pool=HTTP_POOL_TIMEOUT,
+            ),
+        )
+        logger.info("Shared HTTP client started")
+    return _client
+
+
+async def close_http_client() -> None:
+    """
+    Close the shared HTTP client and release all pooled connections.
+    Called once from the Application post_shutdown hook in main.py.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Shared HTTP client closed")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared HTTP client.
+    Raises RuntimeError if the client was not started yet.
+    """
+    if _client is None:
+        raise RuntimeError("HTTP client is not started, call start_http_client() first")
+    return _client
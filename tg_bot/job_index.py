@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from job_store import Job  # Compact job record
+from sqlite_db import LazyConnection  # Lock-guarded SQLite connection opened on first use
+
+# SQLite file of the persistent job index; when empty, scraped jobs are not indexed.
+JOB_INDEX_PATH = os.getenv("JOB_INDEX_PATH", "jobs.db")
+# Indexed jobs older than this many seconds (by scrape time) are deleted.
+JOB_INDEX_TTL = float(os.getenv("JOB_INDEX_TTL", str(14 * 24 * 3600)))
+
+# Words of a query, as matched against the full-text index.
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# Keeps the full-text index in sync on updates of the indexed columns only: the upsert of
+# a re-scraped job names them in its SET clause, the WHEN clause skips it when they are
+# unchanged (only scraped_at is refreshed).
+_UPDATE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS jobs_au AFTER UPDATE OF title, description, skills ON jobs
+WHEN old.title IS NOT new.title
+    OR old.description IS NOT new.description
+    OR old.skills IS NOT new.skills
+BEGIN
+    INSERT INTO jobs_fts(jobs_fts, rowid, title, description, skills)
+    VALUES ('delete', old.id, old.title, old.description, old.skills);
+    INSERT INTO jobs_fts(rowid, title, description, skills)
+    VALUES (new.id, new.title, new.description, new.skills);
+END;
+"""
+
+# Tables, indexes and triggers of the job index.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    href TEXT NOT NULL UNIQUE,
+    site TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    skills TEXT NOT NULL,
+    posted_at INTEGER,
+    scraped_at REAL NOT NULL,
+    truncated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_site_posted ON jobs(site, posted_at);
+CREATE INDEX IF NOT EXISTS jobs_posted ON jobs(posted_at);
+CREATE INDEX IF NOT EXISTS jobs_scraped ON jobs(scraped_at);
+-- Covering index of the columns searches filter and order matches by, so that
+-- ranking every match reads this index rather than the rows (and descriptions).
+CREATE INDEX IF NOT EXISTS jobs_order ON jobs(id, site, posted_at);
+
+CREATE TABLE IF NOT EXISTS job_skills (
+    skill TEXT NOT NULL,
+    job_id INTEGER NOT NULL,
+    PRIMARY KEY (skill, job_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS job_skills_job ON job_skills(job_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+    title, description, skills,
+    content='jobs', content_rowid='id'
+);
+
+-- Keep the full-text index in sync with the jobs table.
+CREATE TRIGGER IF NOT EXISTS jobs_ai AFTER INSERT ON jobs BEGIN
+    INSERT INTO jobs_fts(rowid, title, description, skills)
+    VALUES (new.id, new.title, new.description, new.skills);
+END;
+CREATE TRIGGER IF NOT EXISTS jobs_ad AFTER DELETE ON jobs BEGIN
+    INSERT INTO jobs_fts(jobs_fts, rowid, title, description, skills)
+    VALUES ('delete', old.id, old.title, old.description, old.skills);
+    DELETE FROM job_skills WHERE job_id = old.id;
+END;
+""" + _UPDATE_TRIGGER
+
+
+def _migrate(db: sqlite3.Connection) -> None:
+    # Indexes created before the truncated flag existed.
+    columns = [row[1] for row in db.execute("PRAGMA table_info(jobs)")]
+    if "truncated" not in columns:
+        db.execute("ALTER TABLE jobs ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0")
+    # Indexes whose update trigger fired on every update.
+    trigger = db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'jobs_au'"
+    ).fetchone()
+    if "UPDATE OF" not in trigger[0]:
+        db.execute("DROP TRIGGER jobs_au")
+        db.executescript(_UPDATE_TRIGGER)
+
+
+def _to_fts_query(query: str) -> str:
+    """
+    Turn a user query into an FTS5 query: every word must match (as a prefix).
+    Words are quoted, so FTS5 operators typed by users are matched as plain text.
+    """
+    words = _WORD_RE.findall(query.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _load_skills(skills: str) -> list[str]:
+    """
+    Decode the skills column: a JSON list, as skills may contain ", " themselves.
+    Rows indexed before were stored joined with ", ".
+    """
+    if skills.startswith("["):
+        return json.loads(skills)
+    return skills.split(", ") if skills else []
+
+
+class JobIndex:
+    """
+    Persistent store of every scraped job with indexed local search.
+
+    - jobs: one row per job link, indexed by site and posting timestamp.
+      Skills are stored as a JSON list.
+      Searches return the newest postings first (by posted_at, ties by id): ids only
+      record when a link was first indexed, not when the job was posted.
+    - job_skills: (skill, job) pairs, indexed by skill.
+    - jobs_fts: FTS5 full-text index over title, description and skills.
+    """
+
+    def __init__(self, path: str = JOB_INDEX_PATH) -> None:
+        self._sql = LazyConnection(path, _SCHEMA, _migrate)
+
+    def add_jobs(self, site: str, jobs: list[Job]) -> None:
+        """Insert or refresh scraped job records."""
+        now = time.time()
+        with self._sql as db:
+            for job in jobs:
+                href = job.href
+                if not href.startswith("http"):
+                    # Jobs without a real link cannot be deduplicated.
+                    continue
+                posted_at = job.posting_timestamp
+                skills = job.skills
+                # A truncated description does not replace a full one fetched earlier
+                # (see set_description).
+                row = db.execute(
+                    "INSERT INTO jobs"
+                    " (href, site, title, description, skills, posted_at, scraped_at, truncated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(href) DO UPDATE SET"
+                    " title = excluded.title, skills = excluded.skills,"
+                    " description = CASE WHEN excluded.truncated AND NOT jobs.truncated"
+                    " THEN jobs.description ELSE excluded.description END,"
+                    " truncated = excluded.truncated AND jobs.truncated,"
+                    " scraped_at = excluded.scraped_at"
+                    " RETURNING id",
+                    (
+                        href,
+                        site,
+                        job.title,
+                        job.description,
+                        json.dumps(list(skills), ensure_ascii=False),
+                        posted_at if isinstance(posted_at, (int, float)) else None,
+                        now,
+                        job.truncated,
+                    ),
+                ).fetchone()
+                # A refreshed job may have dropped skills: replace its pairs.
+                db.execute("DELETE FROM job_skills WHERE job_id = ?", (row[0],))
+                db.executemany(
+                    "INSERT OR IGNORE INTO job_skills (skill, job_id) VALUES (?, ?)",
+                    [(skill.lower(), row[0]) for skill in skills],
+                )
+            db.commit()
+
+    def set_description(self, href: str, description: str) -> None:
+        """Store the full description of an indexed job whose description was truncated."""
+        with self._sql as db:
+            db.execute(
+                "UPDATE jobs SET description = ?, truncated = 0 WHERE href = ?",
+                (description, href),
+            )
+            db.commit()
+
+    def search(
+        self,
+        query: str,
+        site: str | None = None,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> list[Job]:
+        """
+        Return stored jobs matching every word of the query (in title, description or skills),
+        newest posted first, as job records. site=None searches every site.
+        """
+        fts_query = _to_fts_query(query)
+        if not fts_query:
+            return []
+        # CROSS JOIN makes FTS5 drive the query: otherwise SQLite may walk the jobs of the
+        # site by posting time and run one full-text match per job.
+        sql = (
+            "SELECT jobs.id FROM jobs_fts CROSS JOIN jobs INDEXED BY jobs_order"
+            " ON jobs.id = jobs_fts.rowid WHERE jobs_fts MATCH ?"
+        )
+        params: list = [fts_query]
+        if site is not None:
+            sql += " AND jobs.site = ?"
+            params.append(site)
+        sql += " ORDER BY jobs.posted_at DESC, jobs.id DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return self._select_newest(sql, params)
+
+    def _select_newest(self, ids_sql: str, params: list) -> list[Job]:
+        # The jobs whose ids the query returns, newest posted first.
+        with self._sql as db:
+            rows = db.execute(
+                "SELECT href, title, description, skills, posted_at, truncated FROM jobs"
+                f" WHERE id IN ({ids_sql}) ORDER BY posted_at DESC, id DESC",
+                params,
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def search_by_skill(self, skill: str, limit: int = 10) -> list[Job]:
+        """Return the newest stored jobs requiring the given skill."""
+        return self._select_newest(
+            "SELECT jobs.id FROM job_skills CROSS JOIN jobs INDEXED BY jobs_order"
+            " ON jobs.id = job_skills.job_id WHERE job_skills.skill = ?"
+            " ORDER BY jobs.posted_at DESC, jobs.id DESC LIMIT ?",
+            [skill.lower(), limit],
+        )
+
+    def get_jobs(self, hrefs: list[str]) -> list[Job]:
+        """Return the stored jobs with the given links, in the same order (unknown links are skipped)."""
+        found: dict[str, Job] = {}
+        with self._sql as db:
+            # Stay below SQLite's limit on the number of query parameters.
+            for i in range(0, len(hrefs), 500):
+                chunk = hrefs[i : i + 500]
+                for row in db.execute(
+                    "SELECT href, title, description, skills, posted_at, truncated FROM jobs"
+                    f" WHERE href IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    found[row[0]] = self._to_job(row)
+        return [found[href] for href in hrefs if href in found]
+
+    def prune(self) -> None:
+        """Delete jobs scraped longer than JOB_INDEX_TTL seconds ago."""
+        with self._sql as db:
+            deleted = db.execute(
+                "DELETE FROM jobs WHERE scraped_at < ?", (time.time() - JOB_INDEX_TTL,)
+            ).rowcount
+            db.commit()
+        if deleted:
+            logger.info("Pruned %s old jobs from the job index", deleted)
+
+    def __len__(self) -> int:
+        with self._sql as db:
+            return db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    @staticmethod
+    def _to_job(row: tuple) -> Job:
+        href, title, description, skills, posted_at, truncated = row
+        return Job.from_row(
+            [
+                posted_at if posted_at is not None else "N/A",
+                title,
+                href,
+                description,
+                _load_skills(skills),
+                truncated,
+            ]
+        )
+
+
+async def prune_job_index(context) -> None:
+    """
+    Job queue callback deleting old jobs from the index.
+    Registered with run_repeating in main.py.
+    """
+    if job_index is not None:
+        await asyncio.to_thread(job_index.prune)
+
+
+def create_job_index() -> JobIndex | None:
+    """Create the job index, or return None when JOB_INDEX_PATH is empty."""
+    if not JOB_INDEX_PATH:
+        return None
+    return JobIndex(JOB_INDEX_PATH)
+
+
+# The job index shared by the scraper service.
+job_index = create_job_index()
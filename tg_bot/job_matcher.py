@@ -0,0 +1,158 @@
+import os
+import re
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+# MY MODULES
+from job_store import Job  # Compact job record
+
+# Number of compiled matchers kept (one per distinct set of keywords).
+MATCHER_CACHE_SIZE = int(os.getenv("MATCHER_CACHE_SIZE", "1024"))
+
+# Score of a keyword found in the job skills, the title and the description.
+SKILLS_WEIGHT = 3
+TITLE_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+# Words of a text: letters and digits, keeping "node.js", "c++" and "c#" in one token
+# (a dot ending a sentence is not part of the word).
+_TOKEN_RE = re.compile(r"[^\W_]+(?:\.[^\W_]+)*[+#]*")
+
+
+def tokenize(text: str) -> list[str]:
+    """Return the lowercase words of a text."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Normalize a keyword so that "Node.JS " and "node.js" are the same pattern."""
+    return " ".join(tokenize(keyword))
+
+
+class Profile(NamedTuple):
+    """Keywords of a user: skills rank matching jobs first, excluded keywords hide jobs."""
+
+    skills: tuple[str, ...] = ()
+    excluded: tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.skills or self.excluded)
+
+
+class KeywordMatcher:
+    """
+    Multi-pattern matcher over words (Aho-Corasick automaton whose alphabet is words).
+
+    Built once for a set of keywords (one or more words each); scanning a text finds every
+    keyword in a single pass over its words, whatever the number of keywords, and returns
+    them as a bitmask: keyword i sets bit i. Keywords are matched on whole words only,
+    so "go" does not match "good".
+    """
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        # Keyword -> bit, for the masks of profiles.
+        self.bits: dict[str, int] = {}
+        # Trie of words: transitions, failure links and the keywords ending in every state.
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[int] = [0]
+
+        for keyword in keywords:
+            words = keyword.split()
+            if not words or keyword in self.bits:
+                continue
+            bit = 1 << len(self.bits)
+            self.bits[keyword] = bit
+            state = 0
+            for word in words:
+                next_state = self._goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][word] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(0)
+                state = next_state
+            self._out[state] |= bit
+
+        # Failure links, breadth first: the longest proper suffix that is also in the trie.
+        # Each state also reports the keywords of its failure state (shorter suffixes).
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for word, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(word, 0)
+                self._fail[next_state] = fail
+                self._out[next_state] |= self._out[fail]
+                queue.append(next_state)
+
+    def mask(self, keywords: Iterable[str]) -> int:
+        """Return the bitmask of the keywords (which must be normalized)."""
+        mask = 0
+        for keyword in keywords:
+            mask |= self.bits.get(keyword, 0)
+        return mask
+
+    def scan(self, words: list[str]) -> int:
+        """Return the bitmask of the keywords found in the words."""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        state = 0
+        found = 0
+        for word in words:
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            found |= out[state]
+        return found
+
+    def job_masks(self, jobs: list[Job]) -> list[tuple[int, int, int]]:
+        """Return the (skills, title, description) keyword masks of every job, one pass each."""
+        masks = []
+        for job in jobs:
+            # Each skill is matched on its own, so keywords cannot span two skills.
+            skills = 0
+            for skill in job.skills:
+                skills |= self.scan(tokenize(skill))
+            masks.append(
+                (skills, self.scan(tokenize(job.title)), self.scan(tokenize(job.description)))
+            )
+        return masks
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def get_matcher(keywords: frozenset[str]) -> KeywordMatcher:
+    """Return the compiled matcher of a set of normalized keywords (cached)."""
+    # Sorted, so the same set always gives the same bits.
+    return KeywordMatcher(sorted(keywords))
+
+
+def score_masks(
+    masks: list[tuple[int, int, int]], skills_mask: int, excluded_mask: int
+) -> list[int | None]:
+    """
+    Score every job of a batch (given by its masks) for one profile:
+    the weighted number of profile skills found in the job, or None if the job
+    contains an excluded keyword.
+    """
+    scores: list[int | None] = []
+    for skills, title, description in masks:
+        if (skills | title | description) & excluded_mask:
+            scores.append(None)
+            continue
+        scores.append(
+            SKILLS_WEIGHT * (skills & skills_mask).bit_count()
+            + TITLE_WEIGHT * (title & skills_mask).bit_count()
+            + DESCRIPTION_WEIGHT * (description & skills_mask).bit_count()
+        )
+    return scores
+
+
+def order_by_score(jobs: list, scores: list[int | None]) -> list:
+    """Drop the excluded jobs and sort the others by score, keeping the site order on ties."""
+    kept = [(score, i) for i, score in enumerate(scores) if score is not None]
+    kept.sort(key=lambda item: -item[0])
+    return [jobs[i] for _, i in kept]
@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+from array import array
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from metrics import registry  # Metrics registry
+
+# Sessions without activity for this many seconds are evicted.
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+# How often (in seconds) idle sessions are looked for.
+SESSION_EVICT_INTERVAL = float(os.getenv("SESSION_EVICT_INTERVAL", "300"))
+
+# Links that do not identify a job and must not be used for deduplication.
+_NO_LINK = ("", "No Link", "No relative link")
+
+# Fields of a job row, in order: the compact API payload (format=rows) and the query cache
+# store jobs as rows, which are turned into records without building dictionaries.
+JOB_FIELDS = ("postingTimestamp", "jobTitle", "jobHref", "description", "skills", "truncated")
+
+
+class Job:
+    """
+    Compact job record, the form in which the scrapers return jobs.
+
+    Uses __slots__ instead of a per-instance dict, and interns the short strings
+    (title and skills) that repeat across many jobs.
+    Records not added to the job store yet have the id 0.
+    """
+
+    __slots__ = (
+        "id",
+        "posting_timestamp",
+        "title",
+        "href",
+        "description",
+        "skills",
+        "truncated",
+        "refs",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        posting_timestamp,
+        title: str,
+        href: str,
+        description: str,
+        skills: tuple[str, ...],
+        truncated: bool = False,
+    ) -> None:
+        self.id = id
+        self.posting_timestamp = posting_timestamp
+        self.title = title
+        self.href = href
+        self.description = description
+        self.skills = skills
+        # True if the API cut the description (see scraper_service.fetch_full_description).
+        self.truncated = truncated
+        # Number of sessions referencing this job.
+        self.refs = 0
+
+    @classmethod
+    def from_dict(cls, id: int, job: dict) -> "Job":
+        """Build a record from a job dictionary (the API format with field names)."""
+        return cls(
+            id,
+            job.get("postingTimestamp"),
+            sys.intern(job.get("jobTitle", "No Title")),
+            job.get("jobHref", "No Link"),
+            job.get("description", "No Description"),
+            tuple(map(sys.intern, job.get("skills", ()))),
+            bool(job.get("truncated")),
+        )
+
+    @classmethod
+    def from_row(cls, row: list) -> "Job":
+        """Build a record from a job row (values in JOB_FIELDS order, "truncated" optional)."""
+        return cls(
+            0,
+            row[0],
+            sys.intern(row[1]),
+            row[2],
+            row[3],
+            tuple(map(sys.intern, row[4])),
+            len(row) > 5 and bool(row[5]),
+        )
+
+    def to_row(self) -> list:
+        """Return the job as a row in JOB_FIELDS order."""
+        return [
+            self.posting_timestamp,
+            self.title,
+            self.href,
+            self.description,
+            self.skills,
+            self.truncated,
+        ]
+
+
+class JobStore:
+    """
+    Process-wide store of jobs shared by every session.
+
+    Jobs are deduplicated by jobHref, so a popular job seen by thousands of users is kept once.
+    Sessions hold only an array of job ids and the store keeps a reference count per job,
+    dropping it once no session refers to it anymore.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: dict[int, Job] = {}
+        self._by_href: dict[str, int] = {}
+        self._next_id = 1
+
+    def acquire(self, jobs: list[Job]) -> array:
+        """Add the job records to the store (or reuse the stored ones) and return their ids."""
+        ids = array("L")
+        for job in jobs:
+            # The record itself may be stored already (e.g. it came from a cached page).
+            stored = self._jobs.get(job.id)
+            if stored is not job:
+                job_id = self._by_href.get(job.href)
+                if job_id is None:
+                    # Store the record itself; ids are never reused, so an id left on
+                    # a record dropped from the store cannot match another job.
+                    job_id = job.id = self._next_id
+                    self._next_id += 1
+                    job.refs = 0
+                    self._jobs[job_id] = job
+                    if job.href not in _NO_LINK:
+                        self._by_href[job.href] = job_id
+                stored = self._jobs[job_id]
+            stored.refs += 1
+            ids.append(stored.id)
+        return ids
+
+    def retain(self, ids: array) -> None:
+        """Add one reference to every job id (the jobs must be in the store)."""
+        for job_id in ids:
+            self._jobs[job_id].refs += 1
+
+    def release(self, ids: array) -> None:
+        """Drop one reference to every job id; unreferenced jobs are removed from the store."""
+        for job_id in ids:
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            job.refs -= 1
+            if job.refs <= 0:
+                del self._jobs[job_id]
+                if self._by_href.get(job.href) == job_id:
+                    del self._by_href[job.href]
+
+    def get(self, job_id: int) -> Job:
+        """Return the job with the given id."""
+        return self._jobs[job_id]
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+# The store shared by all sessions.
+job_store = JobStore()
+registry.gauge("bot_job_store_jobs", "Jobs in the shared job store", lambda: len(job_store))
+
+
+def set_session_jobs(user_data: dict, jobs: list[Job]) -> None:
+    """Replace the jobs of a session, releasing the previously referenced ones."""
+    previous = user_data.get("jobs")
+    if previous:
+        job_store.release(previous)
+    user_data["jobs"] = job_store.acquire(jobs)
+    touch_session(user_data)
+
+
+def append_session_jobs(user_data: dict, ids: array, jobs: list[Job]) -> bool:
+    """
+    Append jobs to the session job ids `ids` (e.g. while a page is streamed).
+    Returns False without appending if the session no longer uses `ids`.
+    """
+    if user_data.get("jobs") is not ids:
+        return False
+    ids.extend(job_store.acquire(jobs))
+    touch_session(user_data)
+    return True
+
+
+def clear_session(user_data: dict) -> None:
+    """Release the jobs of a session and clear all of its data."""
+    previous = user_data.get("jobs")
+    if previous:
+        job_store.release(previous)
+    user_data.clear()
+
+
+def touch_session(user_data: dict) -> None:
+    """Mark the session as active now."""
+    user_data["last_seen"] = time.time()
+
+
+async def evict_idle_sessions(context) -> None:
+    """
+    Job queue callback that clears sessions idle for longer than SESSION_IDLE_TTL.
+    Registered with run_repeating in main.py.
+    Only the in-memory sessions are evicted: stored sessions (session_store) keep their row.
+    """
+    now = time.time()
+    deadline = now - SESSION_IDLE_TTL
+    idle_users = [
+        user_id
+        for user_id, user_data in context.application.user_data.items()
+        # Sessions never touched before get a full TTL from the first check.
+        if user_data.setdefault("last_seen", now) < deadline
+    ]
+    # SessionPersistence.evict, when sessions are stored.
+    evict = getattr(context.application.persistence, "evict", None)
+    for user_id in idle_users:
+        clear_session(context.application.user_data[user_id])
+        context.application.drop_user_data(user_id)
+        if evict is not None:
+            evict(user_id)
+    if idle_users:
+        logger.info(
+            "Evicted %s idle sessions, %s jobs left in the store",
+            len(idle_users),
+            len(job_store),
+        )
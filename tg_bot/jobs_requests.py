@@ -1,35 +1,73 @@
-import httpx
+from collections import OrderedDict
 from datetime import datetime
+import html
+import os
+import re
 import time
 
+# MY MODULES
+from http_client import get_http_client  # Shared pooled HTTP client
+from job_store import JOB_FIELDS, Job  # Compact job record and the field order of job rows
+from job_matcher import (  # Keyword matching of skill profiles
+    Profile,
+    get_matcher,
+    order_by_score,
+    score_masks,
+)
+from metrics import observe, observe_server_timing, registry, span  # Timing of the pipeline stages
+from payload_codec import (  # Decoding of the API payloads
+    ACCEPT,
+    decode_body,
+    decode_job,
+    decode_jobs,
+    loads,
+    row_fields,
+)
+
 # List of job sites for demonstration purposes.
-job_sites = ["UpWork", "1"]
+job_sites = ["UpWork", "1", "All"]
 # Mapping of site identifiers to their API endpoints.
 jobs_api_url = {"upwork": "http://localhost:9156/api/upwork/jobs"}
 
+# Maximum number of rendered jobs kept in the render cache.
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "10000"))
+# Maximum length of a Telegram message.
+TELEGRAM_MAX_LENGTH = 4096
+
+# Ask the API for the compact payload: the job fields of job_store.JOB_FIELDS, sent as rows
+# that are read straight into job records instead of objects.
+API_COMPACT = os.getenv("API_COMPACT", "1") == "1"
+# Descriptions are sent cut to about this many characters (the full text is fetched
+# when the user asks for it); 0 asks for full descriptions.
+API_DESCRIPTION_LIMIT = int(os.getenv("API_DESCRIPTION_LIMIT", "1000"))
+
+# Bytes of job payloads received from the APIs.
+_received_bytes = 0
+registry.gauge(
+    "bot_api_received_bytes_total",
+    "Bytes of job payloads received from the APIs",
+    lambda: _received_bytes,
+    "counter",
+)
 
-# format_job_message formats a job dictionary into an HTML-formatted string for Telegram.
-def format_job_message(job: dict) -> str:
+
+# format_job_message formats a job record into an HTML-formatted string for Telegram.
+def format_job_message(job: Job) -> str:
     """
-    Format a job dictionary into an HTML-formatted string for Telegram messages.
+    Format a job record into an HTML-formatted string for Telegram messages.
 
-    The job dictionary is expected to have the following keys:
-      - 'postingTimestamp': Unix timestamp in milliseconds.
-      - 'jobTitle': The title of the job.
-      - 'jobHref': A URL linking to the job details.
+    The job record (see job_store.Job) is expected to have the following attributes:
+      - 'posting_timestamp': Unix timestamp in milliseconds.
+      - 'title': The title of the job.
+      - 'href': A URL linking to the job details.
       - 'description': A description of the job.
-      - 'skills': A list of skills required for the job.
-    """
-    # Extract the posting timestamp; returns None if not present.
-    posting_timestamp = job.get("postingTimestamp")
-    # Extract the job title, defaulting to "No Title" if absent.
-    job_title = job.get("jobTitle", "No Title")
-    # Extract the job URL, defaulting to "No Link" if absent.
-    job_href = job.get("jobHref", "No Link")
-    # Extract the job description, defaulting to "No Description" if absent.
-    description = job.get("description", "No Description")
-    # Extract the skills list, defaulting to an empty list if absent.
-    skills = job.get("skills", [])
+      - 'skills': A tuple of skills required for the job.
+    """
+    posting_timestamp = job.posting_timestamp
+    job_title = job.title
+    job_href = job.href
+    description = job.description
+    skills = job.skills
 
     # Convert posting timestamp (in milliseconds) to a human-readable date.
     if posting_timestamp and isinstance(posting_timestamp, (int, float)):
@@ -40,48 +78,290 @@ def format_job_message(job: dict) -> str:
     else:
         posted_date = "Unknown Date"
 
-    # Join the skills list into a comma-separated string.
+    # Join the skills into a comma-separated string.
     skills_text = ", ".join(skills) if skills else "None"
 
     # Build the HTML-formatted message with:
     # - Bold text for labels.
     # - Newline characters for formatting.
     # - A clickable link for the job.
+    # - Scraped text escaped, so "<" or "&" in a description cannot break the HTML.
     message = (
-        f"<b>Job Title:</b> {job_title}\n"
+        f"<b>Job Title:</b> {html.escape(job_title)}\n"
         f"<b>Posted:</b> {posted_date}\n\n"
-        f"<b>Description:</b>\n{description}\n\n"
-        f"<b>Skills:</b> {skills_text}\n\n"
-        f"<b>Job Link:</b> <a href='{job_href}'>Click here</a>"
+        f"<b>Description:</b>\n{html.escape(description)}\n\n"
+        f"<b>Skills:</b> {html.escape(skills_text)}\n\n"
+        f"<b>Job Link:</b> <a href='{html.escape(job_href)}'>Click here</a>"
     )
 
     return message
 
 
-def split_message(text: str, max_length: int = 4096) -> list[str]:
+def rank_jobs(jobs: list[Job], profile: Profile) -> list[Job]:
+    """
+    Rank a page of jobs for a skill profile: jobs with an excluded keyword are dropped,
+    the others are sorted by the weighted number of profile skills found in their
+    skills, title and description (the site order is kept between equal scores).
+    """
+    if not profile or not jobs:
+        return jobs
+    matcher = get_matcher(frozenset(profile.skills + profile.excluded))
+    scores = score_masks(
+        matcher.job_masks(jobs), matcher.mask(profile.skills), matcher.mask(profile.excluded)
+    )
+    return order_by_score(jobs, scores)
+
+
+def rank_jobs_for_profiles(jobs: list[Job], profiles: dict) -> dict:
+    """
+    Rank a batch of jobs for many profiles at once ({key: Profile} -> {key: ranked jobs}).
+
+    One matcher is compiled for the keywords of every profile, so each job is scanned once
+    for the whole batch; scoring a profile is then a few bitmask operations per job, and
+    profiles shared by several keys are scored once.
+    """
+    keywords = frozenset(
+        keyword for profile in profiles.values() for keyword in profile.skills + profile.excluded
+    )
+    if not keywords or not jobs:
+        return {key: jobs for key in profiles}
+    matcher = get_matcher(keywords)
+    masks = matcher.job_masks(jobs)
+
+    ranked: dict[Profile, list[Job]] = {}
+    result = {}
+    for key, profile in profiles.items():
+        if not profile:
+            result[key] = jobs
+            continue
+        if profile not in ranked:
+            scores = score_masks(
+                masks, matcher.mask(profile.skills), matcher.mask(profile.excluded)
+            )
+            ranked[profile] = order_by_score(jobs, scores)
+        result[key] = ranked[profile]
+    return result
+
+
+# Tokens of Telegram HTML: tags, entities, plain text runs and stray "<" / "&" characters.
+_HTML_TOKEN_RE = re.compile(r"<[^>]*>|&#?\w+;|[^<&]+|[<&]")
+# Name of an opening or closing tag, e.g. "b" for "<b>" and "</b>".
+_TAG_NAME_RE = re.compile(r"</?\s*([a-zA-Z0-9-]+)")
+
+
+def split_message(text: str, max_length: int = TELEGRAM_MAX_LENGTH) -> list[str]:
     """
     Splits the text into chunks of at most max_length characters.
     Telegram has a maximum message length of 4096 characters,
     so this function helps to divide a long message into smaller parts.
+
+    The split is HTML-aware: chunks never break inside a tag or an entity,
+    tags still open at the end of a chunk are closed there and re-opened
+    at the start of the next chunk, and text is preferably cut at a newline or space.
+    """
+    if len(text) <= max_length:
+        return [text]
+
+    chunks = []
+    current = []  # Pieces of the chunk being built.
+    length = 0  # Length of the chunk being built.
+    open_tags = []  # (name, opening tag) of the tags open at this point.
+
+    def closing_length() -> int:
+        # Length of the closing tags needed to end the chunk right now.
+        return sum(len(name) + 3 for name, _ in open_tags)
+
+    def flush() -> None:
+        nonlocal current, length
+        closing = "".join(f"</{name}>" for name, _ in reversed(open_tags))
+        chunks.append("".join(current) + closing)
+        # Re-open the tags that are still open in the next chunk.
+        current = [tag for _, tag in open_tags]
+        length = sum(len(tag) for tag in current)
+
+    def empty_length() -> int:
+        # Length of a chunk that holds nothing but re-opened tags.
+        return sum(len(tag) for _, tag in open_tags)
+
+    for token in _HTML_TOKEN_RE.findall(text):
+        if token.startswith("<") and len(token) > 1:
+            match = _TAG_NAME_RE.match(token)
+            name = match.group(1).lower() if match else ""
+            is_closing = token.startswith("</")
+            # An opening tag also reserves room for its closing tag.
+            needed = len(token) if is_closing else len(token) + len(name) + 3
+            if length + closing_length() + needed > max_length and length > empty_length():
+                flush()
+            current.append(token)
+            length += len(token)
+            if is_closing:
+                # Close the most recent tag with this name.
+                for i in range(len(open_tags) - 1, -1, -1):
+                    if open_tags[i][0] == name:
+                        del open_tags[i]
+                        break
+            elif name:
+                open_tags.append((name, token))
+        elif token.startswith("&") and len(token) > 1:
+            # Entities are kept whole.
+            if length + closing_length() + len(token) > max_length and length > empty_length():
+                flush()
+            current.append(token)
+            length += len(token)
+        else:
+            # Plain text is cut to fit, preferably at a newline or a space.
+            while token:
+                room = max_length - length - closing_length()
+                if len(token) <= room:
+                    current.append(token)
+                    length += len(token)
+                    break
+                if room <= 0:
+                    flush()
+                    continue
+                # The separator is kept at the end of the current chunk.
+                cut = token.rfind("\n", 0, room) + 1
+                if cut <= room // 2:
+                    cut = token.rfind(" ", 0, room) + 1
+                if cut <= room // 2:
+                    cut = room
+                current.append(token[:cut])
+                length += cut
+                token = token[cut:]
+                flush()
+
+    if length > empty_length() or not chunks:
+        flush()
+    return chunks
+
+
+# Rendered jobs keyed by (job identity, site header): tuples of already split HTML chunks.
+_render_cache: OrderedDict[tuple, tuple[str, ...]] = OrderedDict()
+
+
+def render_job_chunks(job: Job, site: str) -> tuple[str, ...]:
+    """
+    Return the message chunks of a job shown under the "Results from <site>" header.
+
+    Rendering (date conversion, formatting and splitting) happens once per job and site;
+    later calls are a dictionary lookup. The cache is bounded by RENDER_CACHE_SIZE entries
+    with least recently used eviction.
     """
-    return [text[i : i + max_length] for i in range(0, len(text), max_length)]
+    key = (job.href, job.posting_timestamp, job.title, job.truncated, site)
+    chunks = _render_cache.get(key)
+    if chunks is not None:
+        _render_cache.move_to_end(key)
+        return chunks
+
+    # Build the final message with a header and the formatted job details.
+    with span("format"):
+        final_message = f"<b>Results from {site.capitalize()}:</b>\n{format_job_message(job)}"
+        chunks = tuple(split_message(final_message))
+    _render_cache[key] = chunks
+    if len(_render_cache) > RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+    return chunks
+
+
+def _payload_params() -> dict:
+    """Query parameters selecting the compact payload (fields, description length, rows)."""
+    if not API_COMPACT:
+        return {}
+    # "truncated" is added by the API when descriptions are cut.
+    params = {"format": "rows", "fields": ",".join(JOB_FIELDS[:-1])}
+    if API_DESCRIPTION_LIMIT > 0:
+        params["desc"] = API_DESCRIPTION_LIMIT
+    return params
 
 
 # getUpWork sends an HTTP GET request to the UpWork jobs API endpoint with query parameters.
 async def getUpWork(query: str, page: int = 1) -> dict[str]:
-    # Create an asynchronous HTTP client with a 15-second timeout.
-    async with httpx.AsyncClient(timeout=httpx.Timeout(15.0)) as client:
-        # Build the request URL by appending query parameters (q and page).
-        response = await client.get(jobs_api_url["upwork"] + f"?q={query}&page={page}")
-        # Return a dictionary containing the JSON response data and the page number.
-        return {"data": response.json(), "page": page}
+    global _received_bytes
+    # Reuse the shared pooled client so keep-alive connections to the API are not re-opened.
+    client = get_http_client()
+    # Send the query parameters (q and page); httpx takes care of URL encoding.
+    with span("http", "upwork"):
+        response = await client.get(
+            jobs_api_url["upwork"],
+            params={"q": query, "page": page, **_payload_params()},
+            headers={"Accept": ACCEPT},
+        )
+    # The API reports its own stages (queue wait, page load, extraction) in Server-Timing.
+    observe_server_timing(response.headers.get("Server-Timing"), "upwork")
+    # The API answers 503 when its scraper queue is full and 500 when scraping failed.
+    response.raise_for_status()
+    _received_bytes += len(response.content)
+    # Decode the page (JSON or msgpack, rows or objects) into job records.
+    with span("decode", "upwork"):
+        jobs = decode_jobs(decode_body(response.content, response.headers.get("Content-Type")))
+    # Return a dictionary containing the jobs and the page number.
+    return {"data": jobs, "page": page}
+
+
+async def _ndjson_lines(response):
+    """
+    Yield the non-empty lines of a streamed NDJSON response as bytes, counting the bytes received.
+    The lines are split from the raw bytes, so they are not decoded to str before parsing.
+    """
+    global _received_bytes
+    pending = b""
+    async for chunk in response.aiter_bytes():
+        _received_bytes += len(chunk)
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+# getUpWorkStream yields UpWork jobs one by one while the API is still scraping the page.
+async def getUpWorkStream(query: str, page: int = 1):
+    """
+    Stream jobs from the UpWork API endpoint in NDJSON mode (one JSON job per line).
+    Each job record is yielded as soon as its line is received.
+    In the compact format the first line holds the field names and every job is a row.
+    """
+    client = get_http_client()
+    started = time.perf_counter()
+    fields = JOB_FIELDS
+    async with client.stream(
+        "GET",
+        jobs_api_url["upwork"],
+        params={"q": query, "page": page, "stream": 1, **_payload_params()},
+    ) as response:
+        # Round trip until the API started answering (the jobs follow while it scrapes).
+        observe("http_headers", time.perf_counter() - started, "upwork")
+        response.raise_for_status()
+        async for line in _ndjson_lines(response):
+            item = loads(line)
+            if isinstance(item, list):
+                yield decode_job(item, fields)
+            # The API reports errors that happen after streaming started as a final line.
+            elif "error" in item:
+                raise RuntimeError(f"UpWork API error: {item['error']}")
+            elif "fields" in item:
+                fields = row_fields(item["fields"])
+            else:
+                yield decode_job(item)
+
+
+# getUpWorkDescription returns the full description of an UpWork job sent truncated.
+async def getUpWorkDescription(href: str) -> str | None:
+    """Return the full description kept by the API, or None if it is not available anymore."""
+    client = get_http_client()
+    response = await client.get(f"{jobs_api_url['upwork']}/description", params={"href": href})
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return loads(response.content)["description"]
 
 
 # imitate_site1 is a dummy function that simulates a scraper for a job site.
 async def imitate_site1(query: str, page: int = 1) -> dict:
     """
     Mock job data for testing site '1'.
-    Returns job data in the same structure as getUpWork.
+    Returns job records in the same structure as getUpWork.
     """
 
     # Generate mock job data matching the expected format.
@@ -93,5 +373,5 @@ async def imitate_site1(query: str, page: int = 1) -> dict:
         "skills": ["Python", "Testing", "Telegram Bots"],
     }
 
-    # Return the mock job data wrapped in a list to match the real API response.
-    return {"data": [mock_job], "page": page}
+    # Return the mock job record wrapped in a list to match the real API response.
+    return {"data": [Job.from_dict(0, mock_job)], "page": page}
@@ -6,110 +6,284 @@ from telegram import (  # type: ignore
 from telegram.ext import (  # type: ignore
     ContextTypes,
 )  # Import ContextTypes for type hints in callback functions
+import asyncio  # Import asyncio to run the fetch while deciding on the waiting message
 import math  # Import math module for calculations (used for pagination)
+import os  # Import os to read settings from environment variables
 
 # MY MODULES
 from logger import logger  # Custom logger module for logging information and errors
 from jobs_requests import (
     job_sites,  # List of available job sites
-    getUpWork,  # Scraper function for UpWork
-    imitate_site1,  # Dummy scraper function for testing (site "1")
-    format_job_message,  # Function to format job details as HTML text
     split_message,  # Function to split long messages into chunks (max 4096 characters)
+    render_job_chunks,  # Cached rendering of a job into already split HTML chunks
+)
+from scraper_service import (
+    SCRAPER_DISPATCHER,  # Mapping of site keys to their scraper functions
+    stream_jobs,  # Cached entry point to the scrapers, yielding jobs as they arrive
+    stream_ranked_jobs,  # The same, ranked by the skill profile of the chat
+    answer_locally,  # Whether a search browses the job index (local-first mode)
+    fetch_full_description,  # Full text of a description the API truncated
+)
+from scrape_scheduler import CircuitOpenError  # Raised while a site is not scraped after failures
+from prefetch import prefetcher  # Background prefetch of the next results page
+from send_queue import outbound  # Rate-limited queue for outbound Telegram requests
+from profiles import get_profile  # Skill profile of a chat
+from job_store import (
+    job_store,  # Shared store of compact job records
+    set_session_jobs,  # Store the jobs of a session as ids into the shared store
+    append_session_jobs,  # Append streamed jobs to a session
+    touch_session,  # Mark a session as active
+)
+from result_window import (
+    start_window,  # Start browsing the results of a new query
+    finish_first_page,  # Record the first page once it is fully streamed
+    move_window,  # Slide the session window over the results pages
+    job_id_at,  # Job id at a position of the results
+    has_next,  # Whether a position is followed by more results
+    last_window_page,  # Last page held by the session
+    FilteredOutError,  # Raised when the profile hid every job of several pages in a row
 )
 
-# Dispatcher mapping site keys to their respective scraper functions.
-SCRAPER_DISPATCHER = {
-    "upwork": getUpWork,
-    "1": imitate_site1,
-}
+# Show the "Wait a moment" message only if the results are not ready after this many seconds.
+WAIT_MESSAGE_DELAY = float(os.getenv("WAIT_MESSAGE_DELAY", "0.3"))
+# How long "Next" waits for a job that is still being streamed before fetching the next page.
+STREAM_WAIT_TIMEOUT = float(os.getenv("STREAM_WAIT_TIMEOUT", "10"))
 
 
 # Generate a navigation keyboard for job positions.
-# This keyboard shows "Previous" and "Next" buttons based on the current index
-# and the total number of job entries (jobs_length).
-def generate_next_job_position_keyboard(index: int = 0, jobs_length: int = 10):
+# This keyboard shows "Previous" and "Next" buttons based on the current position
+# in the results (all pages joined) and whether more results follow (has_next),
+# and a "Full description" button if the description of the job was truncated.
+def generate_next_job_position_keyboard(
+    index: int = 0, has_next: bool = True, truncated: bool = False
+):
     keyboard = []
     # If current index is greater than 0, add a "Previous" button.
     if index > 0:
         # The callback data is set to (current index - 1) as a string.
         keyboard.append(InlineKeyboardButton("Previous", callback_data=str(index - 1)))
-    # If current index is less than the total number of jobs, add a "Next" button.
-    if index < jobs_length:
+    # If more jobs follow, add a "Next" button.
+    if has_next:
         # The callback data is set to (current index + 1) as a string.
         keyboard.append(InlineKeyboardButton("Next", callback_data=str(index + 1)))
-    # Return the keyboard layout as a single row with both buttons.
-    return InlineKeyboardMarkup([keyboard])
+    rows = [keyboard]
+    if truncated:
+        # The callback data is "full:" followed by the current index.
+        rows.append([InlineKeyboardButton("Full description", callback_data=f"full:{index}")])
+    # Return the keyboard layout: the navigation row and the optional description row.
+    return InlineKeyboardMarkup(rows)
+
+
+def job_keyboard(user_data: dict, index: int) -> InlineKeyboardMarkup:
+    """Keyboard of the job at the position in the results."""
+    job_id = job_id_at(user_data, index)
+    truncated = job_id is not None and job_store.get(job_id).truncated
+    return generate_next_job_position_keyboard(index, has_next(user_data, index), truncated)
 
 
 # Handler for processing a user's text query for job positions.
 # It calls the appropriate scraper based on the selected site,
 # then displays the first job from the response along with navigation buttons.
+# Later pages are loaded by the navigation callback, without a new search.
 async def message_query_handler(
-    update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 1
+    update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
     # If the update is a user message, store the user's query in context.user_data.
     if update.message and update.message.text:
         context.user_data["query"] = update.message.text
+        # A new query makes the prefetched pages of the previous one useless.
+        prefetcher.cancel(update.effective_user.id)
 
     # Retrieve the stored query text.
     query_text = context.user_data.get("query", "")
+    chat_id = update.effective_chat.id
     if not query_text:
-        await update.effective_message.reply_text("No query provided.")
+        await outbound.call(
+            chat_id, lambda: update.effective_message.reply_text("No query provided.")
+        )
         return
 
     # Ensure that a job site has been selected.
     if "selected_site" not in context.user_data:
-        await update.effective_message.reply_text(
-            "Please select a job site from the keyboard first."
+        await outbound.call(
+            chat_id,
+            lambda: update.effective_message.reply_text(
+                "Please select a job site from the keyboard first."
+            ),
         )
         return
 
     selected_site = context.user_data["selected_site"]
-    # Retrieve the scraper function based on the selected job site.
-    get_jobs = SCRAPER_DISPATCHER[selected_site]
-
-    # Inform the user that the job search is in progress.
-    wait_msg = await update.effective_message.reply_text("Wait a moment, please... :)")
-
-    # Call the scraper function with the stored query text and page number.
-    response = await get_jobs(query_text, page)
-    if response:
-        # Save the fetched job data and current page number for navigation.
-        context.user_data["jobs"] = response["data"]
-        context.user_data["page"] = response["page"]
-        # Initialize the current index for displaying jobs (start at 0).
-        current_index = 0
-
-        job_text = "No jobs available"
-        try:
-            # Format the first job in the response into an HTML-formatted message.
-            job_text = format_job_message(response["data"][current_index])
-        except KeyError:
-            logger.info(f"No job at index {current_index}")
-        except Exception as e:
-            logger.info("Error getting job from response: %s", e)
+    if selected_site not in SCRAPER_DISPATCHER:
+        await outbound.call(
+            chat_id, lambda: update.effective_message.reply_text("Unknown job site selected.")
+        )
+        return
 
-        # Generate the navigation keyboard for the current job index.
-        keyboard = generate_next_job_position_keyboard(
-            index=current_index, jobs_length=len(response["data"])
+    # Stream the jobs of the first page for the stored query text (served from the cache when possible),
+    # ranked by the skill profile of the chat if it has one.
+    profile = await get_profile(chat_id)
+    local = await answer_locally(selected_site, query_text)
+    if profile:
+        jobs_stream = stream_ranked_jobs(selected_site, query_text, 1, profile, local)
+    else:
+        jobs_stream = stream_jobs(selected_site, query_text, 1, local)
+    first_job_task = asyncio.ensure_future(anext(jobs_stream, None))
+    # Inform the user that the job search is in progress, unless the first job is already there.
+    wait_msg = None
+    done, _ = await asyncio.wait({first_job_task}, timeout=WAIT_MESSAGE_DELAY)
+    if not done:
+        wait_msg = await outbound.call(
+            chat_id,
+            lambda: update.effective_message.reply_text("Wait a moment, please... :)"),
         )
 
-        # Delete the waiting message before sending the results.
-        await wait_msg.delete()
+    try:
+        first_job = await first_job_task
+    except Exception as e:
+        # The site failed, timed out or its circuit is open, and no cached results are left.
+        logger.error("Error searching %s for '%s': %r", selected_site, query_text, e)
+        await jobs_stream.aclose()
+        if wait_msg:
+            outbound.delete_messages(chat_id, [wait_msg.message_id])
+        if isinstance(e, CircuitOpenError):
+            text = f"{selected_site.capitalize()} is not responding right now, please try again in a minute."
+        else:
+            text = f"Could not get jobs from {selected_site.capitalize()}, please try again."
+        await outbound.call(chat_id, lambda: update.effective_message.reply_text(text))
+        return
+    # Save the first job (as an id into the shared job store) and start browsing the results.
+    set_session_jobs(context.user_data, [first_job] if first_job is not None else [])
+    session_jobs = context.user_data["jobs"]
+    start_window(context.user_data, profile, local)
+    # Initialize the current index for displaying jobs (start at 0).
+    current_index = 0
+
+    filtered_out = False
+    if first_job is None:
+        # The first page is complete and empty. With a profile its jobs may all have been
+        # excluded: look for the first matching job on the next pages (a bounded number).
+        finish_first_page(context.user_data, selected_site, query_text)
+        if profile:
+            try:
+                await move_window(context.user_data, selected_site, query_text, current_index)
+            except FilteredOutError:
+                filtered_out = True
+            except Exception as e:
+                logger.error("Error loading jobs for '%s': %s", query_text, e)
 
-        # Build the final message with a header and the formatted job details.
-        final_message = f"<b>Results from {selected_site.capitalize()}:</b>\n{job_text}"
-        # Split the final message into chunks if it exceeds Telegram's character limit.
-        chunks = split_message(final_message)
+    # Build the final message with a header and the formatted job details,
+    # split into chunks if it exceeds Telegram's character limit.
+    chunks = None
+    truncated = False
+    first_id = job_id_at(context.user_data, current_index)
+    try:
+        if first_id is not None:
+            # Render the first job (served from the render cache when possible).
+            first = job_store.get(first_id)
+            chunks = render_job_chunks(first, selected_site)
+            truncated = first.truncated
+        else:
+            logger.info(f"No job at index {current_index}")
+    except Exception as e:
+        logger.info("Error getting job from response: %s", e)
+    if chunks is None:
+        if filtered_out:
+            text = "No jobs left after your excluded keywords. Change them with /exclude."
+        else:
+            text = "No jobs available"
+        chunks = split_message(f"<b>Results from {selected_site.capitalize()}:</b>\n{text}")
+
+    # Generate the navigation keyboard for the current job index.
+    keyboard = generate_next_job_position_keyboard(
+        index=current_index,
+        has_next=first_id is not None and has_next(context.user_data, current_index),
+        truncated=truncated,
+    )
 
-        # Send the first chunk along with the navigation keyboard.
-        await update.effective_message.reply_html(chunks[0], reply_markup=keyboard)
-        # Send any additional chunks as separate messages (without keyboard).
-        for chunk in chunks[1:]:
-            await context.bot.send_message(
-                chat_id=update.effective_message.chat.id, text=chunk, parse_mode="HTML"
-            )
+    # Delete the waiting message before sending the results (queued before them, so it goes first).
+    if wait_msg:
+        outbound.delete_messages(chat_id, [wait_msg.message_id])
+
+    # Send the first chunk along with the navigation keyboard.
+    await outbound.call(
+        chat_id,
+        lambda: update.effective_message.reply_html(chunks[0], reply_markup=keyboard),
+    )
+    # Send any additional chunks as separate messages (without keyboard),
+    # and store their message IDs so navigation can delete them.
+    sent_msgs = await asyncio.gather(
+        *(outbound.send_message(chat_id, chunk, parse_mode="HTML") for chunk in chunks[1:])
+    )
+    context.user_data["extra_chunks_ids"] = [msg.message_id for msg in sent_msgs]
+
+    # The stream ended with the first page, which was recorded above.
+    if first_job is None:
+        return
+    # Append the rest of the jobs to the session as they arrive, in the background:
+    # the next updates of this chat (e.g. "Next") are handled meanwhile.
+    context.user_data["streaming"] = True
+    # Set on each streamed job and when streaming ends, for "Next" waiting on a job.
+    streamed = context.user_data["streamed"] = asyncio.Event()
+    context.application.create_task(
+        finish_streaming(
+            context,
+            jobs_stream,
+            session_jobs,
+            streamed,
+            update.effective_user.id,
+            selected_site,
+            query_text,
+            local,
+        ),
+        update=update,
+    )
+
+
+async def finish_streaming(
+    context: ContextTypes.DEFAULT_TYPE,
+    jobs_stream,
+    session_jobs,
+    streamed: asyncio.Event,
+    user_id: int,
+    selected_site: str,
+    query_text: str,
+    local: bool,
+) -> None:
+    """Append the remaining streamed jobs of the first page to the session."""
+    try:
+        async for job in jobs_stream:
+            # Stop if the user started a new search in the meantime.
+            if not append_session_jobs(context.user_data, session_jobs, [job]):
+                break
+            streamed.set()
+    except Exception as e:
+        # Keep the jobs received so far; the user can still browse them.
+        logger.error("Error streaming jobs for '%s': %s", query_text, e)
+    finally:
+        await jobs_stream.aclose()
+        if context.user_data.get("jobs") is session_jobs:
+            finish_first_page(context.user_data, selected_site, query_text)
+            context.user_data["streaming"] = False
+        streamed.set()
+
+    # Start loading the next page in the background if this page is short
+    # (the job index answers at once: nothing to prefetch for local sessions).
+    if not local:
+        prefetcher.maybe_prefetch(user_id, selected_site, query_text, 1, 0, len(session_jobs))
+
+
+async def wait_for_streamed_job(context: ContextTypes.DEFAULT_TYPE, index: int) -> None:
+    """Wait (up to STREAM_WAIT_TIMEOUT seconds) until the job at index arrives or streaming ends."""
+    user_data = context.user_data
+    try:
+        async with asyncio.timeout(STREAM_WAIT_TIMEOUT):
+            while user_data.get("streaming") and index >= len(user_data.get("jobs", [])):
+                streamed = user_data["streamed"]
+                streamed.clear()
+                await streamed.wait()
+    except TimeoutError:
+        pass
 
 
 # Callback handler for navigating between job positions.
@@ -120,81 +294,148 @@ async def handle_jobs_positions_keyboard_callback(
 ) -> None:
     query = update.callback_query
     await query.answer()  # Acknowledge the callback query
+    chat_id = query.message.chat.id
 
-    # Delete previously sent extra message chunks (if any).
-    extra_chunks = context.user_data.get("extra_chunks_ids", [])
-    for msg_id in extra_chunks:
+    try:
+        # Parse the new job position from the callback data.
+        new_index = int(query.data)
+    except ValueError:
+        await outbound.call(
+            chat_id, lambda: query.edit_message_text(text="Invalid navigation data!")
+        )
+        return
+
+    # Check that the session is browsing results (its window may be empty after a restore).
+    if "jobs" not in context.user_data:
+        await outbound.call(
+            chat_id, lambda: query.edit_message_text(text="No jobs data available!")
+        )
+        return
+    touch_session(context.user_data)
+    selected_site = context.user_data.get("selected_site", "")
+    query_text = context.user_data.get("query", "")
+
+    # The job may still be on its way if the first page is being streamed.
+    await wait_for_streamed_job(context, new_index)
+
+    # Bring the job into the session window: pages before or after it are loaded
+    # from the shared page cache, so moving across pages does not start a new search.
+    try:
+        moved = await move_window(context.user_data, selected_site, query_text, new_index)
+    except FilteredOutError as e:
+        # Keep the current job; the next press goes on from the pages already loaded.
+        await outbound.send_message(
+            chat_id,
+            f"No jobs left after your excluded keywords on the next {e.pages} pages. "
+            "Press Next to keep looking, or change them with /exclude.",
+        )
+        return
+    except Exception as e:
+        logger.error("Error loading jobs at position %s: %s", new_index, e)
+        return
+    if not moved:
+        # There is no job there (end of the results): stay on the current job.
+        current_index = new_index - 1
         try:
-            await context.bot.delete_message(
-                chat_id=query.message.chat.id, message_id=msg_id
+            await outbound.call(
+                chat_id,
+                lambda: query.edit_message_reply_markup(
+                    reply_markup=job_keyboard(context.user_data, current_index)
+                ),
             )
         except Exception as e:
-            logger.error("Error deleting extra message %s: %s", msg_id, e)
-    # Clear the stored extra message IDs.
-    context.user_data["extra_chunks_ids"] = []
+            logger.info("Navigation keyboard not updated: %s", e)
+        return
+
+    # Start loading the next page in the background when the user gets close to the end.
+    jobs = context.user_data["jobs"]
+    if not context.user_data.get("local"):
+        prefetcher.maybe_prefetch(
+            update.effective_user.id,
+            selected_site,
+            query_text,
+            last_window_page(context.user_data),
+            new_index - context.user_data["window_offset"],
+            len(jobs),
+        )
+
+    await show_job(query, context, chat_id, new_index)
+
+
+# Callback handler for the "Full description" button of a job whose description was truncated.
+# The full text is fetched from the API and the job message is shown again with it.
+async def handle_full_description_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    query = update.callback_query
+    chat_id = query.message.chat.id
 
     try:
-        # Parse the new job index from the callback data.
-        new_index = int(query.data)
+        index = int(query.data.split(":", 1)[1])
     except ValueError:
-        await query.edit_message_text(text="Invalid navigation data!")
+        await query.answer()
         return
 
-    # Retrieve the accumulated jobs array from user_data.
-    jobs = context.user_data.get("jobs", [])
-    if not jobs:
-        await query.edit_message_text(text="No jobs data available!")
+    job_id = job_id_at(context.user_data, index)
+    if job_id is None:
+        await query.answer(text="This job is no longer in your results.")
         return
+    touch_session(context.user_data)
+    job = job_store.get(job_id)
 
-    # Check if the new index is within the current jobs array.
-    if new_index < 0 or new_index >= len(jobs):
-        # If out-of-bounds, delete the current message and fetch the next page.
+    if job.truncated:
         try:
-            await query.delete_message()
+            found = await fetch_full_description(context.user_data.get("selected_site", ""), job)
         except Exception as e:
-            logger.error("Error deleting main message: %s", e)
+            logger.error("Error fetching the description of %s: %s", job.href, e)
+            found = False
+        if not found:
+            await query.answer(text="The full description is not available, open the job link.")
+            return
+    await query.answer()
+    await show_job(query, context, chat_id, index)
 
-        extra_chunks = context.user_data.get("extra_chunks_ids", [])
-        for msg_id in extra_chunks:
-            try:
-                await context.bot.delete_message(
-                    chat_id=query.message.chat.id, message_id=msg_id
-                )
-            except Exception as e:
-                logger.error("Error deleting extra message %s: %s", msg_id, e)
-        context.user_data["extra_chunks_ids"] = []
 
-        # Increment the page number to fetch new jobs.
-        next_page = context.user_data["page"] + 1
-        await message_query_handler(update, context, next_page)
-        return
+async def show_job(query, context: ContextTypes.DEFAULT_TYPE, chat_id: int, index: int) -> None:
+    """Show the job at the position (in the session window) in the message of the callback query."""
+    # Delete previously sent extra message chunks (if any), all in one queued request.
+    extra_chunks = context.user_data.get("extra_chunks_ids", [])
+    if extra_chunks:
+        try:
+            await outbound.delete_messages(chat_id, extra_chunks)
+        except Exception as e:
+            logger.error("Error deleting extra messages %s: %s", extra_chunks, e)
+    # Clear the stored extra message IDs.
+    context.user_data["extra_chunks_ids"] = []
 
-    # Format the job message for the new index.
-    job_text = format_job_message(jobs[new_index])
-    # Generate an updated navigation keyboard using the new index.
-    new_keyboard = generate_next_job_position_keyboard(new_index, jobs_length=len(jobs))
-    # Build the final message with header and job details.
-    final_message = f"<b>Results from {context.user_data.get('selected_site', 'Unknown').capitalize()}:</b>\n{job_text}"
-    # Split the message into chunks if necessary.
-    chunks = split_message(final_message)
+    # Get the job message for the index, already split into chunks (rendered once per job).
+    chunks = render_job_chunks(
+        job_store.get(job_id_at(context.user_data, index)),
+        context.user_data.get("selected_site") or "Unknown",
+    )
+    # Generate an updated navigation keyboard using the index.
+    new_keyboard = job_keyboard(context.user_data, index)
 
     try:
         # Edit the original message with the first chunk and updated keyboard.
-        await query.edit_message_text(
-            text=chunks[0], parse_mode="HTML", reply_markup=new_keyboard
+        await outbound.call(
+            chat_id,
+            lambda: query.edit_message_text(
+                text=chunks[0], parse_mode="HTML", reply_markup=new_keyboard
+            ),
         )
         # For any additional chunks, send them as new messages and store their message IDs.
-        extra_ids = []
-        for chunk in chunks[1:]:
-            sent_msg = await context.bot.send_message(
-                chat_id=query.message.chat.id, text=chunk, parse_mode="HTML"
-            )
-            extra_ids.append(sent_msg.message_id)
-        context.user_data["extra_chunks_ids"] = extra_ids
+        sent_msgs = await asyncio.gather(
+            *(outbound.send_message(chat_id, chunk, parse_mode="HTML") for chunk in chunks[1:])
+        )
+        context.user_data["extra_chunks_ids"] = [msg.message_id for msg in sent_msgs]
     except Exception as e:
         logger.error("Error editing message: %s", e)
-        await query.edit_message_text(
-            text="An error occurred while updating the message."
+        await outbound.call(
+            chat_id,
+            lambda: query.edit_message_text(
+                text="An error occurred while updating the message."
+            ),
         )
 
 
@@ -258,11 +499,12 @@ async def handle_jobs_sites_keyboard_callback(
         # Extract the site name from the callback data and store it in user_data.
         selected_site = data.split(" ")[1].lower()
         context.user_data["selected_site"] = selected_site
+        touch_session(context.user_data)
         logger.info(f"User selected job site: {selected_site}")
         # Send a message confirming the selected job site.
-        await context.bot.send_message(
-            chat_id=query.message.chat.id,
-            text=f"Job site <b><i>{selected_site}</i></b> selected. Now, type your query for a job search.",
+        await outbound.send_message(
+            query.message.chat.id,
+            f"Job site <b><i>{selected_site}</i></b> selected. Now, type your query for a job search.",
             parse_mode="HTML",
         )
     elif data.startswith("page: "):
@@ -274,11 +516,12 @@ async def handle_jobs_sites_keyboard_callback(
 
         # Generate a new keyboard for the next page of job sites.
         new_keyboard = generate_jobs_sites_keyboard(job_sites, new_page)
-        await query.edit_message_reply_markup(reply_markup=new_keyboard)
+        await outbound.call(
+            query.message.chat.id,
+            lambda: query.edit_message_reply_markup(reply_markup=new_keyboard),
+        )
     elif data == "page_info":
         # This button is informational; acknowledge it without any further action.
         await query.answer(text="This is the page information.", show_alert=False)
     else:
-        await context.bot.send_message(
-            chat_id=query.message.chat.id, text="Unrecognized action!"
-        )
+        await outbound.send_message(query.message.chat.id, "Unrecognized action!")
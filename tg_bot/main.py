@@ -1,44 +1,142 @@
+import asyncio
 import os
 from dotenv import load_dotenv  # Loads environment variables from a .env file
-from telegram import (  # type: ignore  # Import Telegram classes
-    Update,  # Represents an incoming update (message, callback, etc.)
-)
-from telegram.ext import (  # type: ignore  # Import extension modules for handling commands, messages, and callbacks
-    Application,
-    CommandHandler,
-    MessageHandler,
-    filters,
-    CallbackQueryHandler,
-)
-
-# Import custom modules: commands and keyboard handling functions.
-# 'start', 'help_command', 'commands', 'jobs', and 'exit_command' are defined in commands.py
-# 'handle_jobs_sites_keyboard_callback', 'message_query_handler', and 'handle_jobs_positions_keyboard_callback'
-# are defined in keyboard_handle.py and manage inline keyboard interactions.
-from commands import start, help_command, commands, jobs, exit_command
-from keyboard_handle import (
-    handle_jobs_sites_keyboard_callback,  # Handles callbacks for job site selection and pagination.
-    message_query_handler,  # Handles incoming text messages (job queries).
-    handle_jobs_positions_keyboard_callback,  # Handles callbacks for navigating job positions.
-)
 
 # Load environment variables from the .env file.
+# Done before importing the bot modules, which read their settings at import time.
 load_dotenv()
+
+from logger import logger  # Custom logger module for logging information and errors
+
 # Retrieve the bot token from environment variables.
 BOT_API = os.getenv("TG_BOT")
+# "polling" (one process) or "webhook" (a router and BOT_WORKERS worker processes).
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Update types the bot handles (Update.MESSAGE and Update.CALLBACK_QUERY); Telegram does not
+# send the others at all. Plain strings, so that importing this module does not load telegram.
+ALLOWED_UPDATES = ["message", "callback_query"]
+# Startup-optimized mode: serve updates as soon as possible and do the rest in the background
+# (sessions loaded on the first update of their user, bot commands registered after startup,
+# first job index pruning delayed).
+FAST_START = os.getenv("FAST_START", "0") == "1"
+# Seconds before the first job index pruning in fast start mode.
+FAST_START_PRUNE_DELAY = 600
+
+
+def build_application(workers: int = 1, index: int = 0, webhook: bool = False):
+    """
+    Build the bot application of worker `index` out of `workers` (0 of 1 in polling mode).
+    In webhook mode the application has no updater: the worker feeds it the updates.
+    """
+    # Imported here: the webhook router process only forwards updates and needs none of them.
+    from telegram.ext import (  # type: ignore  # Import extension modules for handling commands, messages, and callbacks
+        Application,
+        CommandHandler,
+        MessageHandler,
+        filters,
+        CallbackQueryHandler,
+    )
 
+    # Import custom modules: commands and keyboard handling functions.
+    # 'start', 'help_command', 'commands', 'jobs', and 'exit_command' are defined in commands.py
+    # 'handle_jobs_sites_keyboard_callback', 'message_query_handler', and 'handle_jobs_positions_keyboard_callback'
+    # are defined in keyboard_handle.py and manage inline keyboard interactions.
+    from commands import start, help_command, commands, jobs, exit_command
+    from keyboard_handle import (
+        handle_jobs_sites_keyboard_callback,  # Handles callbacks for job site selection and pagination.
+        message_query_handler,  # Handles incoming text messages (job queries).
+        handle_jobs_positions_keyboard_callback,  # Handles callbacks for navigating job positions.
+        handle_full_description_callback,  # Handles the "Full description" button of a job.
+    )
+    from alerts import (
+        alert_command,  # Handles the /alert command (save the last search as an alert).
+        alerts_command,  # Handles the /alerts command (list saved alerts).
+        unalert_command,  # Handles the /unalert command (remove a saved alert).
+        run_alerts,  # Job queue callback re-running saved searches.
+        ALERTS_INTERVAL,  # Interval of the saved searches re-run.
+    )
+    from profiles import (
+        skills_command,  # Handles the /skills command (skills ranking the results).
+        exclude_command,  # Handles the /exclude command (keywords hiding jobs).
+    )
+    from http_client import start_http_client, close_http_client  # Shared pooled HTTP client
+    from job_index import prune_job_index  # Job queue callback deleting old indexed jobs
+    from send_queue import outbound  # Rate-limited queue for outbound Telegram requests
+    from job_store import (
+        evict_idle_sessions,  # Job queue callback clearing idle sessions
+        SESSION_EVICT_INTERVAL,  # Interval of the idle session check
+    )
+    from session_store import create_persistence  # Sessions stored in SQLite (if enabled)
+    from update_processor import ChatOrderedUpdateProcessor  # Concurrent, per-chat ordered updates
+    from metrics import registry, start_metrics, stop_metrics, set_ready  # Metrics, probes, profiler
 
-def main() -> None:
-    """Start the Telegram bot application."""
+    # Startup work not needed to handle the first update (run in the background in fast start mode).
+    background: set[asyncio.Task] = set()
 
-    # Define an asynchronous post-initialization function to set bot commands.
-    async def post_init(application: Application) -> None:
+    async def warm_up(application: Application) -> None:
         # Set the bot's commands so that they appear when the user types "/"
         await application.bot.set_my_commands(commands)
+        set_ready()
+        logger.info("Bot ready")
+
+    async def warm_up_in_background(application: Application) -> None:
+        try:
+            await warm_up(application)
+        except Exception as e:
+            logger.error("Error warming up the bot: %s", e)
+            # Serving works without the command menu: report ready anyway.
+            set_ready()
+
+    # Define an asynchronous post-initialization function to start the long-lived resources.
+    async def post_init(application: Application) -> None:
+        # Open the shared HTTP client used by every scraper call.
+        await start_http_client()
+        # Start the workers sending queued Telegram requests,
+        # with this process's part of the global send budget.
+        outbound.start(application.bot, share=1 / workers)
+        # Serve the metrics endpoint (and start the profiler) if enabled.
+        await start_metrics(index)
+        if FAST_START:
+            task = asyncio.create_task(warm_up_in_background(application))
+            background.add(task)
+            task.add_done_callback(background.discard)
+        else:
+            await warm_up(application)
+
+    # Define an asynchronous post-shutdown function to release long-lived resources.
+    async def post_shutdown(application: Application) -> None:
+        for task in background:
+            task.cancel()
+        # Close the shared HTTP client and its pooled connections.
+        await close_http_client()
+        # Stop the outbound Telegram queue workers.
+        await outbound.stop()
+        await stop_metrics()
 
     # Create the Application instance and initialize it with the bot's token.
-    # The post_init function is called after the application is built.
-    application = Application.builder().token(BOT_API).post_init(post_init).build()
+    # The post_init function is called after the application is built,
+    # and post_shutdown is called when the application stops.
+    processor = ChatOrderedUpdateProcessor()
+    registry.gauge(
+        "bot_updates_pending", "Updates received and not handled yet", lambda: processor.pending
+    )
+
+    builder = (
+        Application.builder()
+        .token(BOT_API)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        # Handle updates of different chats concurrently, keeping the order within a chat.
+        .concurrent_updates(processor)
+    )
+    # Keep the sessions in the session store, so they survive restarts and
+    # each worker loads only the sessions of its own users.
+    persistence = create_persistence(workers, index, lazy=FAST_START)
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Register a command handler for the /start command.
     application.add_handler(CommandHandler("start", start))
@@ -60,6 +158,15 @@ def main() -> None:
     # Register a command handler for the /exit command.
     application.add_handler(CommandHandler("exit", exit_command))
 
+    # Register command handlers for saved search alerts (/alert, /alerts, /unalert).
+    application.add_handler(CommandHandler("alert", alert_command))
+    application.add_handler(CommandHandler("alerts", alerts_command))
+    application.add_handler(CommandHandler("unalert", unalert_command))
+
+    # Register command handlers for the skill profile (/skills, /exclude).
+    application.add_handler(CommandHandler("skills", skills_command))
+    application.add_handler(CommandHandler("exclude", exclude_command))
+
     # Register a message handler to process text messages that are not commands.
     # This is used for job search queries.
     application.add_handler(
@@ -73,8 +180,59 @@ def main() -> None:
         CallbackQueryHandler(handle_jobs_positions_keyboard_callback, pattern=r"^\d+$")
     )
 
+    # Register a callback query handler for the "Full description" button ("full:<index>").
+    application.add_handler(
+        CallbackQueryHandler(handle_full_description_callback, pattern=r"^full:\d+$")
+    )
+
+    # Periodically evict idle sessions so their jobs are released from the shared store,
+    # and re-run saved searches to push new jobs to their subscribers.
+    # The job queue is only available with the "python-telegram-bot[job-queue]" extra.
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(
+            evict_idle_sessions, interval=SESSION_EVICT_INTERVAL
+        )
+        # Alerts and the job index are shared by all workers: only the first one runs them.
+        if index == 0:
+            application.job_queue.run_repeating(
+                run_alerts, interval=ALERTS_INTERVAL, first=ALERTS_INTERVAL
+            )
+            # Delete old jobs from the persistent job index once a day
+            # (not right at startup in fast start mode, when the first searches come in).
+            application.job_queue.run_repeating(
+                prune_job_index,
+                interval=24 * 3600,
+                first=FAST_START_PRUNE_DELAY if FAST_START else None,
+            )
+    else:
+        logger.warning(
+            "Job queue is not available, idle sessions will not be evicted "
+            "and alerts will not be sent"
+        )
+
+    return application
+
+
+def run_worker(index: int, workers: int) -> None:
+    """Entry point of a webhook worker process (started by the webhook router)."""
+    # Imported here: the webhook mode needs tornado ("python-telegram-bot[webhooks]").
+    from webhook import run_webhook_worker
+
+    run_webhook_worker(build_application(workers, index, webhook=True), index)
+
+
+def main() -> None:
+    """Start the Telegram bot application."""
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook_router
+
+        # Route the updates to worker processes, partitioned by user id.
+        run_webhook_router(BOT_API, run_worker, ALLOWED_UPDATES)
+        return
+
     # Start the bot and begin polling for updates.
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application = build_application()
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+
+# Port of the local metrics endpoint (GET /metrics, GET /profile, GET /live, GET /ready); 0 disables it.
+# In webhook mode worker i listens on METRICS_PORT + i.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Address of the metrics endpoint.
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+# Seconds between two samples of the sampling profiler; 0 disables it.
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0"))
+
+# Histogram buckets in seconds, from a cached render to a slow scrape.
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# The profiler keeps at most this many distinct stacks.
+_MAX_STACKS = 10000
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values) if value != ""]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label values tuple."""
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        # label values -> [bucket counts..., sum, count]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(_BUCKETS) + 2)
+        for i, bound in enumerate(_BUCKETS):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, lines: list[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(_BUCKETS, series):
+                le = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            le = _format_labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            plain = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{plain} {series[-1]}")
+
+
+class Registry:
+    """Histograms observed by the code, and gauges/counters read from callbacks when scraped."""
+
+    def __init__(self) -> None:
+        self._histograms: list[Histogram] = []
+        self._callbacks: list[tuple[str, str, str, Callable[[], float]]] = []
+
+    def histogram(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Histogram:
+        histogram = Histogram(name, help, label_names)
+        self._histograms.append(histogram)
+        return histogram
+
+    def gauge(self, name: str, help: str, func: Callable[[], float], type: str = "gauge") -> None:
+        """Register a value read by calling func() at every scrape (type "gauge" or "counter")."""
+        self._callbacks.append((name, help, type, func))
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text format."""
+        lines: list[str] = []
+        for histogram in self._histograms:
+            histogram.render(lines)
+        for name, help, type, func in self._callbacks:
+            try:
+                value = func()
+            except Exception as e:
+                logger.error("Error reading metric %s: %s", name, e)
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# The registry shared by every module.
+registry = Registry()
+
+# Time spent in each stage of the query pipeline.
+STAGE_SECONDS = registry.histogram(
+    "bot_stage_seconds", "Time spent in each stage of the query pipeline", ("stage", "site")
+)
+
+
+@contextmanager
+def span(stage: str, site: str = ""):
+    """Time the enclosed block (sync or async code) as one observation of the stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, (stage, site))
+
+
+def observe(stage: str, seconds: float, site: str = "") -> None:
+    """Record a duration measured elsewhere (e.g. reported by the API)."""
+    STAGE_SECONDS.observe(seconds, (stage, site))
+
+
+def observe_server_timing(header: str | None, site: str) -> None:
+    """
+    Record the stages reported by an API in a Server-Timing header
+    (e.g. "queue;dur=12.5, goto;dur=830") as "api_<name>" stages.
+    """
+    if not header:
+        return
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    observe(f"api_{name}", float(value) / 1000, site)
+                except ValueError:
+                    pass
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the event loop thread every PROFILE_INTERVAL seconds from a
+    background thread. The counts are served in the collapsed format of flame graph tools
+    ("module:function;module:function count" per line) on GET /profile.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        # Guards samples, updated by the sampling thread while the event loop renders them.
+        self._lock = threading.Lock()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            with self._lock:
+                if key in self.samples or len(self.samples) < _MAX_STACKS:
+                    self.samples[key] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            samples = self.samples.copy()
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+_server: asyncio.AbstractServer | None = None
+_profiler: SamplingProfiler | None = None
+# Set once the bot finished starting (see main.py); /live only tells that the process answers.
+_ready = False
+
+
+def set_ready(ready: bool = True) -> None:
+    """Report the bot as ready to serve (or not anymore) on GET /ready."""
+    global _ready
+    _ready = ready
+
+
+def is_ready() -> bool:
+    """Return True once the bot finished starting."""
+    return _ready
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # Minimal HTTP/1.0 server: read the request line, skip the headers, answer and close.
+    # GET /live and GET /ready are the liveness and readiness probes of the process.
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1] if len(parts) > 1 else ""
+        if path == "/metrics":
+            status, body = "200 OK", registry.render()
+        elif path == "/profile" and _profiler is not None:
+            status, body = "200 OK", _profiler.render()
+        elif path == "/live":
+            status, body = "200 OK", "ok\n"
+        elif path == "/ready":
+            status, body = ("200 OK", "ready\n") if _ready else ("503 Service Unavailable", "starting\n")
+        else:
+            status, body = "404 Not Found", "not found\n"
+        data = body.encode()
+        writer.write(
+            f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode()
+            + data
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.error("Error serving metrics: %s", e)
+    finally:
+        writer.close()
+
+
+async def start_metrics(index: int = 0) -> None:
+    """
+    Start the metrics endpoint and the profiler, if enabled.
+    Called from the Application post_init hook in main.py (`index`: webhook worker number).
+    """
+    global _server, _profiler
+    if PROFILE_INTERVAL > 0:
+        _profiler = SamplingProfiler(PROFILE_INTERVAL)
+        _profiler.start()
+    if METRICS_PORT:
+        _server = await asyncio.start_server(_handle, METRICS_LISTEN, METRICS_PORT + index)
+        logger.info("Metrics endpoint listening on port %s", METRICS_PORT + index)
+
+
+async def stop_metrics() -> None:
+    """Stop the metrics endpoint and the profiler. Called from the post_shutdown hook."""
+    global _server, _profiler
+    set_ready(False)
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
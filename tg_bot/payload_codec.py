@@ -0,0 +1,81 @@
+import json
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from job_store import JOB_FIELDS, Job  # Compact job record and the field order of job rows
+
+# Faster JSON decoding with the optional "orjson" package, falling back to the standard library.
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+    logger.info("Package 'orjson' is not installed, using the json module")
+
+# msgpack responses are asked for only when the optional "msgpack" package is installed.
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+# Accept header of the jobs API requests: msgpack first when it can be decoded.
+ACCEPT = "application/msgpack, application/json;q=0.9" if msgpack else "application/json"
+
+
+def loads(data: bytes | str):
+    """Decode a JSON document."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _encode_default(value):
+    # Job records are encoded as rows (see decode_job).
+    if isinstance(value, Job):
+        return value.to_row()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def dumps(value) -> bytes:
+    """Encode a value as JSON bytes; job records are encoded as rows."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_encode_default)
+    return json.dumps(value, separators=(",", ":"), default=_encode_default).encode()
+
+
+def decode_body(content: bytes, content_type: str | None):
+    """Decode a jobs API response body, JSON or msgpack depending on its Content-Type."""
+    if content_type and content_type.startswith("application/msgpack"):
+        if msgpack is None:
+            raise RuntimeError("msgpack response received but the 'msgpack' package is missing")
+        return msgpack.unpackb(content)
+    return loads(content)
+
+
+def decode_job(item, fields=JOB_FIELDS) -> Job:
+    """
+    Build a job record from a decoded job: a row with the given fields, or an object.
+    Rows with the fields in JOB_FIELDS order (what the bot asks for) are read by position.
+    """
+    if isinstance(item, dict):
+        return Job.from_dict(0, item)
+    if fields is JOB_FIELDS:
+        return Job.from_row(item)
+    return Job.from_dict(0, dict(zip(fields, item)))
+
+
+def row_fields(fields: list[str]):
+    """Return JOB_FIELDS itself if the rows have that layout (the fast path of decode_job)."""
+    return JOB_FIELDS if tuple(fields) in (JOB_FIELDS, JOB_FIELDS[:-1]) else fields
+
+
+def decode_jobs(payload) -> list[Job]:
+    """
+    Return the job records of a decoded page: either an array of job objects
+    or the compact format {"fields": [...], "jobs": [[...], ...]}.
+    """
+    if isinstance(payload, dict):
+        fields = row_fields(payload["fields"])
+        if fields is JOB_FIELDS:
+            return [Job.from_row(row) for row in payload["jobs"]]
+        return [decode_job(row, fields) for row in payload["jobs"]]
+    return [Job.from_dict(0, job) for job in payload]
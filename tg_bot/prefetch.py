@@ -0,0 +1,97 @@
+import asyncio
+import os
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from scraper_service import fetch_jobs  # Cached entry point to the scrapers
+from metrics import registry  # Metrics registry
+
+# Start prefetching the next page when the user is within this many jobs of the end.
+PREFETCH_DISTANCE = int(os.getenv("PREFETCH_DISTANCE", "3"))
+# Maximum number of prefetches running at the same time for all users together.
+PREFETCH_MAX_GLOBAL = int(os.getenv("PREFETCH_MAX_GLOBAL", "20"))
+# Maximum number of prefetches running at the same time for a single user.
+PREFETCH_MAX_PER_USER = int(os.getenv("PREFETCH_MAX_PER_USER", "1"))
+
+
+class Prefetcher:
+    """
+    Fetch the next results page in the background while the user is still browsing.
+
+    The fetched page lands in the query cache (and joins an identical scrape already
+    running through single-flight), so pressing "Next" past the last job is served instantly.
+    Prefetches over the per-user or global budget are skipped rather than queued.
+    """
+
+    def __init__(
+        self,
+        distance: int = PREFETCH_DISTANCE,
+        max_global: int = PREFETCH_MAX_GLOBAL,
+        max_per_user: int = PREFETCH_MAX_PER_USER,
+    ) -> None:
+        self.distance = distance
+        self.max_global = max_global
+        self.max_per_user = max_per_user
+        # Running prefetch tasks per user, keyed by (site, query, page).
+        self._tasks: dict[int, dict[tuple, asyncio.Task]] = {}
+        self._active = 0
+
+    def maybe_prefetch(
+        self,
+        user_id: int,
+        site: str,
+        query: str,
+        page: int,
+        index: int,
+        jobs_length: int,
+    ) -> None:
+        """
+        Start fetching page + 1 if the user at `index` is close to the end of the current page.
+        Does nothing when the budget is exhausted or the page is already being prefetched.
+        """
+        if jobs_length - 1 - index >= self.distance:
+            return
+
+        key = (site, query, page + 1)
+        # The user entry is created only when a task starts (and removed by _finish).
+        user_tasks = self._tasks.get(user_id, {})
+        if key in user_tasks:
+            return
+        if len(user_tasks) >= self.max_per_user or self._active >= self.max_global:
+            logger.info("Prefetch budget exhausted, skipping %s for user %s", key, user_id)
+            return
+
+        task = asyncio.create_task(self._run(site, query, page + 1))
+        self._tasks.setdefault(user_id, {})[key] = task
+        self._active += 1
+        task.add_done_callback(lambda _: self._finish(user_id, key, task))
+
+    async def _run(self, site: str, query: str, page: int) -> None:
+        try:
+            await fetch_jobs(site, query, page)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failed prefetch is not an error for the user; the page is fetched again on demand.
+            logger.info("Prefetch of %s page %s failed: %s", site, page, e)
+
+    def _finish(self, user_id: int, key: tuple, task: asyncio.Task) -> None:
+        self._active -= 1
+        user_tasks = self._tasks.get(user_id)
+        if user_tasks is not None and user_tasks.get(key) is task:
+            del user_tasks[key]
+            if not user_tasks:
+                del self._tasks[user_id]
+
+    def cancel(self, user_id: int) -> None:
+        """Cancel every running prefetch of the user (new query or /exit)."""
+        for task in list(self._tasks.get(user_id, {}).values()):
+            task.cancel()
+
+    def __len__(self) -> int:
+        return self._active
+
+
+# The prefetcher shared by all handlers.
+prefetcher = Prefetcher()
+registry.gauge("bot_prefetch_active", "Prefetches running", lambda: len(prefetcher))
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+
+from telegram import Update  # type: ignore
+from telegram.ext import ContextTypes  # type: ignore
+
+# MY MODULES
+from job_matcher import Profile, normalize_keyword  # Skill profile and keyword normalization
+from sqlite_db import LazyConnection  # Lock-guarded SQLite connection opened on first use
+from send_queue import outbound  # Rate-limited queue for outbound Telegram requests
+
+# SQLite file holding the skill profiles of the chats.
+PROFILES_DB_PATH = os.getenv("PROFILES_DB_PATH", "profiles.db")
+# Maximum number of skills, and of excluded keywords, per profile.
+PROFILE_MAX_KEYWORDS = int(os.getenv("PROFILE_MAX_KEYWORDS", "30"))
+# Number of profiles (empty ones included) kept in memory, least recently used evicted first.
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+# Skills and excluded keywords of a chat, as JSON lists.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    chat_id INTEGER PRIMARY KEY,
+    skills TEXT NOT NULL,
+    excluded TEXT NOT NULL
+);
+"""
+
+
+class ProfileStore:
+    """
+    Skill profiles (skills and excluded keywords) of the chats, persisted in SQLite.
+
+    The most recently read profiles (up to cache_size) are cached in memory. Updates are
+    routed to a worker by user id (see webhook.py), which is the chat id in private chats:
+    there, the process updating a profile is the only one reading it.
+    """
+
+    def __init__(self, path: str = PROFILES_DB_PATH, cache_size: int = PROFILE_CACHE_SIZE) -> None:
+        # The cache is guarded by the lock of the connection.
+        self._sql = LazyConnection(path, _SCHEMA)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[int, Profile] = OrderedDict()
+
+    def get(self, chat_id: int) -> Profile:
+        """Return the profile of the chat (empty if it has none)."""
+        with self._sql as db:
+            profile = self._cache.get(chat_id)
+            if profile is not None:
+                self._cache.move_to_end(chat_id)
+                return profile
+            profile = self._read(db, [chat_id]).get(chat_id, Profile())
+            self._remember(chat_id, profile)
+        return profile
+
+    def _remember(self, chat_id: int, profile: Profile) -> None:
+        # Cache the profile, evicting the least recently used ones beyond cache_size.
+        # Called with the lock held.
+        self._cache[chat_id] = profile
+        self._cache.move_to_end(chat_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_many(self, chat_ids: list[int]) -> dict[int, Profile]:
+        """Return the profiles of the chats that have one, read from the database."""
+        with self._sql as db:
+            return self._read(db, chat_ids)
+
+    def _read(self, db: sqlite3.Connection, chat_ids: list[int]) -> dict[int, Profile]:
+        profiles = {}
+        # Stay below SQLite's limit on the number of query parameters.
+        for i in range(0, len(chat_ids), 500):
+            chunk = chat_ids[i : i + 500]
+            for chat_id, skills, excluded in db.execute(
+                "SELECT chat_id, skills, excluded FROM profiles"
+                f" WHERE chat_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ):
+                profiles[chat_id] = Profile(tuple(json.loads(skills)), tuple(json.loads(excluded)))
+        return profiles
+
+    def set(self, chat_id: int, profile: Profile) -> None:
+        """Save the profile of the chat (an empty profile deletes it)."""
+        with self._sql as db:
+            if profile:
+                db.execute(
+                    "INSERT OR REPLACE INTO profiles (chat_id, skills, excluded) VALUES (?, ?, ?)",
+                    (chat_id, json.dumps(profile.skills), json.dumps(profile.excluded)),
+                )
+            else:
+                db.execute("DELETE FROM profiles WHERE chat_id = ?", (chat_id,))
+            db.commit()
+            self._remember(chat_id, profile)
+
+
+# The profile store shared by the commands, the search handlers and the alerts.
+profile_store = ProfileStore()
+
+
+async def get_profile(chat_id: int) -> Profile:
+    """Return the profile of the chat without blocking the event loop on a cache miss."""
+    return await asyncio.to_thread(profile_store.get, chat_id)
+
+
+def parse_keywords(args: list[str]) -> tuple[str, ...]:
+    """Turn the command arguments ("python, machine learning, c++") into normalized keywords."""
+    keywords = []
+    for keyword in " ".join(args).split(","):
+        keyword = normalize_keyword(keyword)
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+    return tuple(keywords)
+
+
+async def _update_profile(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    field: str,
+    command: str,
+    label: str,
+    effect: str,
+) -> None:
+    # Shared by /skills and /exclude: show, clear or replace one list of the profile.
+    chat_id = update.effective_chat.id
+    profile = await get_profile(chat_id)
+    if not context.args:
+        current = ", ".join(getattr(profile, field)) or "none"
+        text = (
+            f"Your {label}: {current}\n"
+            f"Set them with /{command} python, django (or clear them with /{command} clear)."
+        )
+        await outbound.call(chat_id, lambda: update.message.reply_text(text))
+        return
+
+    keywords = () if context.args == ["clear"] else parse_keywords(context.args)
+    if len(keywords) > PROFILE_MAX_KEYWORDS:
+        text = f"You can set at most {PROFILE_MAX_KEYWORDS} {label}."
+        await outbound.call(chat_id, lambda: update.message.reply_text(text))
+        return
+    profile = profile._replace(**{field: keywords})
+    await asyncio.to_thread(profile_store.set, chat_id, profile)
+    if keywords:
+        text = f"Your {label}: {', '.join(keywords)}\n{effect}"
+    else:
+        text = f"Your {label} were cleared."
+    await outbound.call(chat_id, lambda: update.message.reply_text(text))
+
+
+async def skills_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handler for the /skills command.
+    Sets the skills of the chat profile (comma-separated); results and alerts are ranked by them.
+    """
+    await _update_profile(
+        update,
+        context,
+        "skills",
+        "skills",
+        "skills",
+        "Jobs matching them come first in your next searches and alerts.",
+    )
+
+
+async def exclude_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handler for the /exclude command.
+    Sets the excluded keywords of the chat profile; jobs containing one are hidden.
+    """
+    await _update_profile(
+        update,
+        context,
+        "excluded",
+        "exclude",
+        "excluded keywords",
+        "Jobs containing them are hidden from your next searches and alerts.",
+    )
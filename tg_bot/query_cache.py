@@ -0,0 +1,275 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from metrics import registry  # Metrics registry
+from payload_codec import decode_job, dumps, loads  # JSON encoding (orjson when installed)
+
+# Default time-to-live (in seconds) of cached results for every site.
+# Can be overridden per site with CACHE_TTL_<SITE> (e.g. CACHE_TTL_UPWORK=600).
+DEFAULT_CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+# Memory budget (in bytes) of the cache; least recently used entries are evicted first.
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Path to the SQLite file; when empty the cache lives only in memory.
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "")
+# Expired results are kept this many more seconds, served only when the site cannot be
+# scraped (see scraper_service.fetch_jobs); 0 drops them once expired.
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "3600"))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so that "Python ", "python" and "PYTHON" share one cache entry.
+    Lowercases the text and collapses all whitespace into single spaces.
+    """
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def make_cache_key(site: str, query: str, page: int) -> str:
+    """Build the cache key from (site, normalized query, page)."""
+    return f"{site}|{normalize_query(query)}|{page}"
+
+
+def site_ttl(site: str) -> float:
+    """Return the TTL in seconds configured for the given site."""
+    return float(os.getenv(f"CACHE_TTL_{site.upper()}", DEFAULT_CACHE_TTL))
+
+
+class MemoryCacheBackend:
+    """
+    In-memory LRU storage bounded by an approximate size in bytes.
+    Each entry is stored as (expires_at, size, value); expired entries stay
+    CACHE_STALE_TTL more seconds for stale reads.
+    """
+
+    # The in-memory backend never blocks, so it is called directly from the event loop.
+    blocking = False
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+
+    def get(self, key: str, now: float, grace: float = 0.0) -> dict | None:
+        # Entries expired less than `grace` seconds ago are still returned.
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at + CACHE_STALE_TTL <= now:
+            # The entry cannot even be served stale; drop it so it does not take part of the budget.
+            self.delete(key)
+            return None
+        if expires_at + grace <= now:
+            return None
+        # Mark the entry as most recently used.
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict, size: int, expires_at: float) -> None:
+        # Entries bigger than the whole budget are never stored.
+        if size > self.max_bytes:
+            return
+        self.delete(key)
+        self._entries[key] = (expires_at, size, value)
+        self.total_bytes += size
+        # Evict least recently used entries until the cache fits its budget again.
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteCacheBackend:
+    """
+    On-disk LRU storage in a SQLite file, so cached results survive bot restarts.
+    Entries are evicted by last access time once the stored payloads exceed max_bytes.
+    """
+
+    # SQLite calls touch the disk, so they are moved off the event loop.
+    blocking = True
+
+    def __init__(self, path: str, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        # The connection is shared by the worker threads, guarded by a lock.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS query_cache_last_access ON query_cache(last_access)"
+        )
+        self._db.commit()
+        self.total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM query_cache"
+        ).fetchone()[0]
+
+    def get(self, key: str, now: float, grace: float = 0.0) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM query_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + CACHE_STALE_TTL <= now:
+                self._delete_locked(key)
+                self._db.commit()
+                return None
+            if row[1] + grace <= now:
+                return None
+            self._db.execute(
+                "UPDATE query_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+        value = loads(row[0])
+        # The job records of the response were stored as rows.
+        value["data"] = [decode_job(job) for job in value["data"]]
+        return value
+
+    def set(self, key: str, value: dict, size: int, expires_at: float) -> None:
+        if size > self.max_bytes:
+            return
+        payload = dumps(value).decode()
+        with self._lock:
+            self._delete_locked(key)
+            self._db.execute(
+                "INSERT INTO query_cache (key, value, size, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, expires_at, time.time()),
+            )
+            self.total_bytes += size
+            # Evict least recently used rows until the stored payloads fit the budget.
+            while self.total_bytes > self.max_bytes:
+                oldest = self._db.execute(
+                    "SELECT key FROM query_cache ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                self._delete_locked(oldest[0])
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._delete_locked(key)
+            self._db.commit()
+
+    def _delete_locked(self, key: str) -> None:
+        row = self._db.execute(
+            "DELETE FROM query_cache WHERE key = ? RETURNING size", (key,)
+        ).fetchone()
+        if row is not None:
+            self.total_bytes -= row[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+
+
+class QueryCache:
+    """
+    Cache of scraper responses keyed by (site, normalized query, page).
+    Keeps hit/miss counters and a per-site TTL on top of a storage backend.
+    """
+
+    def __init__(self, backend: MemoryCacheBackend | SqliteCacheBackend) -> None:
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    async def _call(self, method, *args):
+        # Run blocking backends in a worker thread so the event loop is never stalled.
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def get(self, site: str, query: str, page: int) -> dict | None:
+        """Return the cached response or None, counting the lookup as a hit or a miss."""
+        value = await self._call(
+            self.backend.get, make_cache_key(site, query, page), time.time()
+        )
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_stale(self, site: str, query: str, page: int) -> dict | None:
+        """
+        Return the cached response even if it expired (up to CACHE_STALE_TTL seconds ago),
+        marked with "stale": True; for when the site cannot be scraped.
+        """
+        value = await self._call(
+            self.backend.get, make_cache_key(site, query, page), time.time(), CACHE_STALE_TTL
+        )
+        if value is None:
+            return None
+        self.stale_hits += 1
+        return {**value, "stale": True}
+
+    async def set(self, site: str, query: str, page: int, value: dict) -> None:
+        """Store a scraper response for the TTL configured for the site."""
+        # The JSON length (job records encoded as rows) is a cheap approximation
+        # of the memory the entry takes.
+        size = len(dumps(value))
+        await self._call(
+            self.backend.set,
+            make_cache_key(site, query, page),
+            value,
+            size,
+            time.time() + site_ttl(site),
+        )
+
+    def stats(self) -> dict:
+        """Return the current cache counters."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "stale_hits": self.stale_hits,
+            "entries": len(self.backend),
+            "bytes": self.backend.total_bytes,
+        }
+
+
+def create_query_cache() -> QueryCache:
+    """Create the cache with the backend selected by CACHE_SQLITE_PATH."""
+    if CACHE_SQLITE_PATH:
+        logger.info("Using SQLite query cache at %s", CACHE_SQLITE_PATH)
+        return QueryCache(SqliteCacheBackend(CACHE_SQLITE_PATH))
+    return QueryCache(MemoryCacheBackend())
+
+
+# The cache shared by all handlers.
+query_cache = create_query_cache()
+registry.gauge("bot_cache_hits_total", "Query cache hits", lambda: query_cache.hits, "counter")
+registry.gauge("bot_cache_misses_total", "Query cache misses", lambda: query_cache.misses, "counter")
+registry.gauge(
+    "bot_cache_stale_hits_total",
+    "Expired query cache entries served because a site could not be scraped",
+    lambda: query_cache.stale_hits,
+    "counter",
+)
+registry.gauge("bot_cache_entries", "Entries in the query cache", lambda: len(query_cache.backend))
+registry.gauge("bot_cache_bytes", "Size of the query cache", lambda: query_cache.backend.total_bytes)
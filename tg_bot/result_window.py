@@ -0,0 +1,280 @@
+import os
+from array import array
+from collections import OrderedDict
+
+# MY MODULES
+from job_store import job_store  # Shared store of compact job records
+from metrics import registry  # Metrics registry
+from query_cache import make_cache_key  # Same (site, query, page) keys as the query cache
+from scraper_service import (
+    fetch_jobs,  # Cached entry point to the scrapers
+    search_local,  # Pages of the job index (local-first sessions)
+)
+from jobs_requests import rank_jobs  # Ranking and filtering of a page for a skill profile
+from job_matcher import Profile  # Skill profile of a user
+
+# Number of results pages whose job ids a session keeps; older pages are dropped from the
+# session and reloaded from the page cache when the user navigates back to them.
+SESSION_WINDOW_PAGES = int(os.getenv("SESSION_WINDOW_PAGES", "3"))
+# Number of results pages kept as job id arrays in the shared page cache.
+PAGE_REFS_SIZE = int(os.getenv("PAGE_REFS_SIZE", "5000"))
+# Results pages in a row whose jobs are all hidden by excluded keywords that one navigation
+# loads before it stops (each one may be a live scrape).
+FILTERED_PAGES_MAX = int(os.getenv("FILTERED_PAGES_MAX", "3"))
+
+
+class FilteredOutError(Exception):
+    """Raised when FILTERED_PAGES_MAX pages in a row had all their jobs excluded by the profile."""
+
+    def __init__(self, pages: int) -> None:
+        super().__init__(f"All the jobs of {pages} pages in a row were excluded")
+        self.pages = pages
+
+
+class PageRefs:
+    """
+    Shared LRU cache of results pages stored as arrays of job ids.
+
+    Every cached page holds one job store reference per job, so the jobs of a page
+    stay in the store (deduplicated with every session) until the page is evicted.
+    A page costs a few bytes per job, much less than its cached response.
+    """
+
+    def __init__(self, max_pages: int = PAGE_REFS_SIZE) -> None:
+        self.max_pages = max_pages
+        self._pages: OrderedDict[str, array] = OrderedDict()
+
+    def get(self, key: str) -> array | None:
+        ids = self._pages.get(key)
+        if ids is not None:
+            self._pages.move_to_end(key)
+        return ids
+
+    def put(self, key: str, ids: array) -> array:
+        """
+        Cache the page unless it is cached already (e.g. by a concurrent loader), and return
+        the ids the cache holds for it: only those are retained by the cache.
+        """
+        stored = self._pages.get(key)
+        if stored is not None:
+            self._pages.move_to_end(key)
+            return stored
+        stored = self._pages[key] = array("L", ids)
+        job_store.retain(stored)
+        while len(self._pages) > self.max_pages:
+            _, evicted = self._pages.popitem(last=False)
+            job_store.release(evicted)
+        return stored
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+
+# The page cache shared by all sessions.
+page_refs = PageRefs()
+registry.gauge(
+    "bot_page_refs_pages", "Results pages in the shared page cache", lambda: len(page_refs)
+)
+
+
+# A session browses one sequence of results: the pages 1, 2, ... of its query, joined.
+# Positions in the sequence (as sent in the navigation buttons) are global, and the
+# session keeps the job ids of a window of consecutive pages:
+#   jobs          - job ids of the window (array, see job_store.set_session_jobs)
+#   window_page   - number of the first page in the window
+#   window_pages  - number of pages in the window
+#   window_offset - position of jobs[0] in the sequence
+#   page_sizes    - number of jobs of every page loaded so far (page n at index n - 1)
+#   results_end   - True once a page came back empty (not counting jobs the profile hid)
+#   profile       - [skills, excluded] the results are ranked by, absent if not ranked
+#                   (pages are ranked per session, so they are not shared via page_refs)
+#   local         - True if every page comes from the job index (local-first mode) rather
+#                   than from the site, so the sequence never mixes the two
+
+
+def start_window(user_data: dict, profile: Profile = Profile(), local: bool = False) -> None:
+    """
+    Start browsing a new sequence whose first page is being loaded into user_data["jobs"],
+    ranked for the profile (if not empty), from the job index if `local`.
+    """
+    if profile:
+        user_data["profile"] = [list(profile.skills), list(profile.excluded)]
+    else:
+        user_data.pop("profile", None)
+    if local:
+        user_data["local"] = True
+    else:
+        user_data.pop("local", None)
+    user_data["window_page"] = 1
+    user_data["window_pages"] = 1
+    user_data["window_offset"] = 0
+    user_data["page_sizes"] = []
+    user_data["results_end"] = False
+
+
+def finish_first_page(user_data: dict, site: str, query: str) -> None:
+    """Record the first page once all of its jobs are in user_data["jobs"]."""
+    ids = user_data["jobs"]
+    user_data["page_sizes"] = [len(ids)]
+    # A ranked page may be empty only because the profile excluded all of its jobs.
+    user_data["results_end"] = not ids and "profile" not in user_data
+    # A ranked page is not the page other sessions get.
+    if ids and "profile" not in user_data:
+        page_refs.put(_page_key(user_data, site, query, 1), ids)
+
+
+def window_range(user_data: dict) -> tuple[int, int]:
+    """Return the (start, end) positions of the jobs held by the session."""
+    start = user_data.get("window_offset", 0)
+    return start, start + len(user_data.get("jobs", []))
+
+
+def job_id_at(user_data: dict, position: int) -> int | None:
+    """Return the id of the job at the position, or None if it is outside the window."""
+    start, end = window_range(user_data)
+    if start <= position < end:
+        return user_data["jobs"][position - start]
+    return None
+
+
+def last_window_page(user_data: dict) -> int:
+    return user_data.get("window_page", 1) + user_data.get("window_pages", 1) - 1
+
+
+def has_next(user_data: dict, position: int) -> bool:
+    """Return True unless the position is the last job of the results."""
+    _, end = window_range(user_data)
+    if position < end - 1:
+        return True
+    return not (
+        user_data.get("results_end")
+        and last_window_page(user_data) >= len(user_data.get("page_sizes", []))
+    )
+
+
+async def move_window(user_data: dict, site: str, query: str, position: int) -> bool:
+    """
+    Slide the window until it holds the job at the position, loading the pages on the way
+    from the page cache (or the query cache / scraper when they were evicted).
+    Returns False if there is no job at the position or the session changed meanwhile.
+    Raises FilteredOutError after FILTERED_PAGES_MAX loaded pages in a row were left empty
+    by the excluded keywords of the profile, instead of scraping pages without bound.
+    """
+    ids = user_data.get("jobs")
+    if ids is None or position < 0:
+        return False
+    filtered = 0
+    while True:
+        start, end = window_range(user_data)
+        if position < start:
+            await _load_previous(user_data, ids, site, query)
+        elif position >= end:
+            # The first page is still being streamed, its size is not known yet.
+            if user_data.get("streaming"):
+                return False
+            page = last_window_page(user_data) + 1
+            if page > len(user_data["page_sizes"]) and user_data.get("results_end"):
+                return False
+            if not await _load_next(user_data, ids, site, query, page):
+                return False
+            if user_data["page_sizes"][page - 1]:
+                filtered = 0
+            else:
+                filtered += 1
+                if filtered >= FILTERED_PAGES_MAX:
+                    raise FilteredOutError(filtered)
+        else:
+            return True
+        # A new search replaced the session while a page was loading.
+        if user_data.get("jobs") is not ids:
+            return False
+
+
+def session_profile(user_data: dict) -> Profile:
+    """Return the profile the results of the session are ranked by."""
+    skills, excluded = user_data.get("profile") or ((), ())
+    return Profile(tuple(skills), tuple(excluded))
+
+
+def _page_key(user_data: dict, site: str, query: str, page: int) -> str:
+    # Pages of the job index and of the site are different results: cached apart.
+    key = make_cache_key(site, query, page)
+    return f"local:{key}" if user_data.get("local") else key
+
+
+async def _page_ids(user_data: dict, site: str, query: str, page: int) -> tuple[array, bool]:
+    # Job ids of a results page for the session, from the page cache when possible,
+    # and whether the page itself is empty (the end of the results).
+    key = _page_key(user_data, site, query, page)
+    ids = page_refs.get(key)
+    if ids is None:
+        if user_data.get("local"):
+            jobs = await search_local(site, query, page)
+        else:
+            response = await fetch_jobs(site, query, page)
+            jobs = response["data"] if response else []
+        acquired = job_store.acquire(jobs)
+        # A concurrent loader may have cached the page meanwhile: use the cached ids,
+        # which the page cache holds references to, and drop ours.
+        ids = page_refs.put(key, acquired)
+        job_store.release(acquired)
+    # Rank the shared page for the session (the page cache keeps the jobs referenced);
+    # it may leave no job although the results go on.
+    profile = session_profile(user_data)
+    if profile and ids:
+        ranked = rank_jobs([job_store.get(job_id) for job_id in ids], profile)
+        return array("L", (job.id for job in ranked)), False
+    return ids, not ids
+
+
+async def _load_next(user_data: dict, ids: array, site: str, query: str, page: int) -> bool:
+    page_ids, end = await _page_ids(user_data, site, query, page)
+    if user_data.get("jobs") is not ids:
+        return False
+    page_sizes = user_data["page_sizes"]
+    if end:
+        user_data["results_end"] = True
+        del page_sizes[page - 1 :]
+        return False
+
+    job_store.retain(page_ids)
+    ids.extend(page_ids)
+    if page > len(page_sizes):
+        page_sizes.append(len(page_ids))
+    else:
+        page_sizes[page - 1] = len(page_ids)
+    user_data["window_pages"] += 1
+
+    # Drop the first page of the window; it stays in the page cache.
+    if user_data["window_pages"] > SESSION_WINDOW_PAGES:
+        size = page_sizes[user_data["window_page"] - 1]
+        job_store.release(ids[:size])
+        del ids[:size]
+        user_data["window_page"] += 1
+        user_data["window_pages"] -= 1
+        user_data["window_offset"] += size
+    return True
+
+
+async def _load_previous(user_data: dict, ids: array, site: str, query: str) -> None:
+    page = user_data["window_page"] - 1
+    page_ids, _ = await _page_ids(user_data, site, query, page)
+    if user_data.get("jobs") is not ids:
+        return
+
+    # The page may have changed if it had to be scraped again; later positions shift.
+    page_sizes = user_data["page_sizes"]
+    page_sizes[page - 1] = len(page_ids)
+    job_store.retain(page_ids)
+    ids[0:0] = page_ids
+    user_data["window_page"] = page
+    user_data["window_pages"] += 1
+    user_data["window_offset"] = sum(page_sizes[: page - 1])
+
+    # Drop the last page of the window; it stays in the page cache.
+    if user_data["window_pages"] > SESSION_WINDOW_PAGES:
+        size = page_sizes[last_window_page(user_data) - 1]
+        if size:
+            job_store.release(ids[-size:])
+            del ids[-size:]
+        user_data["window_pages"] -= 1
@@ -0,0 +1,259 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from metrics import registry  # Metrics registry
+
+# Timeout (in seconds) of a scrape until enough latencies of its source are known.
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "15"))
+# Bounds of the adaptive timeout, SCRAPE_TIMEOUT_FACTOR times the p99 latency of the source.
+SCRAPE_TIMEOUT_MIN = float(os.getenv("SCRAPE_TIMEOUT_MIN", "5"))
+SCRAPE_TIMEOUT_MAX = float(os.getenv("SCRAPE_TIMEOUT_MAX", "30"))
+SCRAPE_TIMEOUT_FACTOR = float(os.getenv("SCRAPE_TIMEOUT_FACTOR", "2"))
+# Number of latest scrapes of a source its percentiles are computed from, and the number
+# needed before they are used (timeouts and hedging).
+SCRAPE_LATENCY_WINDOW = int(os.getenv("SCRAPE_LATENCY_WINDOW", "200"))
+SCRAPE_LATENCY_MIN_SAMPLES = int(os.getenv("SCRAPE_LATENCY_MIN_SAMPLES", "20"))
+# Consecutive failures opening the circuit of a source, and how long (in seconds) it stays
+# open before one trial scrape is let through.
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+# Send a second identical request when a scrape is slower than the p95 latency of its source.
+SCRAPE_HEDGE = os.getenv("SCRAPE_HEDGE", "1") == "1"
+# Maximum number of hedge requests in flight per source, so a degraded source is not flooded.
+SCRAPE_HEDGE_MAX_IN_FLIGHT = int(os.getenv("SCRAPE_HEDGE_MAX_IN_FLIGHT", "2"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of scraping a source whose circuit is open."""
+
+    def __init__(self, site: str, retry_in: float) -> None:
+        super().__init__(f"Circuit of {site} is open, retry in {retry_in:.0f}s")
+        self.site = site
+        self.retry_in = retry_in
+
+
+class _Source:
+    """Latencies and circuit breaker state of one scraped source."""
+
+    def __init__(self, site: str) -> None:
+        self.site = site
+        # Durations of the latest successful scrapes. Timeouts are not recorded: they would
+        # raise the p99, hence the next timeouts, whenever the source is intermittently slow.
+        self.latencies: deque[float] = deque(maxlen=SCRAPE_LATENCY_WINDOW)
+        self._sorted: list[float] | None = None
+        # Consecutive failures; the circuit is open while opened_at is set.
+        self.failures = 0
+        self.opened_at: float | None = None
+        # A trial scrape is running while the circuit is half-open.
+        self.trial = False
+        self.hedges_in_flight = 0
+
+    def add_latency(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self._sorted = None
+
+    def percentile(self, q: float) -> float | None:
+        """Return the q-th latency percentile (0 < q < 1), or None with too few samples."""
+        if len(self.latencies) < SCRAPE_LATENCY_MIN_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.latencies)
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+    def timeout(self) -> float:
+        """Return the timeout of the next scrape, adapted to the p99 latency."""
+        p99 = self.percentile(0.99)
+        if p99 is None:
+            return SCRAPE_TIMEOUT
+        return min(max(p99 * SCRAPE_TIMEOUT_FACTOR, SCRAPE_TIMEOUT_MIN), SCRAPE_TIMEOUT_MAX)
+
+    def is_open(self, now: float) -> bool:
+        """Return True if scrapes of the source are rejected right now."""
+        if self.opened_at is None:
+            return False
+        return self.trial or now - self.opened_at < CIRCUIT_OPEN_SECONDS
+
+    def acquire(self, now: float) -> None:
+        """Let a scrape through or raise CircuitOpenError; past the open period, one trial goes."""
+        if self.opened_at is None:
+            return
+        retry_in = self.opened_at + CIRCUIT_OPEN_SECONDS - now
+        if retry_in > 0 or self.trial:
+            raise CircuitOpenError(self.site, max(retry_in, 0))
+        self.trial = True
+
+    def release(self) -> None:
+        """Forget a scrape that was cancelled before it succeeded or failed."""
+        self.trial = False
+
+    def succeeded(self, seconds: float) -> None:
+        self.add_latency(seconds)
+        if self.opened_at is not None:
+            logger.info("Circuit of %s closed", self.site)
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failed(self, now: float) -> None:
+        self.failures += 1
+        if self.trial or (self.opened_at is None and self.failures >= CIRCUIT_FAILURES):
+            logger.warning(
+                "Circuit of %s open for %ss after %s failures",
+                self.site,
+                CIRCUIT_OPEN_SECONDS,
+                self.failures,
+            )
+            self.opened_at = now
+        self.trial = False
+
+
+class ScrapeScheduler:
+    """
+    Runs the scrapes of every source (site of SCRAPER_DISPATCHER) with:
+    - an adaptive timeout: a multiple of the p99 of the latest successful scrapes of the
+      source, within bounds (the fixed SCRAPE_TIMEOUT until enough scrapes were timed);
+    - a circuit breaker: after CIRCUIT_FAILURES consecutive failures (errors or timeouts)
+      scrapes of the source are rejected at once for CIRCUIT_OPEN_SECONDS, then one trial
+      scrape decides whether the circuit closes again;
+    - hedged requests: a scrape still running after the p95 latency of its source is sent
+      a second time, and the first answer wins.
+    The percentiles come from a sliding window of scrapes, so they follow the current state
+    of the source, unlike the cumulative bot_stage_seconds histogram.
+    """
+
+    def __init__(self) -> None:
+        self._sources: dict[str, _Source] = {}
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def source(self, site: str) -> _Source:
+        source = self._sources.get(site)
+        if source is None:
+            source = self._sources[site] = _Source(site)
+        return source
+
+    def is_open(self, site: str) -> bool:
+        """Return True if the circuit of the site is open (its scrapes are rejected)."""
+        return self.source(site).is_open(time.monotonic())
+
+    @asynccontextmanager
+    async def guard(self, site: str):
+        """
+        Run the enclosed scrape of the site under its circuit breaker and adaptive timeout.
+        Raises CircuitOpenError without running it if the circuit is open, and TimeoutError
+        if it takes longer than the timeout.
+        """
+        source = self.source(site)
+        try:
+            source.acquire(time.monotonic())
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+        timeout = source.timeout()
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout):
+                yield source
+        except TimeoutError:
+            self.timeouts += 1
+            source.failed(time.monotonic())
+            raise TimeoutError(f"Scrape of {site} timed out after {timeout:.1f}s") from None
+        except asyncio.CancelledError:
+            source.release()
+            raise
+        except Exception:
+            source.failed(time.monotonic())
+            raise
+        source.succeeded(time.perf_counter() - started)
+
+    async def run(self, site: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run call() (one scrape of the site) guarded, hedged when it is slower than usual."""
+        async with self.guard(site) as source:
+            return await self._hedged(source, call)
+
+    async def _hedged(self, source: _Source, call: Callable[[], Awaitable[Any]]) -> Any:
+        # A trial scrape of a half-open circuit is never hedged.
+        delay = source.percentile(0.95) if SCRAPE_HEDGE and not source.trial else None
+        if delay is None:
+            return await call()
+
+        first = asyncio.ensure_future(call())
+        tasks = {first}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and source.hedges_in_flight < SCRAPE_HEDGE_MAX_IN_FLIGHT:
+                hedged = True
+                source.hedges_in_flight += 1
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(call()))
+
+            # The first successful answer wins; a failure waits for the other request.
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if hedged:
+                source.hedges_in_flight -= 1
+
+    def stats(self) -> dict:
+        """Return the latency percentiles, timeout and circuit state of every source."""
+        now = time.monotonic()
+        return {
+            site: {
+                "p50": source.percentile(0.5),
+                "p95": source.percentile(0.95),
+                "p99": source.percentile(0.99),
+                "timeout": source.timeout(),
+                "open": source.is_open(now),
+                "failures": source.failures,
+            }
+            for site, source in self._sources.items()
+        }
+
+
+# The scheduler shared by every scrape.
+scrape_scheduler = ScrapeScheduler()
+registry.gauge(
+    "bot_scrape_circuits_open",
+    "Sources whose circuit is open",
+    lambda: sum(source.is_open(time.monotonic()) for source in scrape_scheduler._sources.values()),
+)
+registry.gauge(
+    "bot_scrape_timeouts_total",
+    "Scrapes stopped by their timeout",
+    lambda: scrape_scheduler.timeouts,
+    "counter",
+)
+registry.gauge(
+    "bot_scrape_rejected_total",
+    "Scrapes rejected by an open circuit",
+    lambda: scrape_scheduler.rejected,
+    "counter",
+)
+registry.gauge(
+    "bot_scrape_hedges_total", "Hedge requests sent", lambda: scrape_scheduler.hedges, "counter"
+)
+registry.gauge(
+    "bot_scrape_hedge_wins_total",
+    "Hedge requests answering before the original request",
+    lambda: scrape_scheduler.hedge_wins,
+    "counter",
+)
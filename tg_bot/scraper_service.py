@@ -0,0 +1,356 @@
+import asyncio
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from jobs_requests import (
+    getUpWork,  # Scraper function for UpWork
+    getUpWorkStream,  # Streaming scraper function for UpWork
+    getUpWorkDescription,  # Full description of an UpWork job sent truncated
+    imitate_site1,  # Dummy scraper function for testing (site "1")
+    rank_jobs,  # Ranking and filtering of a page for a skill profile
+)
+from query_cache import query_cache, make_cache_key  # Shared cache of scraper responses
+from single_flight import SingleFlight  # Deduplication of concurrent identical scrapes
+from scrape_scheduler import scrape_scheduler  # Adaptive timeouts, circuit breakers and hedging
+from job_index import job_index  # Persistent job store with local search (None if disabled)
+from metrics import registry, observe  # Metrics registry and timing of the pipeline stages
+from job_store import Job  # Compact job record
+from job_matcher import Profile  # Skill profile of a user
+
+# Dispatcher mapping site keys to their respective scraper functions.
+SCRAPER_DISPATCHER = {
+    "upwork": getUpWork,
+    "1": imitate_site1,
+}
+
+# Key of the "all sites" search mode, which fans out to every other site in SCRAPER_DISPATCHER.
+ALL_SITES = "all"
+# Seconds each site gets in the "all sites" mode; can be overridden per site with
+# FANOUT_TIMEOUT_<SITE> (e.g. FANOUT_TIMEOUT_UPWORK=20).
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "12"))
+
+# Local-first mode: answer queries from the job index at once and refresh it in the background.
+LOCAL_FIRST = os.getenv("LOCAL_FIRST", "0") == "1"
+# Number of jobs per page when answering from the job index.
+LOCAL_PAGE_SIZE = int(os.getenv("LOCAL_PAGE_SIZE", "10"))
+
+# Sites that can stream jobs while their page is being scraped.
+STREAMING_DISPATCHER = {
+    "upwork": getUpWorkStream,
+}
+
+# Sites whose API can send the full text of a description it truncated.
+DESCRIPTION_DISPATCHER = {
+    "upwork": getUpWorkDescription,
+}
+
+# In-flight scrapes keyed like the cache, so identical concurrent requests share one scrape.
+scrape_flights = SingleFlight()
+registry.gauge("bot_scrapes_in_flight", "Scrapes currently running", lambda: len(scrape_flights))
+
+
+async def _scrape_and_cache(site: str, query: str, page: int) -> dict:
+    """Run the scraper for the site and store a successful response in the cache."""
+    # Retrieve the scraper function based on the job site and run it through the scheduler
+    # ("all sites" fans out to the other sites, which are scheduled on their own).
+    get_jobs = SCRAPER_DISPATCHER[site]
+    started = time.perf_counter()
+    if site == ALL_SITES:
+        response = await get_jobs(query, page)
+    else:
+        response = await scrape_scheduler.run(site, lambda: get_jobs(query, page))
+    elapsed = time.perf_counter() - started
+    observe("scrape", elapsed, site)
+    logger.info("Scraped %s page %s for '%s' in %.2fs", site, page, query, elapsed)
+
+    # Only successful responses are cached; partial "all sites" results are not.
+    if response and not response.get("failed_sites"):
+        await query_cache.set(site, query, page, response)
+    if response:
+        await _index_jobs(site, response["data"])
+    return response
+
+
+async def _index_jobs(site: str, jobs: list[Job]) -> None:
+    """Write scraped jobs into the persistent job index (if enabled)."""
+    # "All sites" results were already indexed under their own site.
+    if job_index is None or site == ALL_SITES or not jobs:
+        return
+    try:
+        await asyncio.to_thread(job_index.add_jobs, site, jobs)
+    except Exception as e:
+        logger.error("Error indexing %s jobs of %s: %s", len(jobs), site, e)
+
+
+async def search_local(site: str, query: str, page: int = 1) -> list[Job]:
+    """Return page `page` of the indexed jobs matching the query (newest first)."""
+    if job_index is None:
+        return []
+    return await asyncio.to_thread(
+        job_index.search,
+        query,
+        None if site == ALL_SITES else site,
+        LOCAL_PAGE_SIZE,
+        (page - 1) * LOCAL_PAGE_SIZE,
+    )
+
+
+async def answer_locally(site: str, query: str) -> bool:
+    """
+    Return True if a new search should browse the job index (local-first mode): the site's
+    first page is not cached and the index has matching jobs. The whole session then
+    browses the index, so its pages do not mix two result sets.
+    """
+    if not LOCAL_FIRST or job_index is None:
+        return False
+    if await query_cache.get(site, query, 1) is not None:
+        return False
+    return bool(await search_local(site, query, 1))
+
+
+async def fetch_jobs(site: str, query: str, page: int = 1, fresh: bool = False) -> dict:
+    """
+    Return the jobs for (site, query, page), going to the scraper only on a cache miss.
+    The response has the same structure as the scraper functions: {"data": [...], "page": page}.
+    With fresh=True the cache lookup is skipped (the new result is still cached).
+
+    If the scrape fails (error, timeout or open circuit), an expired cached response is
+    returned when there is one, marked with "stale": True; fresh=True never gets one.
+    """
+    if not fresh:
+        cached = await query_cache.get(site, query, page)
+        if cached is not None:
+            return cached
+
+    # Concurrent callers asking for the same (site, query, page) await a single scrape.
+    try:
+        return await scrape_flights.do(
+            make_cache_key(site, query, page),
+            lambda: _scrape_and_cache(site, query, page),
+        )
+    except Exception as e:
+        stale = None if fresh else await query_cache.get_stale(site, query, page)
+        if stale is None:
+            raise
+        logger.warning("Serving stale %s page %s for '%s': %s", site, page, query, e)
+        return stale
+
+
+class _JobStream:
+    """Jobs received so far by a streaming scrape, shared by every caller reading it."""
+
+    def __init__(self) -> None:
+        self.jobs: list[Job] = []
+        self.done = False
+        self.error: BaseException | None = None
+        # Replaced after every notification, so readers wait only for the next change.
+        self.updated = asyncio.Event()
+
+    def notify(self) -> None:
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+# Streaming scrapes in progress, keyed like the cache.
+_streams: dict[str, _JobStream] = {}
+
+
+async def _stream_and_cache(site: str, query: str, page: int, key: str) -> dict:
+    """Run the streaming scraper for the site, publishing jobs to its _JobStream as they arrive."""
+    stream = _streams[key]
+    started = time.perf_counter()
+    try:
+        # Streamed pages are not hedged: their first jobs arrive long before the page is done.
+        async with scrape_scheduler.guard(site):
+            async for job in STREAMING_DISPATCHER[site](query, page):
+                stream.jobs.append(job)
+                stream.notify()
+    except BaseException as e:
+        stream.error = e
+        raise
+    finally:
+        stream.done = True
+        stream.notify()
+        del _streams[key]
+
+    elapsed = time.perf_counter() - started
+    observe("scrape", elapsed, site)
+    logger.info("Streamed %s page %s for '%s' in %.2fs", site, page, query, elapsed)
+    response = {"data": stream.jobs, "page": page}
+    await query_cache.set(site, query, page, response)
+    await _index_jobs(site, stream.jobs)
+    return response
+
+
+async def stream_jobs(site: str, query: str, page: int = 1, local: bool = False):
+    """
+    Yield the jobs for (site, query, page) one by one, as soon as each is available.
+
+    With local=True (see answer_locally) the page comes from the job index at once, and the
+    site's first page is scraped in the background to refresh the index.
+    Cached results are yielded at once. Sites in STREAMING_DISPATCHER are streamed from the API;
+    the streaming scrape is registered in scrape_flights, so concurrent fetch_jobs() and
+    stream_jobs() callers share it. Other sites, and sites whose circuit is open,
+    fall back to fetch_jobs() (which may answer with stale results).
+    """
+    if local:
+        if page == 1 and make_cache_key(site, query, 1) not in _streams:
+            scrape_flights.start(
+                make_cache_key(site, query, 1), lambda: _scrape_and_cache(site, query, 1)
+            )
+        for job in await search_local(site, query, page):
+            yield job
+        return
+
+    cached = await query_cache.get(site, query, page)
+    if cached is not None:
+        for job in cached["data"]:
+            yield job
+        return
+
+    key = make_cache_key(site, query, page)
+
+    stream = _streams.get(key)
+    if stream is None:
+        # The streaming scrape runs in the background and keeps going even if this reader
+        # stops early, so its result still lands in the cache.
+        if (
+            site not in STREAMING_DISPATCHER
+            or scrape_scheduler.is_open(site)
+            or not scrape_flights.start(key, lambda: _stream_and_cache(site, query, page, key))
+        ):
+            # Nothing to stream from: wait for the whole page (joining a running scrape if any).
+            response = await fetch_jobs(site, query, page)
+            for job in response["data"] if response else []:
+                yield job
+            return
+        stream = _streams[key] = _JobStream()
+
+    # Read the shared stream from the beginning, waiting for new jobs until it is done.
+    index = 0
+    while True:
+        updated = stream.updated
+        while index < len(stream.jobs):
+            yield stream.jobs[index]
+            index += 1
+        if stream.done:
+            break
+        await updated.wait()
+    if stream.error is not None:
+        # Nothing was received: answer with the expired cached page if there is one.
+        stale = None if index else await query_cache.get_stale(site, query, page)
+        if stale is None:
+            raise stream.error
+        logger.warning("Serving stale %s page %s for '%s': %s", site, page, query, stream.error)
+        for job in stale["data"]:
+            yield job
+
+
+async def fetch_full_description(site: str, job: Job) -> bool:
+    """
+    Replace the truncated description of a stored job with its full text.
+    The record is shared, so every session showing the job gets the full text; the job
+    index is updated too, so sessions restored or answered from it get it as well.
+    Returns False if no API has the description anymore.
+    """
+    # In the "all sites" mode the job may come from any site.
+    sites = [site] if site in DESCRIPTION_DISPATCHER else list(DESCRIPTION_DISPATCHER)
+    for name in sites:
+        description = await DESCRIPTION_DISPATCHER[name](job.href)
+        if description is not None:
+            job.description = description
+            job.truncated = False
+            if job_index is not None:
+                try:
+                    await asyncio.to_thread(job_index.set_description, job.href, description)
+                except Exception as e:
+                    logger.error("Error indexing the description of %s: %s", job.href, e)
+            return True
+    return False
+
+
+async def stream_ranked_jobs(
+    site: str, query: str, page: int, profile: Profile, local: bool = False
+):
+    """
+    stream_jobs() ranked and filtered for a skill profile (see jobs_requests.rank_jobs).
+
+    Ranking needs the whole page, so with skills the jobs are yielded once the page is
+    complete; with only excluded keywords they are filtered as they arrive.
+    """
+    stream = stream_jobs(site, query, page, local)
+    try:
+        if not profile.skills:
+            async for job in stream:
+                if rank_jobs([job], profile):
+                    yield job
+            return
+        jobs = [job async for job in stream]
+    finally:
+        await stream.aclose()
+    for job in rank_jobs(jobs, profile):
+        yield job
+
+
+def _site_fanout_timeout(site: str) -> float:
+    """Return the timeout in seconds of the site in the "all sites" mode."""
+    return float(os.getenv(f"FANOUT_TIMEOUT_{site.upper()}", FANOUT_TIMEOUT))
+
+
+def _dedup_key(job: Job) -> tuple[str, str]:
+    """Key identifying the same job across sites: normalized title and URL without query string."""
+    title = re.sub(r"\W+", " ", job.title).strip().lower()
+    url = urlsplit(job.href.strip().lower())
+    return title, f"{url.netloc.removeprefix('www.')}{url.path.rstrip('/')}"
+
+
+def _posting_time(job: Job) -> float:
+    """Posting timestamp usable for sorting; jobs without one go last."""
+    timestamp = job.posting_timestamp
+    return timestamp if isinstance(timestamp, (int, float)) else float("-inf")
+
+
+def merge_jobs(jobs: list[Job]) -> list[Job]:
+    """Deduplicate jobs by normalized title and URL, newest first."""
+    unique = {}
+    for job in jobs:
+        unique.setdefault(_dedup_key(job), job)
+    return sorted(unique.values(), key=_posting_time, reverse=True)
+
+
+async def fetch_all_sites(query: str, page: int = 1) -> dict:
+    """
+    Fetch (site, query, page) from every site concurrently and merge the results.
+
+    Each site gets its own timeout; sites that fail or time out are skipped and listed
+    in "failed_sites", so the total latency is that of the slowest site finishing in time.
+    Timed out scrapes keep running in the background, so their results still land in the cache.
+    """
+    sites = [site for site in SCRAPER_DISPATCHER if site != ALL_SITES]
+    results = await asyncio.gather(
+        *(
+            asyncio.wait_for(
+                asyncio.shield(fetch_jobs(site, query, page)),
+                _site_fanout_timeout(site),
+            )
+            for site in sites
+        ),
+        return_exceptions=True,
+    )
+
+    jobs = []
+    failed_sites = []
+    for site, result in zip(sites, results):
+        if isinstance(result, BaseException):
+            logger.info("Site %s skipped in all-sites search: %r", site, result)
+            failed_sites.append(site)
+        elif result:
+            jobs.extend(result["data"])
+    return {"data": merge_jobs(jobs), "page": page, "failed_sites": failed_sites}
+
+
+SCRAPER_DISPATCHER[ALL_SITES] = fetch_all_sites
@@ -0,0 +1,307 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from telegram.error import RetryAfter  # type: ignore
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from metrics import registry, observe, span  # Metrics registry and timing of the pipeline stages
+
+# Global send budget: messages per second for the whole bot, and the allowed burst.
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_GLOBAL_BURST = float(os.getenv("SEND_GLOBAL_BURST", "30"))
+# Per-chat send budget: messages per second for one chat, and the allowed burst.
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+# Number of requests sent to Telegram at the same time.
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "8"))
+# How many times a request is retried after Telegram answered with "retry after".
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Priority lanes: interactive replies always go before alert broadcasts.
+INTERACTIVE = 0
+BROADCAST = 1
+
+# Telegram accepts at most this many message ids in one deleteMessages call.
+_MAX_DELETE_BATCH = 100
+# Idle chat states are swept when more than this many are kept.
+_MAX_IDLE_CHATS = 10000
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        """Take one token (call after wait_time() returned 0)."""
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no token for the next `seconds` seconds, then refill from empty."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class _Request:
+    """A queued call to the Bot API and the future its caller awaits."""
+
+    __slots__ = ("call", "future", "retries", "delete_ids", "queued_at")
+
+    def __init__(self, call: Callable[[], Awaitable[Any]] | None, future: asyncio.Future) -> None:
+        self.call = call
+        self.future = future
+        self.retries = 0
+        self.queued_at = time.perf_counter()
+        # Message ids of a coalesced delete request (None for other requests).
+        self.delete_ids: list[int] | None = None
+
+
+class _ChatState:
+    """Pending requests of one chat, one FIFO lane per priority."""
+
+    __slots__ = ("lanes", "bucket", "scheduled", "queued", "ticket", "pending_delete")
+
+    def __init__(self) -> None:
+        self.lanes = (deque(), deque())
+        self.bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        # True while the chat is in the ready queue, waiting for a timer, or being served.
+        self.scheduled = False
+        # Priority of the chat's entry in the ready queue (None while not in it), and the
+        # sequence number of that entry: older entries of the chat are stale and skipped.
+        self.queued: int | None = None
+        self.ticket = -1
+        # Delete request still waiting in a lane; later deletes are merged into it.
+        self.pending_delete: _Request | None = None
+
+    def head_priority(self) -> int | None:
+        for priority, lane in enumerate(self.lanes):
+            if lane:
+                return priority
+        return None
+
+
+class OutboundDispatcher:
+    """
+    Central queue for every outbound Telegram request.
+
+    - Token buckets limit the send rate per chat and globally.
+    - Requests of one chat keep their order within a priority lane.
+    - Interactive requests are served before broadcast requests, across and within chats;
+      a chat queued for a broadcast moves up when an interactive request arrives for it.
+    - "Retry after" answers from Telegram pause every send of the bot (the flood limit
+      applies to the bot token, not to one chat) and the request is retried.
+    - Deletes of several messages in the same chat are merged into one deleteMessages call.
+    """
+
+    def __init__(self) -> None:
+        self.bot = None
+        self._chats: dict[int, _ChatState] = {}
+        self._global = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+        # Chats with requests ready to be served, ordered by (priority, arrival).
+        self._ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._workers: list[asyncio.Task] = []
+
+    def start(self, bot, share: float = 1.0) -> None:
+        """
+        Start the workers. Called from the Application post_init hook in main.py.
+        `share` is the part of the global send budget used by this process
+        (1 / number of workers when several bot processes share one bot token).
+        """
+        self.bot = bot
+        self._global = TokenBucket(
+            SEND_GLOBAL_RATE * share, max(1.0, SEND_GLOBAL_BURST * share)
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(SEND_WORKERS)]
+
+    async def stop(self) -> None:
+        """Stop the workers. Called from the Application post_shutdown hook in main.py."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be sent."""
+        return sum(len(lane) for chat in self._chats.values() for lane in chat.lanes)
+
+    def _chat(self, chat_id: int) -> _ChatState:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= _MAX_IDLE_CHATS:
+                self._sweep()
+            chat = self._chats[chat_id] = _ChatState()
+        return chat
+
+    def _sweep(self) -> None:
+        # Drop the state of chats with nothing queued; their buckets start full again.
+        for chat_id in [cid for cid, chat in self._chats.items() if not chat.scheduled]:
+            del self._chats[chat_id]
+
+    def _schedule(self, chat_id: int, chat: _ChatState) -> None:
+        # Put the chat in the ready queue, keyed by the priority of its most urgent request.
+        priority = chat.head_priority()
+        if priority is None:
+            chat.scheduled = False
+            # Forget chats with nothing queued once their bucket is full again.
+            if chat.bucket.is_full() and self._chats.get(chat_id) is chat:
+                del self._chats[chat_id]
+            return
+        chat.scheduled = True
+        chat.queued = priority
+        chat.ticket = next(self._seq)
+        self._ready.put_nowait((priority, chat.ticket, chat_id))
+
+    def _enqueue(self, chat_id: int, request: _Request, priority: int) -> None:
+        chat = self._chat(chat_id)
+        chat.lanes[priority].append(request)
+        if not chat.scheduled or (chat.queued is not None and priority < chat.queued):
+            # New in the ready queue, or moved up (its previous entry becomes stale).
+            self._schedule(chat_id, chat)
+
+    def call(
+        self,
+        chat_id: int,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = INTERACTIVE,
+    ) -> asyncio.Future:
+        """
+        Queue call() (a Bot API request for chat_id) and return a future with its result.
+        The future can be awaited to get e.g. the sent Message, or ignored.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(chat_id, _Request(call, future), priority)
+        return future
+
+    def send_message(
+        self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs
+    ) -> asyncio.Future:
+        """Queue a sendMessage request."""
+        return self.call(
+            chat_id,
+            lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs),
+            priority,
+        )
+
+    def delete_messages(
+        self, chat_id: int, message_ids: list[int], priority: int = INTERACTIVE
+    ) -> asyncio.Future:
+        """
+        Queue the deletion of messages in a chat.
+        Merged with a delete of the same chat still waiting in the queue, if there is one.
+        """
+        chat = self._chat(chat_id)
+        pending = chat.pending_delete
+        if pending is not None and len(pending.delete_ids) + len(message_ids) <= _MAX_DELETE_BATCH:
+            pending.delete_ids.extend(message_ids)
+            return pending.future
+
+        future = asyncio.get_running_loop().create_future()
+        request = _Request(None, future)
+        request.delete_ids = list(message_ids)
+        request.call = lambda: self.bot.delete_messages(
+            chat_id=chat_id, message_ids=request.delete_ids
+        )
+        chat.pending_delete = request
+        self._enqueue(chat_id, request, priority)
+        return future
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, ticket, chat_id = await self._ready.get()
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.ticket != ticket:
+                continue
+            chat.queued = None
+
+            # Respect the per-chat budget: come back to this chat when it has a token.
+            delay = chat.bucket.wait_time()
+            if delay > 0:
+                loop.call_later(delay, self._schedule, chat_id, chat)
+                continue
+
+            # Respect the global budget, shared by all workers.
+            delay = self._global.wait_time()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self._global.wait_time()
+            self._global.consume()
+            chat.bucket.consume()
+
+            lane = chat.lanes[chat.head_priority()]
+            request = lane.popleft()
+            if request is chat.pending_delete:
+                # From now on new deletes start a new request.
+                chat.pending_delete = None
+
+            retry_in = await self._execute(request)
+            if retry_in is not None:
+                # Put the request back at the front, and pause the bot and the chat.
+                self._global.pause(retry_in)
+                lane.appendleft(request)
+                loop.call_later(retry_in, self._schedule, chat_id, chat)
+            else:
+                self._schedule(chat_id, chat)
+
+    async def _execute(self, request: _Request) -> float | None:
+        """Run the request; return the delay before a retry, or None when it is finished."""
+        future = request.future
+        if future.cancelled():
+            return None
+        if request.retries == 0:
+            observe("send_queue_wait", time.perf_counter() - request.queued_at)
+        try:
+            with span("telegram_send"):
+                result = await request.call()
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, "total_seconds"):
+                retry_after = retry_after.total_seconds()
+            request.retries += 1
+            if request.retries <= SEND_MAX_RETRIES:
+                logger.warning("Flood limit hit, retrying in %ss", retry_after)
+                return float(retry_after)
+            if not future.done():
+                future.set_exception(e)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        # Mark the exception as retrieved for callers that never await the future.
+        if not future.cancelled():
+            future.exception()
+        return None
+
+
+# The dispatcher shared by all handlers.
+outbound = OutboundDispatcher()
+registry.gauge(
+    "bot_send_queue_depth", "Outbound Telegram requests waiting to be sent", outbound.queue_depth
+)
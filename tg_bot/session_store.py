@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from telegram.ext import BasePersistence, PersistenceInput  # type: ignore
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from job_store import job_store, set_session_jobs  # Shared store of compact job records
+from job_index import job_index  # Persistent job store, used to restore session jobs
+
+# SQLite file holding the sessions; when empty, sessions live only in memory.
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+# How often (in seconds) changed sessions are written to the session store.
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "10"))
+
+# Session keys written to the store. "jobs" (ids into the in-process job store) is saved
+# as the links of the jobs, which identify them in every process.
+_SESSION_KEYS = (
+    "query",
+    "selected_site",
+    "window_page",
+    "window_pages",
+    "window_offset",
+    "page_sizes",
+    "profile",
+    "local",
+    "results_end",
+    "extra_chunks_ids",
+    "last_seen",
+)
+
+
+def dump_session(user_data: dict) -> str:
+    """Serialize the persistent part of a session to JSON."""
+    data = {key: user_data[key] for key in _SESSION_KEYS if key in user_data}
+    if "jobs" in user_data:
+        data["job_hrefs"] = [job_store.get(job_id).href for job_id in user_data["jobs"]]
+    elif "job_hrefs" in user_data:
+        # Loaded but not used yet: keep the links as they are.
+        data["job_hrefs"] = user_data["job_hrefs"]
+    return json.dumps(data, separators=(",", ":"))
+
+
+def read_session_jobs(hrefs: list[str]) -> list:
+    """Read the jobs of the links saved in a session from the job index (blocking)."""
+    return job_index.get_jobs(hrefs) if job_index is not None and hrefs else []
+
+
+def restore_session_jobs(user_data: dict, jobs: list) -> None:
+    """
+    Turn the job links of a loaded session back into job ids, given the jobs read from
+    the job index (read_session_jobs). If some are missing there, the window is emptied
+    and its pages are loaded again on the next navigation.
+    Changes the shared job store, so it runs on the event loop like the handlers.
+    """
+    hrefs = user_data.pop("job_hrefs", None)
+    if hrefs is None:
+        return
+    if len(jobs) == len(hrefs):
+        set_session_jobs(user_data, jobs)
+        # The first page was still being streamed when the session was saved.
+        if jobs and not user_data.get("page_sizes"):
+            user_data["page_sizes"] = [len(jobs)]
+        return
+
+    set_session_jobs(user_data, [])
+    page_sizes = user_data.get("page_sizes", [])
+    window_page = user_data.get("window_page", 1)
+    user_data["window_pages"] = 0
+    user_data["window_offset"] = sum(page_sizes[: window_page - 1])
+
+
+class SqliteSessionStore:
+    """Sessions (user_data) stored as JSON rows in SQLite, shared by every bot worker."""
+
+    def __init__(self, path: str = SESSION_DB_PATH) -> None:
+        # The connection is shared by the worker threads, guarded by a lock.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets the worker processes read while one of them writes.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id INTEGER PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load_all(self, workers: int = 1, index: int = 0) -> dict[int, dict]:
+        """Return the sessions of the users handled by worker `index` of `workers`."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT user_id, data FROM sessions WHERE user_id % ? = ?",
+                (workers, index),
+            ).fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def load(self, user_id: int) -> dict | None:
+        """Return the session of one user, or None if it has none."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, user_id: int, data: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)",
+                (user_id, data, time.time()),
+            )
+            self._db.commit()
+
+    def delete(self, user_id: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            self._db.commit()
+
+
+class SessionPersistence(BasePersistence):
+    """
+    python-telegram-bot persistence keeping only user_data, in a SqliteSessionStore.
+
+    Changed sessions are written every SESSION_FLUSH_INTERVAL seconds and on shutdown.
+    With several workers, each one loads only the sessions of its own users
+    (user_id % workers == index), matching the user partitioning of the webhook router.
+    With lazy=True no session is loaded at startup: each one is read on the first update
+    of its user, so startup does not depend on the number of stored sessions.
+    Idle sessions evicted from memory (evict) keep their stored row and are read again on
+    the next update of their user, in both modes.
+    """
+
+    def __init__(
+        self, store: SqliteSessionStore, workers: int = 1, index: int = 0, lazy: bool = False
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=SESSION_FLUSH_INTERVAL,
+        )
+        self.store = store
+        self.workers = workers
+        self.index = index
+        self.lazy = lazy
+        # Users whose session was read from the store; the in-memory one wins after that.
+        # Evicted users are removed, so the set holds only the sessions kept in memory.
+        self._loaded: set[int] = set()
+
+    async def get_user_data(self) -> dict[int, dict]:
+        if self.lazy:
+            return {}
+        sessions = await asyncio.to_thread(self.store.load_all, self.workers, self.index)
+        self._loaded.update(sessions)
+        logger.info("Loaded %s sessions", len(sessions))
+        return sessions
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await asyncio.to_thread(self.store.save, user_id, dump_session(data))
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        # Called before every update of the user: load the session on its first update
+        # (lazy mode, or after an eviction), and restore the jobs of a loaded session.
+        if user_id not in self._loaded:
+            self._loaded.add(user_id)
+            session = await asyncio.to_thread(self.store.load, user_id)
+            if session and not user_data:
+                user_data.update(session)
+        if "job_hrefs" in user_data:
+            # Only the job index read runs in a thread, not the job store changes.
+            jobs = await asyncio.to_thread(read_session_jobs, user_data["job_hrefs"])
+            restore_session_jobs(user_data, jobs)
+
+    def evict(self, user_id: int) -> None:
+        """
+        Forget that the session of the user is in memory (see job_store.evict_idle_sessions).
+        Its stored row is read again on the next update of the user.
+        """
+        self._loaded.discard(user_id)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        # Sessions are dropped from memory only by the idle eviction (see evict): the stored
+        # row is kept. /exit clears the session instead, and the empty session is saved.
+        pass
+
+    async def flush(self) -> None:
+        # Every change is committed when it is written; nothing is buffered here.
+        pass
+
+    # Only user_data is persisted.
+    async def get_chat_data(self) -> dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Any:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+
+def create_persistence(
+    workers: int = 1, index: int = 0, lazy: bool = False
+) -> SessionPersistence | None:
+    """Create the session persistence, or return None when SESSION_DB_PATH is empty."""
+    if not SESSION_DB_PATH:
+        return None
+    return SessionPersistence(SqliteSessionStore(SESSION_DB_PATH), workers, index, lazy)
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Call:
+    """An in-flight call: the shared task and the number of callers awaiting it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls with the same key.
+
+    The first caller starts the work in a separate task; every caller that arrives
+    while it is running awaits the same task and receives the same result or exception.
+    Cancelling one caller never cancels the work for the others: the shared task is
+    cancelled only when the last waiting caller is cancelled.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, _Call] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Return True if a call with the given key is currently running."""
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _start(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> _Call:
+        # Register and start a new call for the key.
+        call = _Call(asyncio.create_task(func()))
+        self._calls[key] = call
+        call.task.add_done_callback(lambda task: self._forget(key, call))
+        return call
+
+    def start(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Start func() in the background unless a call with the same key is running.
+        Returns True if a new call was started. A call started this way runs to completion:
+        callers joining it with do() and then being cancelled never stop it.
+        """
+        if key in self._calls:
+            return False
+        # The background owner counts as a waiter that never leaves.
+        self._start(key, func).waiters += 1
+        return True
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func() once for all concurrent callers using the same key."""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._start(key, func)
+
+        call.waiters += 1
+        try:
+            # shield() keeps the shared task alive when only this caller is cancelled.
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            # Nobody is interested in the result anymore, stop the work.
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        # Remove the finished call so the next caller starts a fresh one.
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception as retrieved, otherwise asyncio logs it when every waiter was cancelled.
+        if not call.task.cancelled():
+            call.task.exception()
@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+from typing import Callable
+
+
+class LazyConnection:
+    """
+    SQLite connection of a store, opened on first use: creating a store when its module
+    is imported creates no file.
+
+    The connection is shared by the worker threads. `with connection as db:` holds its lock
+    while `db` is used. On first use the database is switched to WAL mode and set up with
+    the `schema` script, then with `migrate(db)` if given.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: str,
+        migrate: Callable[[sqlite3.Connection], None] | None = None,
+    ) -> None:
+        self.path = path
+        self._schema = schema
+        self._migrate = migrate
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(self._schema)
+        if self._migrate is not None:
+            self._migrate(db)
+        db.commit()
+        return db
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._lock.acquire()
+        try:
+            if self._db is None:
+                self._db = self._open()
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._db
+
+    def __exit__(self, *exc_info) -> None:
+        self._lock.release()
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The bot modules are imported by name, as when the bot runs from the tg_bot directory.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Set before the bot modules are imported: their SQLite stores go to a temporary directory
+# (never the working directory) and the job index is disabled.
+_DB_DIR = tempfile.mkdtemp(prefix="tg_bot_tests_")
+os.environ["ALERTS_DB_PATH"] = os.path.join(_DB_DIR, "alerts.db")
+os.environ["PROFILES_DB_PATH"] = os.path.join(_DB_DIR, "profiles.db")
+os.environ["JOB_INDEX_PATH"] = ""
@@ -0,0 +1,68 @@
+import pytest
+
+import alerts
+from alerts import AlertStore
+from job_store import Job
+
+
+def make_jobs(*numbers: int) -> list[Job]:
+    return [Job(0, 0, f"Job {n}", f"https://x/{n}", "", ()) for n in numbers]
+
+
+def titles(jobs: list[Job]) -> list[str]:
+    return [job.title for job in jobs]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AlertStore(str(tmp_path / "alerts.db"))
+    store.subscribe(1, "upwork", "python")
+    return store
+
+
+def test_first_run_only_records_the_listed_jobs(store):
+    assert store.new_jobs("upwork", "python", make_jobs(1, 2)) == []
+    assert store.new_jobs("upwork", "python", make_jobs(1, 2)) == []
+    assert titles(store.new_jobs("upwork", "python", make_jobs(3, 1, 2))) == ["Job 3"]
+
+
+def test_jobs_beyond_the_limit_are_returned_by_the_next_runs(store):
+    store.new_jobs("upwork", "python", make_jobs(1, 2))
+    listed = make_jobs(3, 4, 5, 6, 7, 1, 2)
+    assert titles(store.new_jobs("upwork", "python", listed, limit=2)) == ["Job 3", "Job 4"]
+    assert titles(store.new_jobs("upwork", "python", listed, limit=2)) == ["Job 5", "Job 6"]
+    assert titles(store.new_jobs("upwork", "python", listed, limit=2)) == ["Job 7"]
+    assert store.new_jobs("upwork", "python", listed, limit=2) == []
+
+
+def test_seen_sets_survive_a_restart(store, tmp_path):
+    store.new_jobs("upwork", "python", make_jobs(1))
+    store.new_jobs("upwork", "python", make_jobs(2, 1))
+    restarted = AlertStore(str(tmp_path / "alerts.db"))
+    assert titles(restarted.new_jobs("upwork", "python", make_jobs(3, 2, 1))) == ["Job 3"]
+
+
+def test_groups_have_their_own_seen_sets(store):
+    store.new_jobs("upwork", "python", make_jobs(1))
+    store.new_jobs("upwork", "django", make_jobs(2))
+    assert titles(store.new_jobs("upwork", "python", make_jobs(2, 1))) == ["Job 2"]
+
+
+def test_subscriptions_are_limited_per_chat(store, monkeypatch):
+    monkeypatch.setattr(alerts, "ALERTS_MAX_PER_CHAT", 2)
+    assert store.subscribe(1, "upwork", "Django")
+    assert not store.subscribe(1, "upwork", "rust")
+    assert store.list_for_chat(1) == [("upwork", "python"), ("upwork", "django")]
+
+
+def test_listed_jobs_are_not_forgotten_after_the_ttl(store, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(alerts.time, "time", lambda: now[0])
+    ttl = alerts.ALERTS_SEEN_TTL
+    store.new_jobs("upwork", "python", make_jobs(1, 2))
+    # Job 1 is still listed later on and its seen time is refreshed; job 2 is not.
+    now[0] = ttl - 1
+    store.new_jobs("upwork", "python", make_jobs(1))
+    now[0] = ttl + 10
+    store.prune_seen(interval=0)
+    assert titles(store.new_jobs("upwork", "python", make_jobs(1, 2))) == ["Job 2"]
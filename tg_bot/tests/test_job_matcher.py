@@ -0,0 +1,57 @@
+from job_matcher import KeywordMatcher, get_matcher, normalize_keyword, score_masks, tokenize
+from job_store import Job
+
+
+def found(matcher: KeywordMatcher, text: str) -> set[str]:
+    mask = matcher.scan(tokenize(text))
+    return {keyword for keyword, bit in matcher.bits.items() if mask & bit}
+
+
+def test_overlapping_keywords_are_all_found():
+    matcher = KeywordMatcher(
+        ["machine learning", "learning", "learning rate", "deep learning", "rate"]
+    )
+    # "learning" and "learning rate" are reached through failure links of "machine learning".
+    assert found(matcher, "Tune the machine learning rate") == {
+        "machine learning",
+        "learning",
+        "learning rate",
+        "rate",
+    }
+    # "deep learning" needs its words next to each other.
+    assert "deep learning" not in found(matcher, "deep machine learning")
+
+
+def test_keywords_sharing_a_prefix():
+    matcher = KeywordMatcher(["react", "react native", "react native expo"])
+    assert found(matcher, "React Native app") == {"react", "react native"}
+    assert found(matcher, "react native expo") == {"react", "react native", "react native expo"}
+    # A failed longer match falls back to the shorter keyword it started with.
+    assert found(matcher, "react native web") == {"react", "react native"}
+
+
+def test_whole_words_only():
+    matcher = KeywordMatcher(["go", "c++", "node.js"])
+    assert found(matcher, "A good cook") == set()
+    assert found(matcher, "Go, C++ and Node.js.") == {"go", "c++", "node.js"}
+    assert found(matcher, "c") == set()
+
+
+def test_normalize_keyword():
+    assert normalize_keyword(" Node.JS ") == "node.js"
+    assert normalize_keyword("Machine   Learning") == "machine learning"
+
+
+def test_scores_and_exclusion():
+    matcher = get_matcher(frozenset({"python", "django", "wordpress"}))
+    jobs = [
+        Job(0, 0, "Django developer", "https://x/1", "Python backend", ("Python",)),
+        Job(0, 0, "Site fixes", "https://x/2", "WordPress plugin, some python", ()),
+    ]
+    scores = score_masks(
+        matcher.job_masks(jobs),
+        matcher.mask(("python", "django")),
+        matcher.mask(("wordpress",)),
+    )
+    # python: skills (3) + description (1); django: title (2).
+    assert scores == [6, None]
@@ -0,0 +1,67 @@
+from job_store import Job, JobStore, clear_session, set_session_jobs
+import job_store as job_store_module
+
+
+def make_job(href: str, title: str = "Python developer") -> Job:
+    return Job(0, 1700000000000, title, href, "Description", ("Python",))
+
+
+def test_acquire_deduplicates_by_link():
+    store = JobStore()
+    first = store.acquire([make_job("https://x/1")])
+    # Another scrape returns a new record of the same job.
+    second = store.acquire([make_job("https://x/1"), make_job("https://x/2")])
+    assert second[0] == first[0]
+    assert len(store) == 2
+    assert store.get(first[0]).refs == 2
+
+
+def test_acquire_reuses_a_stored_record():
+    store = JobStore()
+    job = make_job("https://x/1")
+    ids = store.acquire([job])
+    # A cached page hands back the stored record itself.
+    assert store.acquire([job]) == ids
+    assert job.refs == 2
+
+
+def test_release_drops_unreferenced_jobs():
+    store = JobStore()
+    ids = store.acquire([make_job("https://x/1"), make_job("https://x/2")])
+    store.retain(ids[:1])
+    store.release(ids)
+    assert len(store) == 1
+    assert store.get(ids[0]).refs == 1
+    store.release(ids[:1])
+    assert len(store) == 0
+    # Releasing unknown ids is a no-op.
+    store.release(ids)
+    assert len(store) == 0
+
+
+def test_ids_are_not_reused():
+    store = JobStore()
+    old = store.acquire([make_job("https://x/1")])
+    store.release(old)
+    new = store.acquire([make_job("https://x/1")])
+    assert new[0] != old[0]
+
+
+def test_jobs_without_link_are_not_deduplicated():
+    store = JobStore()
+    ids = store.acquire([make_job("No Link", "First"), make_job("No Link", "Second")])
+    assert ids[0] != ids[1]
+    assert [store.get(job_id).title for job_id in ids] == ["First", "Second"]
+
+
+def test_session_jobs_release_the_previous_ones(monkeypatch):
+    store = JobStore()
+    monkeypatch.setattr(job_store_module, "job_store", store)
+    user_data = {}
+    set_session_jobs(user_data, [make_job("https://x/1"), make_job("https://x/2")])
+    set_session_jobs(user_data, [make_job("https://x/2"), make_job("https://x/3")])
+    assert len(store) == 2
+    assert all(store.get(job_id).refs == 1 for job_id in user_data["jobs"])
+    clear_session(user_data)
+    assert len(store) == 0
+    assert user_data == {}
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+import result_window
+from job_matcher import Profile
+from job_store import Job, JobStore
+from result_window import (
+    FilteredOutError,
+    PageRefs,
+    finish_first_page,
+    has_next,
+    job_id_at,
+    move_window,
+    start_window,
+)
+
+PAGE_SIZE = 3
+SITE, QUERY = "upwork", "python"
+
+
+class FakeSite:
+    """Pages of PAGE_SIZE jobs ("Job <page>.<n>"), then empty pages; counts the fetches."""
+
+    def __init__(self, pages: int, title: str = "Job", links: bool = True) -> None:
+        self.pages = pages
+        self.title = title
+        # Jobs without a link are not deduplicated by the job store.
+        self.links = links
+        self.fetched: list[int] = []
+
+    async def fetch_jobs(self, site: str, query: str, page: int = 1) -> dict:
+        self.fetched.append(page)
+        # Let concurrent loads of the page interleave.
+        await asyncio.sleep(0)
+        if page > self.pages:
+            return {"data": []}
+        # New records on every fetch, as the scrapers return them.
+        return {
+            "data": [
+                Job(
+                    0,
+                    0,
+                    f"{self.title} {page}.{n}",
+                    f"https://x/{page}/{n}" if self.links else "No Link",
+                    "",
+                    (),
+                )
+                for n in range(PAGE_SIZE)
+            ]
+        }
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = JobStore()
+    monkeypatch.setattr(result_window, "job_store", store)
+    monkeypatch.setattr(result_window, "page_refs", PageRefs(max_pages=100))
+    monkeypatch.setattr(result_window, "SESSION_WINDOW_PAGES", 2)
+    return store
+
+
+def open_session(store: JobStore, site: FakeSite, profile: Profile = Profile()) -> dict:
+    # The first page, as message_query_handler streams it into the session.
+    user_data = {}
+    first = asyncio.run(site.fetch_jobs(SITE, QUERY, 1))["data"]
+    user_data["jobs"] = store.acquire(first)
+    start_window(user_data, profile)
+    finish_first_page(user_data, SITE, QUERY)
+    return user_data
+
+
+def title_at(store: JobStore, user_data: dict, position: int) -> str:
+    return store.get(job_id_at(user_data, position)).title
+
+
+def move(user_data: dict, position: int) -> bool:
+    return asyncio.run(move_window(user_data, SITE, QUERY, position))
+
+
+def test_moving_forward_slides_the_window(store, monkeypatch):
+    site = FakeSite(pages=4)
+    monkeypatch.setattr(result_window, "fetch_jobs", site.fetch_jobs)
+    user_data = open_session(store, site)
+
+    # Position 3 is the first job of page 2.
+    assert move(user_data, 3)
+    assert title_at(store, user_data, 3) == "Job 2.0"
+    assert (user_data["window_page"], user_data["window_pages"]) == (1, 2)
+
+    # Page 3 pushes page 1 out of the window.
+    assert move(user_data, 8)
+    assert title_at(store, user_data, 8) == "Job 3.2"
+    assert user_data["window_page"] == 2
+    assert user_data["window_offset"] == 3
+    assert job_id_at(user_data, 2) is None
+    assert user_data["page_sizes"] == [3, 3, 3]
+
+
+def test_moving_back_reloads_from_the_page_cache(store, monkeypatch):
+    site = FakeSite(pages=4)
+    monkeypatch.setattr(result_window, "fetch_jobs", site.fetch_jobs)
+    user_data = open_session(store, site)
+    assert move(user_data, 9)
+    assert user_data["window_page"] == 3
+
+    assert move(user_data, 0)
+    assert title_at(store, user_data, 0) == "Job 1.0"
+    assert (user_data["window_page"], user_data["window_pages"]) == (1, 2)
+    assert user_data["window_offset"] == 0
+    # Every page was scraped once (page 1 by the test itself).
+    assert site.fetched == [1, 2, 3, 4]
+
+
+def test_end_of_results(store, monkeypatch):
+    site = FakeSite(pages=2)
+    monkeypatch.setattr(result_window, "fetch_jobs", site.fetch_jobs)
+    user_data = open_session(store, site)
+    assert move(user_data, 5)
+    assert has_next(user_data, 5)
+    # Page 3 is empty: there is no job at position 6 and position 5 is the last one.
+    assert not move(user_data, 6)
+    assert user_data["results_end"]
+    assert not has_next(user_data, 5)
+    # The empty page is not fetched again.
+    assert not move(user_data, 6)
+    assert site.fetched.count(3) == 1
+
+
+def test_references_follow_the_window(store, monkeypatch):
+    site = FakeSite(pages=4)
+    monkeypatch.setattr(result_window, "fetch_jobs", site.fetch_jobs)
+    page_refs = result_window.page_refs
+    user_data = open_session(store, site)
+    assert move(user_data, 11)
+
+    # Every job is held by the page cache, and once more if it is in the session window.
+    in_window = set(user_data["jobs"])
+    assert len(store) == 4 * PAGE_SIZE
+    for page in range(1, 5):
+        for job_id in page_refs.get(result_window.make_cache_key(SITE, QUERY, page)):
+            assert store.get(job_id).refs == (2 if job_id in in_window else 1)
+
+
+def test_concurrent_loads_of_a_page_keep_the_cached_ids(store, monkeypatch):
+    # Without links, the two loads get different ids for the same jobs.
+    site = FakeSite(pages=2, links=False)
+    monkeypatch.setattr(result_window, "fetch_jobs", site.fetch_jobs)
+    first = open_session(store, site)
+    second = open_session(store, site)
+
+    async def both():
+        await asyncio.gather(
+            move_window(first, SITE, QUERY, 3), move_window(second, SITE, QUERY, 3)
+        )
+
+    asyncio.run(both())
+    assert job_id_at(first, 3) == job_id_at(second, 3)
+    assert title_at(store, second, 3) == "Job 2.0"
+    # Page cache + two sessions.
+    assert store.get(job_id_at(first, 3)).refs == 3
+
+
+def test_excluded_pages_stop_after_filtered_pages_max(store, monkeypatch):
+    monkeypatch.setattr(result_window, "FILTERED_PAGES_MAX", 3)
+    site = FakeSite(pages=100, title="Python job")
+    monkeypatch.setattr(result_window, "fetch_jobs", site.fetch_jobs)
+    # The profile hides every job.
+    user_data = open_session(store, site, Profile(excluded=("python",)))
+    user_data["jobs"] = store.acquire([])
+    finish_first_page(user_data, SITE, QUERY)
+    assert not user_data["results_end"]
+
+    with pytest.raises(FilteredOutError) as error:
+        move(user_data, 0)
+    assert error.value.pages == 3
+    assert site.fetched == [1, 2, 3, 4]
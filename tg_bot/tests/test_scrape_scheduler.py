@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+import scrape_scheduler
+from scrape_scheduler import CircuitOpenError, ScrapeScheduler, _Source
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(scrape_scheduler, "CIRCUIT_FAILURES", 3)
+    monkeypatch.setattr(scrape_scheduler, "CIRCUIT_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(scrape_scheduler, "SCRAPE_LATENCY_MIN_SAMPLES", 5)
+    monkeypatch.setattr(scrape_scheduler, "SCRAPE_HEDGE", False)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    source = _Source("upwork")
+    for now in (0, 1, 2):
+        source.acquire(now)
+        source.failed(now)
+    assert source.is_open(3)
+    with pytest.raises(CircuitOpenError) as error:
+        source.acquire(3)
+    assert error.value.retry_in == pytest.approx(29)
+
+
+def test_success_resets_the_failure_count():
+    source = _Source("upwork")
+    source.failed(0)
+    source.failed(1)
+    source.succeeded(0.5)
+    source.failed(2)
+    assert not source.is_open(2)
+
+
+def test_one_trial_after_the_open_period():
+    source = _Source("upwork")
+    for now in (0, 1, 2):
+        source.failed(now)
+    # Past the open period one trial goes through, the other scrapes are still rejected.
+    source.acquire(40)
+    with pytest.raises(CircuitOpenError):
+        source.acquire(40)
+    # A failed trial opens the circuit for a new period.
+    source.failed(41)
+    with pytest.raises(CircuitOpenError):
+        source.acquire(60)
+    source.acquire(80)
+    source.succeeded(1.0)
+    assert not source.is_open(80)
+    source.acquire(80)
+
+
+def test_cancelled_trial_lets_the_next_one_through():
+    source = _Source("upwork")
+    for now in (0, 1, 2):
+        source.failed(now)
+    source.acquire(40)
+    source.release()
+    source.acquire(40)
+
+
+def test_timeout_follows_the_p99_within_bounds():
+    source = _Source("upwork")
+    assert source.timeout() == scrape_scheduler.SCRAPE_TIMEOUT
+    for _ in range(10):
+        source.add_latency(1.0)
+    assert source.timeout() == scrape_scheduler.SCRAPE_TIMEOUT_MIN
+    for _ in range(10):
+        source.add_latency(10.0)
+    assert source.timeout() == 10.0 * scrape_scheduler.SCRAPE_TIMEOUT_FACTOR
+    for _ in range(10):
+        source.add_latency(100.0)
+    assert source.timeout() == scrape_scheduler.SCRAPE_TIMEOUT_MAX
+
+
+def test_guard_times_out_without_recording_a_latency(monkeypatch):
+    monkeypatch.setattr(scrape_scheduler, "SCRAPE_TIMEOUT", 0.05)
+    scheduler = ScrapeScheduler()
+
+    async def scrape():
+        await asyncio.sleep(1)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(scheduler.run("upwork", scrape))
+    source = scheduler.source("upwork")
+    assert scheduler.timeouts == 1
+    assert source.failures == 1
+    # A timeout is not a latency sample: it would raise the next timeouts.
+    assert len(source.latencies) == 0
+
+
+def test_guard_rejects_while_open_and_counts_it():
+    scheduler = ScrapeScheduler()
+
+    async def failing():
+        raise ConnectionError("down")
+
+    async def run_all():
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                await scheduler.run("upwork", failing)
+        with pytest.raises(CircuitOpenError):
+            await scheduler.run("upwork", failing)
+
+    asyncio.run(run_all())
+    assert scheduler.is_open("upwork")
+    assert scheduler.rejected == 1
+    assert scheduler.stats()["upwork"]["failures"] == 3
+
+
+def test_guard_records_the_latency_of_successes():
+    scheduler = ScrapeScheduler()
+
+    async def scrape():
+        return "jobs"
+
+    assert asyncio.run(scheduler.run("upwork", scrape)) == "jobs"
+    assert len(scheduler.source("upwork").latencies) == 1
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import pytest
+
+import job_store
+from session_store import SessionPersistence, SqliteSessionStore
+
+
+class FakeApplication:
+    """The parts of telegram.ext.Application used by evict_idle_sessions."""
+
+    def __init__(self, persistence: SessionPersistence) -> None:
+        self.persistence = persistence
+        self.user_data: dict[int, dict] = {}
+        self.dropped: list[int] = []
+
+    def drop_user_data(self, user_id: int) -> None:
+        self.user_data.pop(user_id, None)
+        self.dropped.append(user_id)
+
+
+class FakeContext:
+    def __init__(self, application: FakeApplication) -> None:
+        self.application = application
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    store.save(1, json.dumps({"query": "python", "selected_site": "upwork", "last_seen": 0}))
+    return store
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_evicted_sessions_are_read_again(store, lazy):
+    persistence = SessionPersistence(store, lazy=lazy)
+    application = FakeApplication(persistence)
+    application.user_data.update(asyncio.run(persistence.get_user_data()))
+    user_data = application.user_data.setdefault(1, {})
+    asyncio.run(persistence.refresh_user_data(1, user_data))
+    assert user_data["query"] == "python"
+
+    asyncio.run(job_store.evict_idle_sessions(FakeContext(application)))
+    assert application.dropped == [1]
+    assert 1 not in persistence._loaded
+    # The application drops the stored data on its next flush: the row is kept.
+    asyncio.run(persistence.drop_user_data(1))
+    assert store.load(1)["query"] == "python"
+
+    # The next update of the user reads the session from the store again.
+    user_data = {}
+    asyncio.run(persistence.refresh_user_data(1, user_data))
+    assert user_data["query"] == "python"
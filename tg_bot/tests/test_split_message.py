@@ -0,0 +1,62 @@
+import re
+
+from jobs_requests import split_message
+
+_TAG_RE = re.compile(r"<(/?)([a-z]+)[^>]*>")
+
+
+def assert_balanced(chunk: str) -> None:
+    open_tags = []
+    for closing, name in _TAG_RE.findall(chunk):
+        if closing:
+            assert open_tags and open_tags[-1] == name, chunk
+            open_tags.pop()
+        else:
+            open_tags.append(name)
+    assert not open_tags, chunk
+
+
+def text_of(html: str) -> str:
+    return _TAG_RE.sub("", html)
+
+
+def test_short_text_is_one_chunk():
+    assert split_message("<b>Hi</b>", 100) == ["<b>Hi</b>"]
+
+
+def test_tags_are_closed_and_reopened():
+    text = "<b>Title:</b> <i>" + "word " * 60 + "</i>\n<a href='https://x/1'>link</a>"
+    chunks = split_message(text, 80)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 80
+        assert_balanced(chunk)
+    # Every chunk after the first one of the italic run starts by re-opening it.
+    assert any(chunk.startswith("<i>") for chunk in chunks[1:])
+    assert "".join(text_of(chunk) for chunk in chunks) == text_of(text)
+
+
+def test_nested_tags_and_long_words():
+    text = "<b>" + "x" * 50 + "<i>" + "y" * 50 + "</i></b>"
+    chunks = split_message(text, 30)
+    for chunk in chunks:
+        assert len(chunk) <= 30
+        assert_balanced(chunk)
+    assert "".join(text_of(chunk) for chunk in chunks) == text_of(text)
+
+
+def test_entities_are_not_cut():
+    text = "<b>" + "a &amp; b &lt; c " * 20 + "</b>"
+    chunks = split_message(text, 25)
+    for chunk in chunks:
+        assert len(chunk) <= 25
+        assert_balanced(chunk)
+        # Every "&" starts a whole entity.
+        assert re.fullmatch(r"([^&]|&amp;|&lt;)*", text_of(chunk)), chunk
+    assert "".join(text_of(chunk) for chunk in chunks) == text_of(text)
+
+
+def test_text_is_cut_at_newlines_or_spaces():
+    text = "first line here\n" + "second line that is long"
+    chunks = split_message(text, 20)
+    assert chunks[0] == "first line here\n"
@@ -0,0 +1,40 @@
+from sqlite_db import LazyConnection
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT NOT NULL);"
+
+
+def test_the_database_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "items.db"
+    connection = LazyConnection(str(path), SCHEMA)
+    assert not path.exists()
+    with connection as db:
+        db.execute("INSERT INTO items (name) VALUES ('a')")
+        db.commit()
+    assert path.exists()
+    with connection as db:
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert db.execute("SELECT name FROM items").fetchall() == [("a",)]
+
+
+def test_migrate_runs_once_after_the_schema(tmp_path):
+    calls = []
+
+    def migrate(db):
+        calls.append(db.execute("SELECT COUNT(*) FROM items").fetchone()[0])
+
+    connection = LazyConnection(str(tmp_path / "items.db"), SCHEMA, migrate)
+    for _ in range(3):
+        with connection:
+            pass
+    assert calls == [0]
+
+
+def test_the_lock_is_released_when_opening_fails(tmp_path):
+    connection = LazyConnection(str(tmp_path / "items.db"), "NOT SQL")
+    for _ in range(2):
+        try:
+            with connection:
+                pass
+        except Exception:
+            pass
+    assert not connection._lock.locked()
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable
+
+from telegram import Update  # type: ignore
+from telegram.ext import BaseUpdateProcessor  # type: ignore
+
+# MY MODULES
+from metrics import observe, span  # Timing of the pipeline stages
+
+# Number of updates handled at the same time (handlers mostly wait for scrapes and Telegram).
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+# Maximum number of updates accepted but not handled yet; beyond that the webhook
+# worker answers 503 and Telegram delivers the update again later.
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1000"))
+
+
+class _ChatLock:
+    """Lock serializing the updates of one chat, and the number of updates using it."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Handle updates concurrently while keeping the order of the updates of each chat.
+
+    Updates of different chats run in parallel, at most UPDATE_CONCURRENCY at a time.
+    Updates of the same chat wait for each other (asyncio locks are FIFO), and do not take
+    a concurrency slot while waiting, so one busy chat cannot block the others.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = UPDATE_CONCURRENCY,
+        max_pending: int = UPDATE_MAX_PENDING,
+    ) -> None:
+        # The base class limit only bounds the updates waiting here; the real
+        # concurrency limit is taken after the chat lock.
+        super().__init__(max_concurrent_updates=max(max_pending, concurrency))
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(concurrency)
+        self._chats: dict[int, _ChatLock] = {}
+        # Updates inside do_process_update (waiting or running).
+        self.pending = 0
+
+    @staticmethod
+    def _chat_key(update: object) -> int | None:
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+            if update.effective_user is not None:
+                return update.effective_user.id
+        return None
+
+    async def _run(self, coroutine: Awaitable[Any], received: float) -> None:
+        # Time waiting for the chat and a slot, then time in the handlers.
+        async with self._slots:
+            observe("update_wait", time.perf_counter() - received)
+            with span("update"):
+                await coroutine
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        received = time.perf_counter()
+        self.pending += 1
+        key = self._chat_key(update)
+        try:
+            if key is None:
+                await self._run(coroutine, received)
+                return
+
+            chat = self._chats.get(key)
+            if chat is None:
+                chat = self._chats[key] = _ChatLock()
+            chat.users += 1
+            try:
+                async with chat.lock:
+                    await self._run(coroutine, received)
+            finally:
+                chat.users -= 1
+                if chat.users == 0:
+                    del self._chats[key]
+        finally:
+            self.pending -= 1
+
+    def is_saturated(self, queued: int = 0) -> bool:
+        """Return True if no more updates should be accepted (`queued`: updates not picked up yet)."""
+        return self.pending + queued >= self.max_pending
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
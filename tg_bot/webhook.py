@@ -0,0 +1,284 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from typing import TYPE_CHECKING, Callable
+
+import httpx
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication, RequestHandler
+
+# MY MODULES
+from logger import logger  # Custom logger module for logging information and errors
+from metrics import is_ready  # Whether this process finished starting
+
+# The router only imports telegram to register the webhook, once it listens; the workers
+# import it with the bot application.
+if TYPE_CHECKING:
+    from telegram.ext import Application  # type: ignore
+
+# Public HTTPS URL Telegram sends the updates to (e.g. https://bot.example.com/telegram).
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Address and port the webhook router listens on (usually behind a TLS reverse proxy).
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# URL path of the webhook on the router.
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Secret token Telegram sends with every update; other requests are rejected.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Number of bot worker processes; updates are partitioned across them by user id.
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 1)))
+# Worker i listens on 127.0.0.1:(WORKER_BASE_PORT + i).
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8600"))
+# Seconds the router waits for a worker to accept an update.
+WORKER_FORWARD_TIMEOUT = float(os.getenv("WORKER_FORWARD_TIMEOUT", "10"))
+# Maximum number of concurrent connections Telegram opens to deliver updates.
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# How often (in seconds) the router checks that its workers are alive.
+_WORKER_CHECK_INTERVAL = 5
+
+
+def update_user_id(update: dict) -> int:
+    """
+    Return the id of the sender of a raw update, used to pick its worker.
+    Sessions (user_data) are kept per user and partitioned the same way (see session_store.py),
+    so a user's updates are handled where the session lives, whatever the chat.
+    Updates without a sender fall back to their chat id (the same in private chats).
+    """
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get("from")
+        if sender:
+            return sender["id"]
+        chat = value.get("chat") or value.get("message", {}).get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+def _wait_for_stop_signal() -> asyncio.Event:
+    # Event set on SIGINT / SIGTERM.
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+class _LiveHandler(RequestHandler):
+    """Liveness probe: the process answers."""
+
+    def get(self) -> None:
+        self.write("ok\n")
+
+
+class _WorkerReadyHandler(RequestHandler):
+    """Readiness probe of a worker: its bot application finished starting."""
+
+    def get(self) -> None:
+        if not is_ready():
+            self.set_status(503)
+            self.write("starting\n")
+            return
+        self.write("ready\n")
+
+
+# --- Router -----------------------------------------------------------------------------
+
+
+class _RouterHandler(RequestHandler):
+    """Receives the updates from Telegram and forwards each one to the worker owning its user."""
+
+    def initialize(self, client: httpx.AsyncClient, workers: int) -> None:
+        self.client = client
+        self.workers = workers
+
+    async def post(self) -> None:
+        if WEBHOOK_SECRET and (
+            self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET
+        ):
+            self.set_status(403)
+            return
+        try:
+            update = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+
+        worker = update_user_id(update) % self.workers
+        try:
+            response = await self.client.post(
+                f"http://127.0.0.1:{WORKER_BASE_PORT + worker}/",
+                content=self.request.body,
+                headers={"Content-Type": "application/json"},
+            )
+            self.set_status(response.status_code)
+        except httpx.HTTPError as e:
+            # Telegram delivers the update again later.
+            logger.error("Forwarding update to worker %s failed: %s", worker, e)
+            self.set_status(503)
+
+
+class _RouterReadyHandler(RequestHandler):
+    """Readiness probe of the router: every worker is ready."""
+
+    def initialize(self, client: httpx.AsyncClient, workers: int) -> None:
+        self.client = client
+        self.workers = workers
+
+    async def get(self) -> None:
+        async def worker_ready(worker: int) -> bool:
+            try:
+                response = await self.client.get(
+                    f"http://127.0.0.1:{WORKER_BASE_PORT + worker}/ready", timeout=2
+                )
+            except httpx.HTTPError:
+                return False
+            return response.status_code == 200
+
+        ready = await asyncio.gather(*(worker_ready(i) for i in range(self.workers)))
+        if not all(ready):
+            self.set_status(503)
+            self.write(f"{sum(ready)}/{self.workers} workers ready\n")
+            return
+        self.write("ready\n")
+
+
+def _start_worker(target: Callable[[int, int], None], index: int, workers: int):
+    process = multiprocessing.get_context("spawn").Process(
+        target=target, args=(index, workers), name=f"bot-worker-{index}", daemon=True
+    )
+    process.start()
+    return process
+
+
+async def _serve_router(
+    token: str,
+    worker_target: Callable[[int, int], None],
+    allowed_updates: list[str],
+    workers: int,
+) -> None:
+    processes = [_start_worker(worker_target, i, workers) for i in range(workers)]
+    stop = _wait_for_stop_signal()
+
+    async with httpx.AsyncClient(
+        timeout=WORKER_FORWARD_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=workers * 10),
+    ) as client:
+        handler_args = {"client": client, "workers": workers}
+        server = HTTPServer(
+            WebApplication(
+                [
+                    (f"/{WEBHOOK_PATH}", _RouterHandler, handler_args),
+                    (r"/live", _LiveHandler),
+                    (r"/ready", _RouterReadyHandler, handler_args),
+                ]
+            )
+        )
+        server.listen(WEBHOOK_PORT, WEBHOOK_LISTEN)
+
+        from telegram import Bot  # type: ignore
+
+        async with Bot(token) as bot:
+            await bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=allowed_updates,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+        logger.info("Webhook router listening on port %s with %s workers", WEBHOOK_PORT, workers)
+
+        # Restart workers that died; their chats get 503 (and are retried) meanwhile.
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=_WORKER_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            for i, process in enumerate(processes):
+                if not process.is_alive() and not stop.is_set():
+                    logger.error("Worker %s exited with code %s, restarting", i, process.exitcode)
+                    processes[i] = _start_worker(worker_target, i, workers)
+
+        server.stop()
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def run_webhook_router(
+    token: str,
+    worker_target: Callable[[int, int], None],
+    allowed_updates: list[str],
+    workers: int = BOT_WORKERS,
+) -> None:
+    """
+    Run the webhook mode: start `workers` bot processes (worker_target(index, workers),
+    a picklable module-level function) and route every update to the worker owning its chat.
+    Telegram sends only the `allowed_updates` types.
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL must be set in webhook mode")
+    asyncio.run(_serve_router(token, worker_target, allowed_updates, workers))
+
+
+# --- Worker -----------------------------------------------------------------------------
+
+
+class _WorkerHandler(RequestHandler):
+    """Receives the updates forwarded by the router and queues them in the bot application."""
+
+    def initialize(self, bot_app: "Application") -> None:
+        self.bot_app = bot_app
+
+    async def post(self) -> None:
+        # Backpressure: when too many updates wait (e.g. scrapes are slow), refuse new ones;
+        # Telegram delivers them again later instead of piling them up in memory.
+        # Only the ChatOrderedUpdateProcessor of update_processor.py tells when it is saturated.
+        processor = self.bot_app.update_processor
+        if hasattr(processor, "is_saturated") and processor.is_saturated(
+            self.bot_app.update_queue.qsize()
+        ):
+            self.set_status(503)
+            return
+        from telegram import Update  # type: ignore  # Already loaded by the bot application
+
+        update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        await self.bot_app.update_queue.put(update)
+
+
+async def _serve_worker(application: "Application", index: int) -> None:
+    stop = _wait_for_stop_signal()
+    # The worker accepts updates at once; they wait in the update queue until the
+    # application is started.
+    server = HTTPServer(
+        WebApplication(
+            [
+                (r"/", _WorkerHandler, {"bot_app": application}),
+                (r"/live", _LiveHandler),
+                (r"/ready", _WorkerReadyHandler),
+            ]
+        )
+    )
+    server.listen(WORKER_BASE_PORT + index, "127.0.0.1")
+
+    # Without an updater, the application is run by hand, including its hooks.
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        logger.info("Bot worker %s ready on port %s", index, WORKER_BASE_PORT + index)
+        await stop.wait()
+        server.stop()
+        await application.stop()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+def run_webhook_worker(application: "Application", index: int) -> None:
+    """Run one bot worker process (an application built without updater) until stopped."""
+    asyncio.run(_serve_worker(application, index))